@@ -0,0 +1,59 @@
+import random
+import sys
+import time
+import numpy as np
+from src.bottling import plan_bottles
+
+# Bottling benchmark: plan_bottles against the planner it replaced (shuffle
+# the recipes, greedily take up to 5 bottles of each) on 300 random recipes,
+# comparing ml used and time. Needs no database.
+#
+#   python -m bench.bottling
+#   python -m bench.bottling 20
+
+
+def shuffled_greedy(recipes, available_ml, max_potions, seed):
+    rng = random.Random(seed)
+    order = list(range(len(recipes)))
+    rng.shuffle(order)
+    remaining = list(available_ml)
+    counts = [0] * len(recipes)
+    total = 0
+    for i in order:
+        recipe = recipes[i]
+        n = min([remaining[c] // recipe[c] for c in range(4) if recipe[c] > 0] + [5, max_potions - total])
+        if n > 0:
+            counts[i] = n
+            total += n
+            remaining = [remaining[c] - recipe[c] * n for c in range(4)]
+        if total >= max_potions:
+            break
+    return counts
+
+
+def main(argv):
+    trials = int(argv[0]) if argv else 5
+    rng = np.random.default_rng(0)
+    recipes = []
+    while len(recipes) < 300:
+        cut = np.sort(rng.integers(0, 101, size=3))
+        recipes.append(np.diff(np.concatenate([[0], cut, [100]])))
+    recipes = np.array(recipes)
+    prices = rng.integers(30, 80, size=len(recipes))
+
+    for trial in range(trials):
+        available = rng.integers(0, 2000, size=4)
+        start = time.perf_counter()
+        counts = plan_bottles(recipes, prices, available, 40, objective="fill")
+        planned = time.perf_counter() - start
+        start = time.perf_counter()
+        baseline = shuffled_greedy(recipes.tolist(), available.tolist(), 40, trial)
+        greedy = time.perf_counter() - start
+        used = int((counts[:, None] * recipes).sum())
+        used_baseline = int((np.array(baseline)[:, None] * recipes).sum())
+        print(f"available {available.sum():5d}ml: planner {used:5d}ml in {planned * 1000:.1f}ms, "
+              f"greedy {used_baseline:5d}ml in {greedy * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+import statistics
+import sys
+import time
+import sqlalchemy
+from src import database as db
+from src.api import carts
+
+# Checkout benchmark: the per-line-item loop checkout used to run against the
+# set-based statement in src/api/carts.py, on carts of several sizes. Counts
+# the statements (round trips) each sends and times them; every checkout is
+# rolled back. Needs a database with the migrations applied.
+#
+#   python -m bench.checkout
+#   python -m bench.checkout 1,10,50 --repeat 200
+
+
+def loop_checkout(connection, cart_id, cart_checkout):
+    """The checkout before the set-based one, with the kind column it now needs."""
+    total_potions_bought = 0
+    total_gold_paid = 0
+    transaction_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_transactions (kind, order_id) VALUES ('sale', :cart_id) RETURNING id"
+    ), {"cart_id": cart_id}).scalar()
+    connection.execute(sqlalchemy.text(
+        "UPDATE carts SET payment = :payment, inventory_transaction_id = :transaction_id "
+        "WHERE id = :cart_id AND season_id = current_season()"
+    ), {"payment": cart_checkout.payment, "transaction_id": transaction_id, "cart_id": cart_id})
+    cart_items = connection.execute(sqlalchemy.text(
+        "SELECT potion_id, quantity FROM cart_items WHERE cart_id = :cart_id AND season_id = current_season()"
+    ), {"cart_id": cart_id}).fetchall()
+    for potion_id, quantity in cart_items:
+        potion = connection.execute(sqlalchemy.text("SELECT price, sku FROM potions WHERE id = :potion_id"),
+                                    {"potion_id": potion_id}).first()
+        total_gold_paid += quantity * potion.price
+        total_potions_bought += quantity
+        potions_transaction_id = connection.execute(sqlalchemy.text(
+            "INSERT INTO potions_transactions (kind, order_id) VALUES ('sale', :cart_id) RETURNING id"
+        ), {"cart_id": cart_id}).scalar()
+        connection.execute(sqlalchemy.text(
+            "INSERT INTO potions_entries (potion_sku, change, transaction_id) VALUES (:sku, :change, :transaction_id)"
+        ), {"sku": potion.sku, "change": -quantity, "transaction_id": potions_transaction_id})
+    connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_entries (change_gold, transaction_id) VALUES (:gold, :transaction_id)"
+    ), {"gold": total_gold_paid, "transaction_id": transaction_id})
+    return total_potions_bought, total_gold_paid
+
+
+def fill_cart(connection, items):
+    """A new cart with items line items."""
+    cart_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO carts (customer_name, character_class) VALUES ('bench', 'Bard') RETURNING id"
+    )).scalar()
+    # Recipes are unique, so each extra potion gets its own.
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potions (sku, price, red, green)
+        SELECT 'BENCH_' || i, 50, i, 100 - i FROM generate_series(1, :items) AS i
+        ON CONFLICT DO NOTHING
+    """), {"items": items})
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO cart_items (cart_id, potion_id, quantity)
+        SELECT :cart_id, id, 2 FROM potions ORDER BY id LIMIT :items
+    """), {"cart_id": cart_id, "items": items})
+    return cart_id
+
+
+def main(argv):
+    sizes = [int(size) for size in (argv[0] if argv and not argv[0].startswith("-") else "1,5,20").split(",")]
+    repeat = int(argv[argv.index("--repeat") + 1]) if "--repeat" in argv else 100
+    statements = []
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(1))
+    payment = carts.CartCheckout(payment="gold")
+
+    print(f"{'items':>6} {'loop stmts':>11} {'set stmts':>10} {'loop p50 ms':>12} {'set p50 ms':>11} "
+          f"{'loop p99 ms':>12} {'set p99 ms':>11}")
+    for size in sizes:
+        results = {}
+        for name, checkout in (("loop", loop_checkout), ("set", carts.check_out_cart)):
+            timings = []
+            for _ in range(repeat):
+                with db.engine.connect() as connection:
+                    transaction = connection.begin()
+                    cart_id = fill_cart(connection, size)
+                    statements.clear()
+                    start = time.perf_counter()
+                    checkout(connection, cart_id, payment)
+                    timings.append(time.perf_counter() - start)
+                    count = len(statements)
+                    transaction.rollback()
+            timings.sort()
+            results[name] = (count, statistics.median(timings) * 1000, timings[int(len(timings) * 0.99) - 1] * 1000)
+        loop, bulk = results["loop"], results["set"]
+        print(f"{size:>6} {loop[0]:>11} {bulk[0]:>10} {loop[1]:>12.2f} {bulk[1]:>11.2f} {loop[2]:>12.2f} {bulk[2]:>11.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,48 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Sync vs async database mode: runs bench.loadtest --serve once per
+# DATABASE_MODE with the same uvicorn workers, concurrency and traffic, and
+# prints the throughput and checkout latency of each. Other arguments are
+# passed on to the load test (e.g. --server, --spike).
+#
+#   python -m bench.database_modes --workers 1 --concurrency 4 16
+#   python -m bench.database_modes --workers 2 --concurrency 16 --spike 40 --server postgresql://...
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = ["sync", "async"]
+
+
+def run(mode, workers, concurrency, days, extra):
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        subprocess.run([sys.executable, "-m", "bench.loadtest", "--serve", "--workers", str(workers),
+                        "--concurrency", str(concurrency), "--days", str(days), "--output", output.name, *extra],
+                       cwd=ROOT, env={**os.environ, "DATABASE_MODE": mode}, stderr=subprocess.DEVNULL, check=True)
+        return json.loads(Path(output.name).read_text())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.database_modes")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes, the same for both modes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--days", type=int, default=2)
+    args, extra = parser.parse_known_args(argv)
+
+    checkout = "POST /carts/{cart_id}/checkout"
+    print(f"{args.days} days, {args.workers} worker(s)")
+    print(f"{'concurrency':>11} {'mode':>6} {'req/s':>8} {'checkout p50':>13} {'checkout p99':>13} {'shed':>5} {'errors':>7}")
+    for concurrency in args.concurrency:
+        for mode in MODES:
+            results = run(mode, args.workers, concurrency, args.days, extra)
+            total, checkouts = results["total"], results["endpoints"][checkout]
+            print(f"{concurrency:>11} {mode:>6} {total['throughput_rps']:>8} {checkouts['p50_ms']:>10} ms "
+                  f"{checkouts['p99_ms']:>10} ms {total['shed']:>5} {total['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
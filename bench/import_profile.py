@@ -0,0 +1,82 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+# Import-time profile of the app, which on a serverless deployment is part
+# of every cold start. Imports src.api.server in fresh interpreters under
+# python -X importtime and reports the total and where it goes. Exits 1 if
+# the median total is over budget, or if a module that is meant to load on
+# first use (LAZY_MODULES) was imported at startup.
+#
+#   python -m bench.import_profile
+#   python -m bench.import_profile --runs 10 --budget-ms 250 --top 20
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGET = "src.api.server"
+BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", "220"))
+# numpy through src.lazy, the drivers through src.database's lazy engines.
+LAZY_MODULES = ("numpy", "psycopg2", "asyncpg")
+
+
+def profile_once():
+    """{module: (self us, cumulative us)} for one import of TARGET."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def package_of(name):
+    # The app's own modules one by one, everything else by top-level package.
+    return name if name.startswith("src.") else name.split(".")[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.import_profile", description="Profile the app's import time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="packages and modules to list by self time")
+    args = parser.parse_args(argv)
+
+    runs = [profile_once() for _ in range(args.runs)]
+    totals = [run[TARGET][1] / 1000 for run in runs]
+    total = statistics.median(totals)
+
+    by_package = defaultdict(list)
+    for run in runs:
+        packages = defaultdict(int)
+        for name, (self_us, _) in run.items():
+            packages[package_of(name)] += self_us
+        for package, self_us in packages.items():
+            by_package[package].append(self_us / 1000)
+    costs = sorted(((statistics.median(times), package) for package, times in by_package.items()), reverse=True)
+
+    print(f"import {TARGET}: median {total:.1f}ms, min {min(totals):.1f}ms, max {max(totals):.1f}ms over {args.runs} runs")
+    print(f"{'package or module':<32} {'self ms':>8}")
+    for cost, package in costs[:args.top]:
+        print(f"{package:<32} {cost:>8.1f}")
+
+    failures = []
+    eager = sorted({package_of(name) for run in runs for name in run} & set(LAZY_MODULES))
+    if eager:
+        failures.append(f"imported at startup, meant to load on first use: {', '.join(eager)}")
+    if total > args.budget_ms:
+        failures.append(f"median {total:.1f}ms is over the {args.budget_ms:.0f}ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import sys
+import time
+import numpy as np
+import sqlalchemy
+from src import database as db
+from src import simulator
+from src.api import bottler
+
+# Ledger metadata benchmark: fill a scratch schema with a day-shaped mix of
+# transactions described the old way, convert a copy the way
+# migrations/012_ledger_metadata.sql does, and compare table sizes and the
+# aggregates that used to parse descriptions. Needs a database with the
+# migrations applied.
+#
+#   python -m bench.ledger_metadata
+#   python -m bench.ledger_metadata 1000
+
+BENCH = "ledger_metadata_bench"
+
+QUERIES = {
+    "barrel spend by sku": (
+        f"""SELECT b.sku, SUM(b.price * b.quantity) FROM {BENCH}.old_inventory, parse_barrel_lines(description) AS b
+            WHERE description LIKE 'Barreled: %' GROUP BY 1""",
+        f"SELECT sku, SUM(price * quantity) FROM {BENCH}.barrel_lines GROUP BY 1",
+    ),
+    "transactions by kind": (
+        f"""SELECT CASE WHEN description LIKE 'sold %' THEN 'sale' ELSE split_part(description, ':', 1) END, COUNT(*)
+            FROM {BENCH}.old_inventory GROUP BY 1""",
+        f"SELECT kind, COUNT(*) FROM {BENCH}.new_inventory GROUP BY 1",
+    ),
+}
+
+
+def descriptions(days, rng):
+    """
+    Per day, as the game runs: one barrel delivery, six bottlings and a few
+    dozen checkouts, described as the baseline wrote them. A checkout is one
+    inventory transaction and one potions transaction per line.
+    """
+    inventory, potions = [], []
+    for _ in range(days):
+        offer = simulator.wholesale_catalog(rng)
+        delivered = [offer[i] for i in rng.choice(len(offer), size=rng.integers(1, 5), replace=False)]
+        inventory.append(f"Barreled: {delivered}")
+        for _ in range(6):
+            picked = rng.choice(len(simulator.POTIONS), size=rng.integers(1, 4), replace=False)
+            bottled = [bottler.PotionInventory(potion_type=list(simulator.POTIONS[i][2]), quantity=int(rng.integers(1, 10)))
+                       for i in picked]
+            inventory.append(f"Bottled: {bottled}")
+            potions.append(f"Bottled: {bottled}")
+        for _ in range(rng.poisson(36)):
+            lines = rng.choice(len(simulator.POTIONS), size=rng.integers(1, 3), replace=False)
+            quantities = rng.integers(1, 4, size=len(lines))
+            for i, quantity in zip(lines, quantities):
+                potions.append(f"sold {quantity} {simulator.POTIONS[i][0]}")
+            inventory.append(f"sold {quantities.sum()} potions")
+    return inventory, potions
+
+
+def main(argv):
+    days = int(argv[0]) if argv else 10000
+    inventory, potions = descriptions(days, np.random.default_rng(0))
+
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(sqlalchemy.text("SET max_parallel_workers_per_gather = 0"))
+        connection.execute(sqlalchemy.text(f"DROP SCHEMA IF EXISTS {BENCH} CASCADE"))
+        connection.execute(sqlalchemy.text(f"CREATE SCHEMA {BENCH}"))
+        for ledger, ledger_descriptions in (("inventory", inventory), ("potions", potions)):
+            connection.execute(sqlalchemy.text(f"""
+                CREATE TABLE {BENCH}.old_{ledger} AS
+                SELECT id, now() AS created_at, description
+                FROM unnest(CAST(:descriptions AS text[])) WITH ORDINALITY AS d (description, id)
+            """), {"descriptions": ledger_descriptions})
+            connection.execute(sqlalchemy.text(f"""
+                CREATE TABLE {BENCH}.new_{ledger} AS
+                SELECT id, created_at, ledger_kind_of(description) AS kind, id AS order_id,
+                    CAST(NULL AS text) AS description
+                FROM {BENCH}.old_{ledger}
+            """))
+        connection.execute(sqlalchemy.text(f"""
+            CREATE TABLE {BENCH}.barrel_lines AS
+            SELECT 1 AS season_id, id AS transaction_id, b.*
+            FROM {BENCH}.old_inventory, parse_barrel_lines(description) AS b
+            WHERE description LIKE 'Barreled: %'
+        """))
+        for table, key in [(f"{age}_{ledger}", "id") for ledger in ("inventory", "potions") for age in ("old", "new")] + [
+                ("barrel_lines", "season_id, transaction_id, line")]:
+            connection.execute(sqlalchemy.text(f"ALTER TABLE {BENCH}.{table} ADD PRIMARY KEY ({key})"))
+            connection.execute(sqlalchemy.text(f"VACUUM ANALYZE {BENCH}.{table}"))
+
+        def size(*tables):
+            return sum(connection.execute(sqlalchemy.text("SELECT pg_total_relation_size(:table)"),
+                                          {"table": f"{BENCH}.{table}"}).scalar_one() for table in tables) / 2**20
+
+        print(f"{days} days, {len(inventory)} inventory and {len(potions)} potion transactions")
+        print(f"{'table':<28} {'old':>10} {'new':>10}")
+        print(f"{'inventory_transactions':<28} {size('old_inventory'):>8.1f}MB {size('new_inventory'):>8.1f}MB")
+        print(f"{'  with barrel_lines':<28} {size('old_inventory'):>8.1f}MB {size('new_inventory', 'barrel_lines'):>8.1f}MB")
+        print(f"{'potions_transactions':<28} {size('old_potions'):>8.1f}MB {size('new_potions'):>8.1f}MB")
+        # Bytes per transaction of description against kind and order_id,
+        # plus the barrel lines for a delivery.
+        print(f"{'inventory bytes per row':<28} {'old':>10} {'new':>10}")
+        for kind, old, new in connection.execute(sqlalchemy.text(f"""
+            SELECT n.kind, AVG(pg_column_size(o.description)),
+                AVG(pg_column_size(n.kind) + pg_column_size(n.order_id) + COALESCE(lines.bytes, 0))
+            FROM {BENCH}.old_inventory o
+            JOIN {BENCH}.new_inventory n ON n.id = o.id
+            LEFT JOIN (
+                SELECT transaction_id, SUM(pg_column_size(b.*)) AS bytes FROM {BENCH}.barrel_lines b GROUP BY 1
+            ) AS lines ON lines.transaction_id = n.id
+            GROUP BY n.kind ORDER BY n.kind
+        """)):
+            print(f"{kind:<28} {old:>10.0f} {new:>10.0f}")
+
+        print(f"{'query':<28} {'old ms':>10} {'new ms':>10}")
+        for name, statements in QUERIES.items():
+            timings = []
+            for statement in statements:
+                statement = sqlalchemy.text(statement)
+                connection.execute(statement).fetchall()
+                start = time.perf_counter()
+                for _ in range(5):
+                    connection.execute(statement).fetchall()
+                timings.append((time.perf_counter() - start) / 5 * 1000)
+            print(f"{name:<28} {timings[0]:>10.1f} {timings[1]:>10.1f}")
+        connection.execute(sqlalchemy.text(f"DROP SCHEMA {BENCH} CASCADE"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,86 @@
+import sys
+import time
+import sqlalchemy
+from src import database as db
+
+# Ledger partitioning benchmark: build a flat ledger and one range
+# partitioned by id (with a BRIN index on created_at) in a scratch schema,
+# grow both, and time the queries the API runs against the ledgers at each
+# size. Needs a database with the migrations applied.
+#
+#   python -m bench.ledger_partitions
+#   python -m bench.ledger_partitions 100000,1000000
+
+QUERIES = {
+    "checkpoint tail": "SELECT SUM(change_gold) FROM {table} WHERE id > :last_id",
+    "last hour": "SELECT SUM(change_gold) FROM {table} WHERE created_at >= :hour_ago",
+    "since_id page": "SELECT * FROM {table} WHERE id > :last_id ORDER BY id LIMIT 1000",
+}
+BLOCK = 1000000
+
+
+def main(argv):
+    sizes = [int(size) for size in (argv[0] if argv else "100000,1000000,10000000").split(",")]
+
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        # Starting parallel workers costs more than any of these queries
+        # takes, and would otherwise dominate the partitioned timings.
+        connection.execute(sqlalchemy.text("SET max_parallel_workers_per_gather = 0"))
+        connection.execute(sqlalchemy.text("DROP SCHEMA IF EXISTS ledger_bench CASCADE"))
+        connection.execute(sqlalchemy.text("CREATE SCHEMA ledger_bench"))
+        columns = "id bigint NOT NULL, created_at timestamptz NOT NULL, change_gold int NOT NULL"
+        connection.execute(sqlalchemy.text(f"CREATE TABLE ledger_bench.flat ({columns}, PRIMARY KEY (id))"))
+        connection.execute(sqlalchemy.text("CREATE INDEX ON ledger_bench.flat (created_at)"))
+        connection.execute(sqlalchemy.text(f"CREATE TABLE ledger_bench.ranged ({columns}, PRIMARY KEY (id)) PARTITION BY RANGE (id)"))
+        connection.execute(sqlalchemy.text("CREATE INDEX ON ledger_bench.ranged USING brin (created_at)"))
+
+        rows = 0
+        print(f"{'rows':>10} {'query':<16} {'flat ms':>8} {'ranged ms':>10}")
+        for size in sizes:
+            for lower in range(rows - rows % BLOCK, size, BLOCK):
+                connection.execute(sqlalchemy.text(
+                    f"CREATE TABLE IF NOT EXISTS ledger_bench.ranged_{lower // BLOCK} PARTITION OF ledger_bench.ranged "
+                    f"FOR VALUES FROM ({lower}) TO ({lower + BLOCK})"
+                ))
+            for table in ("flat", "ranged"):
+                # One row a second, ending now.
+                connection.execute(sqlalchemy.text(f"""
+                    INSERT INTO ledger_bench.{table} (id, created_at, change_gold)
+                    SELECT i, now() - make_interval(secs => :size - i), (i % 100) - 50
+                    FROM generate_series(CAST(:start AS bigint), CAST(:size AS bigint) - 1) AS i
+                """), {"start": rows, "size": size})
+                connection.execute(sqlalchemy.text(f"VACUUM ANALYZE ledger_bench.{table}"))
+            # What ensure_ledger_partitions() does for full blocks.
+            for lower in range(0, size - size % BLOCK, BLOCK):
+                connection.execute(sqlalchemy.text(
+                    f"SELECT brin_summarize_range('ledger_bench.ranged_{lower // BLOCK}_created_at_idx', 4294967295)"
+                ))
+            rows = size
+
+            params = {"last_id": rows - 1000, "hour_ago": None}
+            params["hour_ago"] = connection.execute(sqlalchemy.text("SELECT now() - interval '1 hour'")).scalar()
+            for name, query in QUERIES.items():
+                timings = []
+                for table in ("flat", "ranged"):
+                    statement = sqlalchemy.text(query.format(table=f"ledger_bench.{table}"))
+                    connection.execute(statement, params).fetchall()
+                    start = time.perf_counter()
+                    for _ in range(20):
+                        connection.execute(statement, params).fetchall()
+                    timings.append((time.perf_counter() - start) / 20 * 1000)
+                print(f"{rows:>10} {name:<16} {timings[0]:>8.2f} {timings[1]:>10.2f}")
+
+        sizes_row = connection.execute(sqlalchemy.text("""
+            SELECT pg_size_pretty(pg_relation_size('ledger_bench.flat_created_at_idx')),
+                (SELECT pg_size_pretty(SUM(pg_relation_size(indexrelid)))
+                 FROM pg_index WHERE indrelid IN (SELECT inhrelid FROM pg_inherits
+                                                  WHERE inhparent = 'ledger_bench.ranged'::regclass)
+                     AND indexrelid::regclass::text LIKE '%created_at%')
+        """)).first()
+        print(f"created_at index: btree {sizes_row[0]}, brin {sizes_row[1]}")
+        connection.execute(sqlalchemy.text("DROP SCHEMA ledger_bench CASCADE"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,464 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Load test harness: drives the FastAPI app in process (through httpx's ASGI
+# transport) with the Potion Exchange tick sequence from APISpec.md, against
+# a throwaway Postgres, and reports per-endpoint throughput, p50/p99 latency
+# and SQL statements per request as JSON, so runs on different commits can be
+# compared.
+#
+#   python -m bench.loadtest --days 3 --output results.json
+#   python -m bench.loadtest --replay captured.jsonl
+#   python -m bench.loadtest --compare results.json
+#   python -m bench.loadtest --spike 40 --serve
+#
+# --spike adds a burst of searches and audits to every visit, alongside the
+# customers' checkouts, to see what src/admission.py sheds and what the
+# checkouts' latency does meanwhile (compare with ADMISSION_CONTROL=0). Shed
+# requests (429 and 503) are counted per endpoint apart from errors. With
+# --serve the app runs under uvicorn in a subprocess instead of in process,
+# so the load generator doesn't compete with it for the interpreter; SQL
+# statement counts are only reported in process. bench/database_modes.py
+# runs it in sync and async DATABASE_MODE at the same --workers.
+#
+# Without --server a new cluster is created with initdb/pg_ctl (found on PATH
+# or in --pg-bin / PG_BIN) and removed afterwards. initdb refuses to run as
+# root; there, point --server at a scratch server instead and a throwaway
+# database is created (and dropped) on it. Settings such as DATABASE_MODE,
+# CART_WRITE_BEHIND or VISITS_BACKGROUND are read from the environment as
+# usual and recorded with the results.
+
+ROOT = Path(__file__).resolve().parent.parent
+DATABASE = "potions_loadtest"
+DAYS = ["Edgeday", "Bloomday", "Arcanaday", "Hearthday", "Crownday", "Blesseday", "Soulday"]
+TICKS_PER_DAY = 12
+CLASSES = ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
+SETTINGS = ["DATABASE_MODE", "POOL_MODE", "CART_WRITE_BEHIND", "CART_FLUSH_THRESHOLD", "VISITS_BACKGROUND",
+            "SEARCH_BACKEND", "POTION_REGISTRY_TTL", "SALES_STATS_TTL", "ADMISSION_CONTROL",
+            "ADMISSION_CONCURRENCY", "ADMISSION_CRITICAL", "ADMISSION_STANDARD", "ADMISSION_BULK", "ADMISSION_ROUTES"]
+# Responses from src/admission.py when it sheds a request.
+SHED_STATUSES = (429, 503)
+
+# Route templates as the app declares them; requests are reported per
+# template, which is also how src/metrics.py labels them.
+ROUTES = [
+    ("GET", "/catalog/"),
+    ("POST", "/carts/visits/{visit_id}"),
+    ("POST", "/carts/"),
+    ("POST", "/carts/{cart_id}/items/{item_sku}"),
+    ("POST", "/carts/{cart_id}/checkout"),
+    ("GET", "/carts/search/"),
+    ("POST", "/barrels/plan"),
+    ("POST", "/barrels/deliver/{order_id}/"),
+    ("POST", "/bottler/plan"),
+    ("POST", "/bottler/deliver/{order_id}/"),
+    ("GET", "/inventory/audit"),
+    ("POST", "/inventory/plan"),
+    ("POST", "/inventory/deliver/{order_id}"),
+    ("POST", "/info/current_time"),
+    ("POST", "/admin/reset"),
+]
+_ROUTE_PATTERNS = [
+    (method, template, re.compile("^" + re.sub(r"\\\{[a-z_]+\\\}", "[^/]+", re.escape(template)) + "$"))
+    for method, template in ROUTES
+]
+
+
+def route_of(method, path):
+    for route_method, template, pattern in _ROUTE_PATTERNS:
+        if route_method == method and pattern.match(path):
+            return template
+    return path
+
+
+def wholesale_catalog():
+    barrels = []
+    for index, color in enumerate(["RED", "GREEN", "BLUE", "DARK"]):
+        potion_type = [0, 0, 0, 0]
+        potion_type[index] = 1
+        sizes = [("LARGE", 10000, 750)] if color == "DARK" else [
+            ("MINI", 200, 60), ("SMALL", 500, 100), ("MEDIUM", 2500, 250), ("LARGE", 10000, 500)
+        ]
+        for size, ml, price in sizes:
+            barrels.append({"sku": f"{size}_{color}_BARREL", "ml_per_barrel": ml,
+                            "potion_type": potion_type, "price": price, "quantity": 10})
+    return barrels
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class EphemeralPostgres:
+    """
+    A Postgres database that only lives for the run: a new cluster in a
+    temporary directory, or with server_url a new database on that server.
+    Either way schema.sql and migrations/ are applied first.
+    """
+
+    def __init__(self, server_url=None, bin_dir=None):
+        self.server_url = server_url
+        self.bin_dir = bin_dir or os.environ.get("PG_BIN")
+        self.directory = None
+        self.skipped = []
+
+    def _binary(self, name):
+        path = shutil.which(name, path=self.bin_dir) if self.bin_dir else shutil.which(name)
+        if path is None:
+            raise RuntimeError(f"{name} not found; put the Postgres binaries on PATH, pass --pg-bin or use --server")
+        return path
+
+    def __enter__(self):
+        import sqlalchemy
+
+        if self.server_url is None:
+            self.directory = tempfile.mkdtemp(prefix="potions-loadtest-")
+            data = os.path.join(self.directory, "data")
+            subprocess.run([self._binary("initdb"), "-D", data, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync"],
+                           check=True, capture_output=True)
+            subprocess.run([self._binary("pg_ctl"), "-D", data, "-w", "-l", os.path.join(self.directory, "log"),
+                            "-o", f"-k {self.directory} -c listen_addresses='' -c fsync=off", "start"],
+                           check=True, capture_output=True)
+            self.server_url = f"postgresql+psycopg2://postgres@/postgres?host={self.directory}"
+
+        server = sqlalchemy.make_url(self.server_url)
+        admin = sqlalchemy.create_engine(server, isolation_level="AUTOCOMMIT")
+        with admin.connect() as connection:
+            connection.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {DATABASE} WITH (FORCE)"))
+            connection.execute(sqlalchemy.text(f"CREATE DATABASE {DATABASE}"))
+        admin.dispose()
+        self.url = server.set(database=DATABASE).render_as_string(hide_password=False)
+
+        engine = sqlalchemy.create_engine(self.url, isolation_level="AUTOCOMMIT")
+        with engine.connect() as connection:
+            available = set(connection.execute(sqlalchemy.text("SELECT name FROM pg_available_extensions")).scalars())
+            for path in [ROOT / "schema.sql"] + sorted((ROOT / "migrations").glob("*.sql")):
+                sql = path.read_text()
+                # Migrations like 003_search_trigram.sql may be skipped where
+                # their extension isn't installed.
+                missing = [name for name in re.findall(r"CREATE EXTENSION IF NOT EXISTS (\w+)", sql) if name not in available]
+                if missing:
+                    self.skipped.append(path.name)
+                    continue
+                connection.connection.dbapi_connection.cursor().execute(sql)
+        engine.dispose()
+        return self
+
+    def __exit__(self, *exc):
+        import sqlalchemy
+
+        admin = sqlalchemy.create_engine(self.server_url, isolation_level="AUTOCOMMIT")
+        with admin.connect() as connection:
+            connection.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {DATABASE} WITH (FORCE)"))
+        admin.dispose()
+        if self.directory is not None:
+            subprocess.run([self._binary("pg_ctl"), "-D", os.path.join(self.directory, "data"), "-m", "immediate", "stop"],
+                           capture_output=True)
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Recorder:
+    """Latencies, errors and shed requests per (method, route template)."""
+
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.latencies = {}
+        self.errors = {}
+        self.shed = {}
+
+    async def call(self, method, path, route=None, **kwargs):
+        key = (method, route or route_of(method, path))
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except Exception:
+            response = None
+        self.latencies.setdefault(key, []).append(time.perf_counter() - start)
+        if response is not None and response.status_code in SHED_STATUSES:
+            self.shed[key] = self.shed.get(key, 0) + 1
+            return None
+        if response is None or response.status_code >= 400:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            return None
+        return response.json()
+
+
+async def synthetic(recorder, days, customers, concurrency, seed, spike=0):
+    """
+    days of ticks: the time, capacity once a day, barrels on even ticks and
+    bottling on odd ones, then a visit of customers who each may buy from
+    the catalog, with spike searches and audits at the same time.
+    """
+    rng = random.Random(seed)
+    barrels = {barrel["sku"]: barrel for barrel in wholesale_catalog()}
+    limit = asyncio.Semaphore(concurrency)
+    order_id = visit_id = 0
+
+    async def shop(customer, catalog):
+        async with limit:
+            cart = await recorder.call("POST", "/carts/", json=customer)
+            if cart is None:
+                return
+            cart_id = cart["cart_id"]
+            for item in rng.sample(catalog, min(len(catalog), rng.randint(1, 2))):
+                await recorder.call("POST", f"/carts/{cart_id}/items/{item['sku']}",
+                                    json={"quantity": rng.randint(1, max(1, min(3, item["quantity"])))})
+            await recorder.call("POST", f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    async def bulk(number):
+        if number % 2:
+            await recorder.call("GET", "/inventory/audit")
+        else:
+            await recorder.call("GET", "/carts/search/", params={"customer_name": "customer_"})
+
+    await recorder.call("POST", "/admin/reset")
+    for day in range(days):
+        for tick in range(TICKS_PER_DAY):
+            await recorder.call("POST", "/info/current_time", json={"day": DAYS[day % len(DAYS)], "hour": tick * 2})
+            order_id += 1
+            if tick == 0:
+                plan = await recorder.call("POST", "/inventory/plan")
+                if plan and (plan["potion_capacity"] or plan["ml_capacity"]):
+                    await recorder.call("POST", f"/inventory/deliver/{order_id}", json=plan)
+            if tick % 2 == 0:
+                plan = await recorder.call("POST", "/barrels/plan", json=list(barrels.values())) or []
+                delivered = [{**barrels[line["sku"]], "quantity": line["quantity"]} for line in plan if line["sku"] in barrels]
+                if delivered:
+                    await recorder.call("POST", f"/barrels/deliver/{order_id}/", json=delivered)
+            else:
+                plan = await recorder.call("POST", "/bottler/plan") or []
+                if plan:
+                    await recorder.call("POST", f"/bottler/deliver/{order_id}/", json=plan)
+
+            visit_id += 1
+            catalog = await recorder.call("GET", "/catalog/") or []
+            visitors = [
+                {"customer_name": f"customer_{rng.randrange(10 ** 6)}", "character_class": rng.choice(CLASSES),
+                 "level": rng.randint(1, 20)}
+                for _ in range(rng.randint(1, customers))
+            ]
+            await recorder.call("POST", f"/carts/visits/{visit_id}", json=visitors)
+            buyers = [visitor for visitor in visitors if catalog and rng.random() < 0.6]
+            await asyncio.gather(*(shop(buyer, catalog) for buyer in buyers), *(bulk(number) for number in range(spike)))
+            term = rng.choice(buyers)["customer_name"][:10] if buyers else ""
+            await recorder.call("GET", "/carts/search/", params={"customer_name": term})
+        await recorder.call("GET", "/inventory/audit")
+
+
+async def replay(recorder, path):
+    """
+    Replay captured requests in order. Each line is an object with method and
+    path, and optionally json, params and the captured response; cart ids
+    from captured /carts/ responses are mapped to the new carts.
+    """
+    carts = {}
+    with open(path) as lines:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            captured = json.loads(line)
+            if "method" not in captured or "path" not in captured:
+                raise ValueError(f"{path}:{number}: expected an object with method and path")
+            method = captured["method"].upper()
+            request_path = re.sub(r"^/carts/(\d+)/", lambda match: f"/carts/{carts.get(match.group(1), match.group(1))}/",
+                                  captured["path"])
+            result = await recorder.call(method, request_path, json=captured.get("json"), params=captured.get("params"))
+            response = captured.get("response")
+            if route_of(method, request_path) == "/carts/" and isinstance(result, dict) and isinstance(response, dict):
+                carts[str(response.get("cart_id"))] = str(result.get("cart_id"))
+
+
+def _sql_snapshot():
+    from src import metrics
+
+    with metrics._lock:
+        return {key: (route.statements.sum, route.statements.count, route.db_seconds) for key, route in metrics.routes.items()}
+
+
+def summarize(recorder, before, after, wall_seconds):
+    endpoints = {}
+    for key in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[key])
+        statements, counted, db_seconds = (
+            after.get(key, (0, 0, 0.0))[i] - before.get(key, (0, 0, 0.0))[i] for i in range(3)
+        )
+        endpoints[f"{key[0]} {key[1]}"] = {
+            "requests": len(latencies),
+            "errors": recorder.errors.get(key, 0),
+            "shed": recorder.shed.get(key, 0),
+            # Requests per second one worker could serve: 1 / mean latency.
+            "throughput_rps": round(len(latencies) / sum(latencies), 2) if sum(latencies) else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+            "sql_statements_per_request": round(statements / counted, 2) if counted else None,
+            "db_ms_per_request": round(db_seconds / counted * 1000, 3) if counted else None,
+        }
+    requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "total": {
+            "requests": requests,
+            "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+            "shed": sum(endpoint["shed"] for endpoint in endpoints.values()),
+            "seconds": round(wall_seconds, 3),
+            "throughput_rps": round(requests / wall_seconds, 2) if wall_seconds else None,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(baseline, results):
+    """One line per endpoint: p50, p99 and SQL statements now vs the baseline."""
+    lines = [f"{'endpoint':<40} {'p50 ms':>16} {'p99 ms':>16} {'sql/req':>12}"]
+    for name, now in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            lines.append(f"{name:<40} {'(new)':>16}")
+            continue
+        columns = [
+            f"{before[field]}->{now[field]}" if before[field] is not None else str(now[field])
+            for field in ("p50_ms", "p99_ms", "sql_statements_per_request")
+        ]
+        lines.append(f"{name:<40} {columns[0]:>16} {columns[1]:>16} {columns[2]:>12}")
+    return "\n".join(lines)
+
+
+def _commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+@contextlib.asynccontextmanager
+async def in_process():
+    """A client for the app in this process."""
+    import httpx
+    from src.api.server import app
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+            yield client
+    finally:
+        await app.router.shutdown()
+        from src import database as db
+
+        await db.dispose()
+
+
+@contextlib.asynccontextmanager
+async def served(workers=1):
+    """A client for the app under uvicorn in a subprocess with this environment."""
+    import httpx
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(port),
+                                "--workers", str(workers), "--log-level", "warning"], cwd=ROOT, stdout=sys.stderr)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60,
+                                     limits=httpx.Limits(max_connections=None)) as client:
+            for _ in range(100):
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {process.returncode}")
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def run(args, database):
+    async with (served(args.workers) if args.serve else in_process()) as client:
+        recorder = Recorder(client, {"access_token": os.environ["API_KEY"]})
+        before = {} if args.serve else _sql_snapshot()
+        start = time.perf_counter()
+        if args.replay:
+            await replay(recorder, args.replay)
+        else:
+            await synthetic(recorder, args.days, args.customers, args.concurrency, args.seed, args.spike)
+        wall_seconds = time.perf_counter() - start
+        after = {} if args.serve else _sql_snapshot()
+        admission = (await client.get("/admin/admission", headers=recorder.headers)).json()
+
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - wall_seconds)),
+            "workload": f"replay {args.replay}" if args.replay else "synthetic",
+            "days": None if args.replay else args.days,
+            "customers": None if args.replay else args.customers,
+            "concurrency": None if args.replay else args.concurrency,
+            "seed": None if args.replay else args.seed,
+            "spike": None if args.replay else args.spike,
+            "serve": args.serve,
+            "workers": args.workers if args.serve else None,
+            "skipped_migrations": database.skipped,
+            "settings": {name: os.environ.get(name) for name in SETTINGS},
+            "python": sys.version.split()[0],
+        },
+    }
+    results.update(summarize(recorder, before, after, wall_seconds))
+    results["admission"] = admission
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.loadtest", description="Replay Potion Exchange ticks against the app.")
+    parser.add_argument("--days", type=int, default=2, help="game days of synthetic traffic (12 ticks each)")
+    parser.add_argument("--customers", type=int, default=10, help="most customers per visit")
+    parser.add_argument("--concurrency", type=int, default=4, help="customers shopping at once")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spike", type=int, default=0, help="searches and audits sent alongside each visit's checkouts")
+    parser.add_argument("--replay", help="JSONL of captured requests to replay instead of synthetic traffic")
+    parser.add_argument("--serve", action="store_true", help="run the app under uvicorn instead of in process")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes with --serve")
+    parser.add_argument("--server", help="existing Postgres server URL to create the throwaway database on")
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    with EphemeralPostgres(args.server, args.pg_bin) as database:
+        # src.database reads these when it is first imported.
+        os.environ["POSTGRES_URI"] = database.url
+        os.environ.setdefault("API_KEY", secrets.token_hex(8))
+        if "003_search_trigram.sql" in database.skipped:
+            os.environ.setdefault("SEARCH_BACKEND", "ngram")
+        results = asyncio.run(run(args, database))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        print(compare(json.loads(Path(args.compare).read_text()), results), file=sys.stderr)
+    return 1 if results["total"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
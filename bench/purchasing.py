@@ -0,0 +1,37 @@
+import random
+import sys
+import time
+from collections import namedtuple
+from src.purchasing import plan_barrels
+
+# Purchasing benchmark: time plan_barrels on random catalogs of hundreds of
+# barrels. Needs no database; test/test_purchasing.py checks the plans.
+#
+#   python -m bench.purchasing
+#   python -m bench.purchasing 100,300,1000
+
+Barrel = namedtuple("Barrel", "sku ml_per_barrel potion_type price quantity")
+
+
+def random_catalog(size):
+    catalog = []
+    for i in range(size):
+        color = random.randrange(4)
+        ml = random.choice([200, 500, 1000, 2500])
+        catalog.append(Barrel(f"BARREL_{i}", ml, [int(c == color) for c in range(4)],
+                              random.randint(ml // 20, ml // 4), random.randint(1, 3)))
+    return catalog
+
+
+def main(argv):
+    sizes = [int(size) for size in (argv[0] if argv else "300").split(",")]
+    random.seed(0)
+    for size in sizes:
+        catalog = random_catalog(size)
+        start = time.perf_counter()
+        plan_barrels(catalog, 5000, [0, 0, 0, 0], 10000)
+        print(f"{size} barrel catalog planned in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,37 @@
+import random
+import string
+import sys
+import time
+from src.search_index import NgramIndex
+
+# Search benchmark: index a million synthetic customer names in an NgramIndex
+# and compare lookups against a linear scan. Needs no database.
+#
+#   python -m bench.search_index
+#   python -m bench.search_index 200000
+
+
+def main(argv):
+    size = int(argv[0]) if argv else 1_000_000
+    random.seed(0)
+    index = NgramIndex("")
+    names = ["".join(random.choices(string.ascii_lowercase, k=random.randint(6, 14))) for _ in range(size)]
+    start = time.perf_counter()
+    for key, name in enumerate(names, 1):
+        index.add(key, name)
+    print(f"built index over {len(names)} names in {time.perf_counter() - start:.1f}s")
+
+    terms = [name[2:6] for name in random.sample(names, 100)]
+    start = time.perf_counter()
+    for term in terms:
+        index.lookup(term)
+    indexed = (time.perf_counter() - start) / len(terms)
+    start = time.perf_counter()
+    for term in terms:
+        [key for key, name in enumerate(names, 1) if term in name]
+    scanned = (time.perf_counter() - start) / len(terms)
+    print(f"lookup {indexed * 1000:.2f}ms vs scan {scanned * 1000:.2f}ms per term")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
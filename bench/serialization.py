@@ -0,0 +1,78 @@
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from src.serialization import dumps, ndjson
+
+# Serialization microbenchmark: CPU per response for the catalog, a search
+# page and an export chunk, encoded the way FastAPI did it before
+# (jsonable_encoder, then the stdlib json module) and the way the routes do
+# it now. Needs no database; test/test_serialization.py checks that both
+# encodings agree.
+#
+#   python -m bench.serialization
+
+now = datetime.now(timezone.utc)
+catalog = [{"sku": f"POTION_{i}", "name": f"POTION_{i}", "quantity": 10 + i, "price": 50,
+            "potion_type": [100 - 20 * i, 20 * i, 0, 0]} for i in range(6)]
+SearchRow = namedtuple("SearchRow", "line_item_id item_sku customer_name line_item_total timestamp")
+search = [SearchRow(1000 + i, f"{i + 1} RED_POTION potion", f"Customer {i}", float(50 * (i + 1)),
+                    now - timedelta(minutes=i)) for i in range(5)]
+ExportRow = namedtuple("ExportRow", "id transaction_id created_at kind order_id description potion_sku change")
+export = [ExportRow(i, i // 2, now - timedelta(seconds=i), "sale", i // 2, None, "RED_POTION", -1) for i in range(1000)]
+
+
+def old_catalog():
+    return JSONResponse(jsonable_encoder(catalog)).body
+
+
+def new_catalog():
+    return dumps(catalog)
+
+
+def old_search():
+    results = [{
+        "line_item_id": row[0],
+        "item_sku": row[1],
+        "customer_name": row[2],
+        "line_item_total": float(row[3]),
+        "timestamp": row[4].isoformat() if row[4] else None,
+    } for row in search]
+    return JSONResponse(jsonable_encoder({"previous": "", "next": "abc", "results": results})).body
+
+
+def new_search():
+    return dumps({"previous": "", "next": "abc", "results": [row._asdict() for row in search]})
+
+
+def old_export():
+    def default(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+    return "".join(json.dumps(row._asdict(), default=default) + "\n" for row in export).encode()
+
+
+def new_export():
+    return ndjson(export)
+
+
+def main(argv):
+    print(f"{'response':<24} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, before, after, repeat in (("catalog", old_catalog, new_catalog, 20000),
+                                        ("search page", old_search, new_search, 20000),
+                                        ("export, 1000 rows", old_export, new_export, 200)):
+        timings = []
+        for encode in (before, after):
+            start = time.process_time()
+            for _ in range(repeat):
+                encode()
+            timings.append((time.process_time() - start) / repeat * 1e6)
+        print(f"{name:<24} {timings[0]:>10.1f} {timings[1]:>10.1f} {timings[0] / timings[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+import random
+import sys
+import time
+from collections import namedtuple
+import sqlalchemy
+from src import database as db
+from src.visits import record_visit
+
+# Visits benchmark: large visits through the unnest insert in src/visits.py
+# against one INSERT per customer, plus the cost of a re-delivered visit.
+# Everything is rolled back. Needs a database with the migrations applied.
+#
+#   python -m bench.visits
+#   python -m bench.visits 50000
+
+Customer = namedtuple("Customer", "customer_name character_class level")
+
+
+def main(argv):
+    size = int(argv[0]) if argv else 10000
+    classes = ["Warrior", "Wizard", "Rogue", "Cleric", "Druid", "Paladin"]
+    customers = [Customer(f"customer{i}", random.choice(classes), random.randint(1, 20)) for i in range(size)]
+    base = int(time.time() * 1000)
+
+    with db.engine.begin() as connection:
+        start = time.perf_counter()
+        for i in range(5):
+            record_visit(connection, base + i, customers)
+        batched = (time.perf_counter() - start) / 5
+        start = time.perf_counter()
+        record_visit(connection, base, customers)
+        redelivered = time.perf_counter() - start
+
+        start = time.perf_counter()
+        connection.execute(sqlalchemy.text("INSERT INTO visits (visit_id, customers) VALUES (:visit_id, :count)"),
+                           {"visit_id": base + 5, "count": len(customers)})
+        for position, customer in enumerate(customers, 1):
+            connection.execute(sqlalchemy.text("""
+                INSERT INTO visit_customers (visit_id, position, customer_name, character_class, level)
+                VALUES (:visit_id, :position, :customer_name, :character_class, :level)
+            """), {"visit_id": base + 5, "position": position, **customer._asdict()})
+        per_row = time.perf_counter() - start
+        connection.rollback()
+
+    print(f"{size} customers: unnest insert {batched * 1000:.1f}ms, re-delivery {redelivered * 1000:.1f}ms, "
+          f"one insert per customer {per_row * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+-- Running balances for gold, ml and potions.
+--
+-- inventory_balance and potion_balances are kept up to date by statement
+-- level triggers on the (append-only) ledger tables, in the same transaction
+-- as the ledger insert. balance_checkpoints/potion_checkpoints hold periodic
+-- copies of those balances together with the last ledger entry ids they
+-- cover, so any balance can also be rebuilt as checkpoint + tail.
+
+CREATE TABLE inventory_balance (
+    id int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    gold bigint NOT NULL DEFAULT 0,
+    num_red_ml bigint NOT NULL DEFAULT 0,
+    num_green_ml bigint NOT NULL DEFAULT 0,
+    num_blue_ml bigint NOT NULL DEFAULT 0,
+    num_dark_ml bigint NOT NULL DEFAULT 0
+);
+
+CREATE TABLE potion_balances (
+    potion_sku text PRIMARY KEY REFERENCES potions (sku),
+    quantity bigint NOT NULL DEFAULT 0
+);
+
+CREATE TABLE balance_checkpoints (
+    id bigserial PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT clock_timestamp(),
+    last_inventory_entry_id bigint NOT NULL,
+    last_potions_entry_id bigint NOT NULL,
+    gold bigint NOT NULL,
+    num_red_ml bigint NOT NULL,
+    num_green_ml bigint NOT NULL,
+    num_blue_ml bigint NOT NULL,
+    num_dark_ml bigint NOT NULL
+);
+
+CREATE TABLE potion_checkpoints (
+    checkpoint_id bigint NOT NULL REFERENCES balance_checkpoints (id) ON DELETE CASCADE,
+    potion_sku text NOT NULL,
+    quantity bigint NOT NULL,
+    PRIMARY KEY (checkpoint_id, potion_sku)
+);
+
+CREATE FUNCTION apply_inventory_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE inventory_balance SET
+        gold = inventory_balance.gold + delta.gold,
+        num_red_ml = inventory_balance.num_red_ml + delta.red_ml,
+        num_green_ml = inventory_balance.num_green_ml + delta.green_ml,
+        num_blue_ml = inventory_balance.num_blue_ml + delta.blue_ml,
+        num_dark_ml = inventory_balance.num_dark_ml + delta.dark_ml
+    FROM (
+        SELECT
+            COALESCE(SUM(change_gold), 0) AS gold,
+            COALESCE(SUM(change_red_ml), 0) AS red_ml,
+            COALESCE(SUM(change_green_ml), 0) AS green_ml,
+            COALESCE(SUM(change_blue_ml), 0) AS blue_ml,
+            COALESCE(SUM(change_dark_ml), 0) AS dark_ml
+        FROM new_entries
+    ) AS delta
+    WHERE inventory_balance.id = 1;
+    RETURN NULL;
+END
+$$;
+
+CREATE FUNCTION apply_potions_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO potion_balances (potion_sku, quantity)
+    SELECT potion_sku, SUM(change)
+    FROM new_entries
+    GROUP BY potion_sku
+    ON CONFLICT (potion_sku) DO UPDATE
+    SET quantity = potion_balances.quantity + EXCLUDED.quantity;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER inventory_entries_balance
+AFTER INSERT ON inventory_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_entries();
+
+CREATE TRIGGER potions_entries_balance
+AFTER INSERT ON potions_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION apply_potions_entries();
+
+-- Backfill from the existing ledgers.
+INSERT INTO inventory_balance (id, gold, num_red_ml, num_green_ml, num_blue_ml, num_dark_ml)
+SELECT
+    1,
+    COALESCE(SUM(change_gold), 0),
+    COALESCE(SUM(change_red_ml), 0),
+    COALESCE(SUM(change_green_ml), 0),
+    COALESCE(SUM(change_blue_ml), 0),
+    COALESCE(SUM(change_dark_ml), 0)
+FROM inventory_entries;
+
+INSERT INTO potion_balances (potion_sku, quantity)
+SELECT potion_sku, SUM(change)
+FROM potions_entries
+GROUP BY potion_sku;
@@ -0,0 +1,9 @@
+-- Indexes backing the keyset pagination in /carts/search/. The sort key is
+-- (sort value, cart_items.id); these let the planner walk carts and
+-- inventory_transactions in sort order and probe cart_items per cart
+-- instead of sorting the whole join.
+
+CREATE INDEX carts_customer_name_id_idx ON carts (customer_name, id);
+CREATE INDEX carts_inventory_transaction_id_idx ON carts (inventory_transaction_id);
+CREATE INDEX inventory_transactions_created_at_id_idx ON inventory_transactions (created_at, id);
+CREATE INDEX cart_items_cart_id_id_idx ON cart_items (cart_id, id);
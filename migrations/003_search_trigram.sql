@@ -0,0 +1,9 @@
+-- Trigram indexes so the case-insensitive contains filters in
+-- /carts/search/ (ILIKE '%term%') can use an index instead of a sequential
+-- scan. Deployments without pg_trgm can skip this file and set
+-- SEARCH_BACKEND=ngram to use the in-process index in src/search_index.py.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX carts_customer_name_trgm_idx ON carts USING gin (customer_name gin_trgm_ops);
+CREATE INDEX potions_sku_trgm_idx ON potions USING gin (sku gin_trgm_ops);
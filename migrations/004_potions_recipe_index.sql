@@ -0,0 +1,4 @@
+-- Each recipe maps to exactly one potion. Bottler deliveries resolve
+-- potion_type -> sku through this index.
+
+CREATE UNIQUE INDEX potions_recipe_idx ON potions (red, green, blue, dark);
@@ -0,0 +1,23 @@
+-- Setting an item's quantity replaces it instead of adding a duplicate row.
+-- Existing duplicates are merged into the newest row so checked-out carts
+-- keep their totals.
+
+WITH merged AS (
+    SELECT cart_id, potion_id, MAX(id) AS keep_id, SUM(quantity) AS quantity
+    FROM cart_items
+    GROUP BY cart_id, potion_id
+    HAVING COUNT(*) > 1
+),
+kept AS (
+    UPDATE cart_items
+    SET quantity = merged.quantity
+    FROM merged
+    WHERE cart_items.id = merged.keep_id
+)
+DELETE FROM cart_items
+USING merged
+WHERE cart_items.cart_id = merged.cart_id
+    AND cart_items.potion_id = merged.potion_id
+    AND cart_items.id <> merged.keep_id;
+
+CREATE UNIQUE INDEX cart_items_cart_potion_idx ON cart_items (cart_id, potion_id);
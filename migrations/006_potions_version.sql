@@ -0,0 +1,21 @@
+-- A counter bumped by every change to potions, so processes that cache the
+-- table can tell whether their copy is current with one cheap read.
+
+CREATE TABLE potions_version (
+    id int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version bigint NOT NULL DEFAULT 0
+);
+
+INSERT INTO potions_version (id, version) VALUES (1, 0);
+
+CREATE FUNCTION bump_potions_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE potions_version SET version = potions_version.version + 1 WHERE potions_version.id = 1;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER potions_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON potions
+FOR EACH STATEMENT EXECUTE FUNCTION bump_potions_version();
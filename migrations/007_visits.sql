@@ -0,0 +1,17 @@
+-- Customer visits as delivered to /carts/visits/{visit_id}. A re-delivered
+-- visit_id is ignored, so the customers of a visit are written exactly once.
+
+CREATE TABLE visits (
+    visit_id bigint PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    customers int NOT NULL
+);
+
+CREATE TABLE visit_customers (
+    visit_id bigint NOT NULL REFERENCES visits (visit_id) ON DELETE CASCADE,
+    position int NOT NULL,
+    customer_name text NOT NULL,
+    character_class text NOT NULL,
+    level int NOT NULL,
+    PRIMARY KEY (visit_id, position)
+);
@@ -0,0 +1,30 @@
+-- Rolling sales aggregates, written by checkout in the same statement as the
+-- sale so the catalog and planners never have to scan cart_items.
+
+ALTER TABLE carts ADD COLUMN character_class text;
+
+CREATE TABLE sales_hourly (
+    potion_sku text NOT NULL REFERENCES potions (sku),
+    hour timestamptz NOT NULL,
+    character_class text NOT NULL DEFAULT '',
+    quantity bigint NOT NULL DEFAULT 0,
+    gold bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (potion_sku, hour, character_class)
+);
+
+CREATE INDEX sales_hourly_hour_idx ON sales_hourly (hour);
+
+CREATE VIEW sales_daily AS
+SELECT potion_sku, date_trunc('day', hour) AS day, character_class,
+    SUM(quantity) AS quantity, SUM(gold) AS gold
+FROM sales_hourly
+GROUP BY potion_sku, date_trunc('day', hour), character_class;
+
+-- Backfill from the carts that were already paid for.
+INSERT INTO sales_hourly (potion_sku, hour, character_class, quantity, gold)
+SELECT p.sku, date_trunc('hour', it.created_at), '', SUM(ci.quantity), SUM(ci.quantity * p.price)
+FROM carts c
+JOIN inventory_transactions it ON it.id = c.inventory_transaction_id
+JOIN cart_items ci ON ci.cart_id = c.id
+JOIN potions p ON p.id = ci.potion_id
+GROUP BY p.sku, date_trunc('hour', it.created_at);
@@ -0,0 +1,214 @@
+-- Seasons. Every table that admin reset used to empty is LIST partitioned by
+-- season_id, and season_id defaults to current_season(), so writes land in
+-- the current season without naming it. Reset starts a new season with
+-- start_season(), which only creates and attaches empty partitions. Past
+-- seasons stay queryable until they are archived (see src/seasons.py).
+--
+-- Primary and unique keys of partitioned tables must include the partition
+-- key, so keys become (id, season_id) and foreign keys between season tables
+-- carry season_id too.
+
+CREATE TABLE seasons (
+    id int PRIMARY KEY,
+    started_at timestamptz NOT NULL DEFAULT now(),
+    archived_at timestamptz,
+    archive text
+);
+
+INSERT INTO seasons (id, started_at)
+SELECT 1, COALESCE(MIN(created_at), now()) FROM inventory_transactions;
+
+CREATE FUNCTION current_season() RETURNS int
+LANGUAGE sql STABLE AS $$
+    SELECT MAX(id) FROM seasons
+$$;
+
+CREATE SCHEMA archive;
+
+-- The tables partitioned by season, children before the tables they reference.
+CREATE FUNCTION season_tables() RETURNS text[]
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ARRAY['cart_items', 'carts', 'visit_customers', 'visits', 'sales_hourly',
+                 'inventory_entries', 'potions_entries', 'inventory_transactions', 'potions_transactions']
+$$;
+
+-- Constraints and triggers that are rebuilt on the partitioned tables below.
+DROP TRIGGER inventory_entries_balance ON inventory_entries;
+DROP TRIGGER potions_entries_balance ON potions_entries;
+
+DO $$
+DECLARE
+    constraint_row record;
+BEGIN
+    FOR constraint_row IN
+        SELECT conrelid::regclass AS table_name, conname
+        FROM pg_constraint
+        WHERE contype IN ('f', 'p')
+            AND conrelid::regclass::text = ANY (season_tables())
+        ORDER BY contype = 'p'
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', constraint_row.table_name, constraint_row.conname);
+    END LOOP;
+END
+$$;
+
+DROP INDEX cart_items_cart_potion_idx;
+
+-- Turn each table into season 1 of a new partitioned table of the same name.
+DO $$
+DECLARE
+    table_name text;
+    sequence_name text;
+    index_name text;
+BEGIN
+    FOREACH table_name IN ARRAY season_tables() LOOP
+        sequence_name := NULL;
+        IF EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = table_name::regclass AND attname = 'id') THEN
+            sequence_name := pg_get_serial_sequence(table_name, 'id');
+        END IF;
+        IF sequence_name IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', sequence_name);
+        END IF;
+        EXECUTE format('ALTER TABLE %I ADD COLUMN season_id int NOT NULL DEFAULT 1', table_name);
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', table_name, table_name || '_season_1');
+        -- Free the index names for the partitioned table's indexes.
+        FOR index_name IN
+            SELECT relname FROM pg_class
+            WHERE oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = (table_name || '_season_1')::regclass)
+                AND relname LIKE table_name || '\_%'
+        LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name,
+                           table_name || '_season_1' || substr(index_name, length(table_name) + 1));
+        END LOOP;
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY LIST (season_id)',
+                       table_name, table_name || '_season_1');
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN season_id SET DEFAULT current_season()', table_name);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (1)', table_name, table_name || '_season_1');
+        IF sequence_name IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', sequence_name, table_name);
+        END IF;
+    END LOOP;
+END
+$$;
+
+ALTER TABLE inventory_transactions ADD PRIMARY KEY (id, season_id);
+ALTER TABLE potions_transactions ADD PRIMARY KEY (id, season_id);
+ALTER TABLE inventory_entries ADD PRIMARY KEY (id, season_id);
+ALTER TABLE potions_entries ADD PRIMARY KEY (id, season_id);
+ALTER TABLE carts ADD PRIMARY KEY (id, season_id);
+ALTER TABLE cart_items ADD PRIMARY KEY (id, season_id);
+ALTER TABLE visits ADD PRIMARY KEY (season_id, visit_id);
+ALTER TABLE visit_customers ADD PRIMARY KEY (season_id, visit_id, position);
+ALTER TABLE sales_hourly ADD PRIMARY KEY (season_id, potion_sku, hour, character_class);
+
+ALTER TABLE inventory_entries ADD FOREIGN KEY (transaction_id, season_id)
+    REFERENCES inventory_transactions (id, season_id) ON DELETE CASCADE;
+ALTER TABLE potions_entries ADD FOREIGN KEY (transaction_id, season_id)
+    REFERENCES potions_transactions (id, season_id) ON DELETE CASCADE;
+ALTER TABLE potions_entries ADD FOREIGN KEY (potion_sku) REFERENCES potions (sku);
+ALTER TABLE carts ADD FOREIGN KEY (inventory_transaction_id, season_id)
+    REFERENCES inventory_transactions (id, season_id);
+ALTER TABLE cart_items ADD FOREIGN KEY (cart_id, season_id) REFERENCES carts (id, season_id) ON DELETE CASCADE;
+ALTER TABLE cart_items ADD FOREIGN KEY (potion_id) REFERENCES potions (id);
+ALTER TABLE visit_customers ADD FOREIGN KEY (season_id, visit_id)
+    REFERENCES visits (season_id, visit_id) ON DELETE CASCADE;
+ALTER TABLE sales_hourly ADD FOREIGN KEY (potion_sku) REFERENCES potions (sku);
+
+CREATE UNIQUE INDEX cart_items_season_cart_potion_idx ON cart_items (season_id, cart_id, potion_id);
+
+-- Same definitions as the existing indexes of season 1, which are attached
+-- to these instead of being rebuilt.
+CREATE INDEX carts_customer_name_id_idx ON carts (customer_name, id);
+CREATE INDEX carts_inventory_transaction_id_idx ON carts (inventory_transaction_id);
+CREATE INDEX inventory_transactions_created_at_id_idx ON inventory_transactions (created_at, id);
+CREATE INDEX cart_items_cart_id_id_idx ON cart_items (cart_id, id);
+CREATE INDEX sales_hourly_hour_idx ON sales_hourly (hour);
+
+DO $$
+BEGIN
+    IF to_regclass('carts_season_1_customer_name_trgm_idx') IS NOT NULL THEN
+        CREATE INDEX carts_customer_name_trgm_idx ON carts USING gin (customer_name gin_trgm_ops);
+    END IF;
+END
+$$;
+
+-- Balances and checkpoints are kept per season.
+ALTER TABLE inventory_balance ADD COLUMN season_id int NOT NULL DEFAULT 1;
+ALTER TABLE inventory_balance DROP CONSTRAINT inventory_balance_pkey;
+ALTER TABLE inventory_balance DROP COLUMN id;
+ALTER TABLE inventory_balance ADD PRIMARY KEY (season_id);
+ALTER TABLE inventory_balance ALTER COLUMN season_id DROP DEFAULT;
+
+ALTER TABLE potion_balances ADD COLUMN season_id int NOT NULL DEFAULT 1;
+ALTER TABLE potion_balances DROP CONSTRAINT potion_balances_pkey;
+ALTER TABLE potion_balances ADD PRIMARY KEY (season_id, potion_sku);
+ALTER TABLE potion_balances ALTER COLUMN season_id DROP DEFAULT;
+
+ALTER TABLE balance_checkpoints ADD COLUMN season_id int NOT NULL DEFAULT 1;
+ALTER TABLE balance_checkpoints ALTER COLUMN season_id SET DEFAULT current_season();
+CREATE INDEX balance_checkpoints_season_id_idx ON balance_checkpoints (season_id, id);
+
+CREATE OR REPLACE FUNCTION apply_inventory_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO inventory_balance AS balance (season_id, gold, num_red_ml, num_green_ml, num_blue_ml, num_dark_ml)
+    SELECT season_id, SUM(change_gold), SUM(change_red_ml), SUM(change_green_ml), SUM(change_blue_ml), SUM(change_dark_ml)
+    FROM new_entries
+    GROUP BY season_id
+    ON CONFLICT (season_id) DO UPDATE SET
+        gold = balance.gold + EXCLUDED.gold,
+        num_red_ml = balance.num_red_ml + EXCLUDED.num_red_ml,
+        num_green_ml = balance.num_green_ml + EXCLUDED.num_green_ml,
+        num_blue_ml = balance.num_blue_ml + EXCLUDED.num_blue_ml,
+        num_dark_ml = balance.num_dark_ml + EXCLUDED.num_dark_ml;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION apply_potions_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO potion_balances (season_id, potion_sku, quantity)
+    SELECT season_id, potion_sku, SUM(change)
+    FROM new_entries
+    GROUP BY season_id, potion_sku
+    ON CONFLICT (season_id, potion_sku) DO UPDATE
+    SET quantity = potion_balances.quantity + EXCLUDED.quantity;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER inventory_entries_balance
+AFTER INSERT ON inventory_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_entries();
+
+CREATE TRIGGER potions_entries_balance
+AFTER INSERT ON potions_entries
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION apply_potions_entries();
+
+-- Start a new season: create its (empty) partitions and attach them. No
+-- existing rows are touched. ATTACH only takes a SHARE UPDATE EXCLUSIVE lock
+-- on the parent, and the foreign keys it clones only briefly lock the tables
+-- they reference.
+CREATE FUNCTION start_season() RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+    new_season int;
+    table_name text;
+    partition_name text;
+BEGIN
+    LOCK TABLE seasons IN EXCLUSIVE MODE;
+    new_season := current_season() + 1;
+    FOREACH table_name IN ARRAY season_tables() LOOP
+        partition_name := table_name || '_season_' || new_season;
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, table_name);
+        EXECUTE format('ALTER TABLE %I ADD CHECK (season_id = %s)', partition_name, new_season);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (%s)', table_name, partition_name, new_season);
+    END LOOP;
+    INSERT INTO seasons (id) VALUES (new_season);
+    INSERT INTO inventory_balance (season_id) VALUES (new_season);
+    RETURN new_season;
+END
+$$;
@@ -0,0 +1,126 @@
+-- Range partitions by id inside each season for the append-only ledgers,
+-- plus BRIN indexes on their time columns.
+--
+-- A new season's ledger partitions are themselves partitioned by RANGE (id)
+-- in blocks of ledger_partition_size() ids, with a DEFAULT partition as a
+-- safety net. Checkpoint tails (id > last checkpointed id) and since_id
+-- exports then only touch the newest blocks, and old blocks stop being
+-- written to, so vacuum and the visibility map leave them alone.
+-- ensure_ledger_partitions() keeps two blocks ahead of the id sequences and
+-- runs on every tick. The season that is current when this migration runs
+-- keeps its flat partitions; the next reset starts a partitioned one.
+--
+-- The ledgers are insert-only and ids and created_at grow together, so a
+-- BRIN index (a few pages per million rows) answers time-range filters
+-- almost as well as a btree.
+
+CREATE INDEX inventory_transactions_created_at_brin_idx ON inventory_transactions USING brin (created_at);
+CREATE INDEX potions_transactions_created_at_brin_idx ON potions_transactions USING brin (created_at);
+CREATE INDEX inventory_entries_transaction_id_brin_idx ON inventory_entries USING brin (transaction_id);
+CREATE INDEX potions_entries_transaction_id_brin_idx ON potions_entries USING brin (transaction_id);
+
+CREATE FUNCTION ledger_tables() RETURNS text[]
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ARRAY['inventory_entries', 'potions_entries', 'inventory_transactions', 'potions_transactions']
+$$;
+
+CREATE FUNCTION ledger_partition_size() RETURNS bigint
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT 1000000::bigint
+$$;
+
+-- Make sure the current season's ledgers have id blocks up to two blocks past
+-- where their sequences are now. New blocks are created on their own and
+-- then attached, which doesn't block inserts into the existing blocks.
+-- VACUUM never summarizes the last, partly filled BRIN range of a table, so
+-- once a block is full its BRIN indexes are summarized here; otherwise every
+-- time-range query would have to read that range of every block.
+-- Returns how many blocks were added.
+CREATE FUNCTION ensure_ledger_partitions() RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+    season int := current_season();
+    size bigint := ledger_partition_size();
+    table_name text;
+    season_partition text;
+    last_id bigint;
+    lower_bound bigint;
+    block_name text;
+    index_oid oid;
+    occupied boolean;
+    added int := 0;
+BEGIN
+    FOREACH table_name IN ARRAY ledger_tables() LOOP
+        season_partition := table_name || '_season_' || season;
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_class WHERE oid = to_regclass(season_partition) AND relkind = 'p'
+        ) THEN
+            CONTINUE;
+        END IF;
+        EXECUTE format('SELECT last_value FROM %s', pg_get_serial_sequence(table_name, 'id')) INTO last_id;
+        lower_bound := (last_id / size) * size;
+        FOR block IN 0..2 LOOP
+            block_name := season_partition || '_' || ((lower_bound + block * size) / size);
+            IF to_regclass(block_name) IS NOT NULL THEN
+                CONTINUE;
+            END IF;
+            -- Ids that outran the blocks sit in the default partition, and
+            -- a block can't be attached over them; leave that range there.
+            EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE id >= %s AND id < %s)',
+                           season_partition || '_default', lower_bound + block * size,
+                           lower_bound + (block + 1) * size) INTO occupied;
+            IF NOT occupied THEN
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', block_name, table_name);
+                EXECUTE format('ALTER TABLE %I ADD CHECK (season_id = %s AND id >= %s AND id < %s)',
+                               block_name, season, lower_bound + block * size, lower_bound + (block + 1) * size);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+                               season_partition, block_name, lower_bound + block * size, lower_bound + (block + 1) * size);
+                added := added + 1;
+            END IF;
+        END LOOP;
+        FOR index_oid IN
+            SELECT i.indexrelid
+            FROM pg_inherits h
+            JOIN pg_class b ON b.oid = h.inhrelid
+            JOIN pg_index i ON i.indrelid = h.inhrelid
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am a ON a.oid = c.relam
+            WHERE h.inhparent = to_regclass(season_partition)
+                AND a.amname = 'brin'
+                AND substring(b.relname FROM '_(\d+)$')::bigint < lower_bound / size
+        LOOP
+            -- Only summarizes ranges that aren't yet, so this is cheap to repeat.
+            PERFORM brin_summarize_range(index_oid::regclass, 4294967295);
+        END LOOP;
+    END LOOP;
+    RETURN added;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION start_season() RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+    new_season int;
+    table_name text;
+    partition_name text;
+BEGIN
+    LOCK TABLE seasons IN EXCLUSIVE MODE;
+    new_season := current_season() + 1;
+    FOREACH table_name IN ARRAY season_tables() LOOP
+        partition_name := table_name || '_season_' || new_season;
+        IF table_name = ANY (ledger_tables()) THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (id)',
+                           partition_name, table_name);
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', partition_name || '_default', partition_name);
+        ELSE
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, table_name);
+            EXECUTE format('ALTER TABLE %I ADD CHECK (season_id = %s)', partition_name, new_season);
+        END IF;
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (%s)', table_name, partition_name, new_season);
+    END LOOP;
+    INSERT INTO seasons (id) VALUES (new_season);
+    INSERT INTO inventory_balance (season_id) VALUES (new_season);
+    PERFORM ensure_ledger_partitions();
+    RETURN new_season;
+END
+$$;
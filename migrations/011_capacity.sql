@@ -0,0 +1,33 @@
+-- Capacity bought through /inventory/deliver. A shop starts each season with
+-- one unit of potion capacity (50 potions) and one of ml capacity (10000 ml);
+-- each row is a delivery of extra units, recorded once per order_id. The gold
+-- is paid through the ledger like everything else.
+--
+-- Partitioned by season like the other tables reset used to empty, so a new
+-- season starts back at one unit of each.
+
+CREATE TABLE capacity_purchases (
+    season_id int NOT NULL DEFAULT current_season(),
+    order_id bigint NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    potion_capacity int NOT NULL DEFAULT 0,
+    ml_capacity int NOT NULL DEFAULT 0,
+    PRIMARY KEY (season_id, order_id)
+) PARTITION BY LIST (season_id);
+
+DO $$
+DECLARE
+    season int;
+BEGIN
+    FOR season IN SELECT id FROM seasons WHERE archived_at IS NULL LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF capacity_purchases FOR VALUES IN (%s)',
+                       'capacity_purchases_season_' || season, season);
+    END LOOP;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION season_tables() RETURNS text[]
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ARRAY['capacity_purchases', 'cart_items', 'carts', 'visit_customers', 'visits', 'sales_hourly',
+                 'inventory_entries', 'potions_entries', 'inventory_transactions', 'potions_transactions']
+$$;
@@ -0,0 +1,131 @@
+-- Structured ledger metadata. Transactions used to carry a free-text
+-- description, which for deliveries was the Python repr of the whole request
+-- ("Barreled: [Barrel(sku='SMALL_RED_BARREL', ml_per_barrel=500, ...)]"),
+-- written to both ledgers for bottling. Instead a transaction now has
+--
+--   kind      what recorded it (a 4 byte enum)
+--   order_id  the delivery's order id, or the cart id for a sale
+--
+-- and the one thing the descriptions held that no entry does, the lines of
+-- a barrel delivery, goes into barrel_lines. Bottled and sold potions are
+-- already in potions_entries, ml and gold in inventory_entries and capacity
+-- in capacity_purchases. description stays as an optional note; nothing
+-- writes it any more, and existing rows are converted below and cleared
+-- unless they match none of the known shapes (kind 'other'). Archived
+-- seasons get a kind too but keep their descriptions, since barrel_lines
+-- has no archived partitions. bench/ledger_metadata.py measures the
+-- difference.
+
+CREATE TYPE ledger_kind AS ENUM ('reset', 'barrels', 'bottling', 'capacity', 'sale', 'other');
+
+CREATE FUNCTION ledger_kind_of(description text) RETURNS ledger_kind
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN description IS NULL OR description = 'starting gold' THEN 'reset'
+        WHEN description LIKE 'Barreled: %' THEN 'barrels'
+        WHEN description LIKE 'Bottled: %' THEN 'bottling'
+        WHEN description LIKE 'Capacity: %' THEN 'capacity'
+        WHEN description ~ '^sold \d+ \S+$' THEN 'sale'
+        ELSE 'other'
+    END::ledger_kind
+$$;
+
+-- The barrel lines of a "Barreled: [...]" description, in order.
+CREATE FUNCTION parse_barrel_lines(description text)
+RETURNS TABLE (line int, sku text, ml_per_barrel int, red int, green int, blue int, dark int, price int, quantity int)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT m.line::int, m.match[1], m.match[2]::int, m.match[3]::int, m.match[4]::int, m.match[5]::int,
+        m.match[6]::int, m.match[7]::int, m.match[8]::int
+    FROM regexp_matches(description,
+        $re$sku='([^']*)', ml_per_barrel=(-?\d+), potion_type=\[(-?\d+), (-?\d+), (-?\d+), (-?\d+)\], price=(-?\d+), quantity=(-?\d+)$re$,
+        'g') WITH ORDINALITY AS m (match, line)
+$$;
+
+CREATE TABLE barrel_lines (
+    season_id int NOT NULL DEFAULT current_season(),
+    transaction_id bigint NOT NULL,
+    line int NOT NULL,
+    sku text NOT NULL,
+    ml_per_barrel int NOT NULL,
+    red int NOT NULL DEFAULT 0,
+    green int NOT NULL DEFAULT 0,
+    blue int NOT NULL DEFAULT 0,
+    dark int NOT NULL DEFAULT 0,
+    price int NOT NULL,
+    quantity int NOT NULL,
+    PRIMARY KEY (season_id, transaction_id, line),
+    FOREIGN KEY (transaction_id, season_id) REFERENCES inventory_transactions (id, season_id) ON DELETE CASCADE
+) PARTITION BY LIST (season_id);
+
+DO $$
+DECLARE
+    season int;
+BEGIN
+    FOR season IN SELECT id FROM seasons WHERE archived_at IS NULL LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF barrel_lines FOR VALUES IN (%s)',
+                       'barrel_lines_season_' || season, season);
+    END LOOP;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION season_tables() RETURNS text[]
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ARRAY['capacity_purchases', 'barrel_lines', 'cart_items', 'carts', 'visit_customers', 'visits',
+                 'sales_hourly', 'inventory_entries', 'potions_entries', 'inventory_transactions',
+                 'potions_transactions']
+$$;
+
+INSERT INTO barrel_lines (season_id, transaction_id, line, sku, ml_per_barrel, red, green, blue, dark, price, quantity)
+SELECT it.season_id, it.id, b.*
+FROM inventory_transactions it, parse_barrel_lines(it.description) AS b
+WHERE it.description LIKE 'Barreled: %';
+
+-- The live ledgers, with every season partition and id block, and the
+-- detached ledger partitions of archived seasons.
+DO $$
+DECLARE
+    table_name text;
+    archived boolean;
+BEGIN
+    FOR table_name, archived IN
+        SELECT 'public.' || ledger, false FROM unnest(ARRAY['inventory_transactions', 'potions_transactions']) AS ledger
+        UNION ALL
+        SELECT 'archive.' || c.relname, true FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'archive' AND NOT c.relispartition
+            AND c.relname ~ '^(inventory|potions)_transactions_season_\d+$'
+    LOOP
+        EXECUTE format('ALTER TABLE %s ADD COLUMN kind ledger_kind, ADD COLUMN order_id bigint', table_name);
+        -- Clearing the description in the same update means the new row
+        -- versions don't carry it, so plain VACUUM gets the space back.
+        EXECUTE format('UPDATE %s SET kind = ledger_kind_of(description), '
+                       'description = CASE WHEN %L OR ledger_kind_of(description) = ''other'' THEN description END',
+                       table_name, archived);
+        EXECUTE format('ALTER TABLE %s ALTER COLUMN kind SET NOT NULL', table_name);
+    END LOOP;
+END
+$$;
+
+-- Order ids the descriptions never had, recovered for the live seasons. A
+-- sale's two transactions and a capacity purchase are each written by one
+-- statement, so they share created_at (now() is the transaction's start).
+UPDATE inventory_transactions it
+SET order_id = c.id
+FROM carts c
+WHERE c.inventory_transaction_id = it.id AND c.season_id = it.season_id AND it.kind = 'sale';
+
+UPDATE potions_transactions pt
+SET order_id = sale.order_id
+FROM (
+    SELECT season_id, created_at, MIN(order_id) AS order_id
+    FROM inventory_transactions
+    WHERE kind = 'sale'
+    GROUP BY season_id, created_at
+    HAVING COUNT(*) = 1
+) AS sale
+WHERE pt.kind = 'sale' AND pt.season_id = sale.season_id AND pt.created_at = sale.created_at;
+
+UPDATE inventory_transactions it
+SET order_id = cp.order_id
+FROM capacity_purchases cp
+WHERE it.kind = 'capacity' AND cp.season_id = it.season_id AND cp.created_at = it.created_at;
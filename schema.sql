@@ -0,0 +1,69 @@
+-- Base schema for Central Coast Cauldrons. Apply this first, then every file
+-- in migrations/ in order.
+
+CREATE TABLE potions (
+    id bigserial PRIMARY KEY,
+    sku text NOT NULL UNIQUE,
+    price int NOT NULL,
+    red int NOT NULL DEFAULT 0,
+    green int NOT NULL DEFAULT 0,
+    blue int NOT NULL DEFAULT 0,
+    dark int NOT NULL DEFAULT 0
+);
+
+CREATE TABLE inventory_transactions (
+    id bigserial PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    description text
+);
+
+CREATE TABLE inventory_entries (
+    id bigserial PRIMARY KEY,
+    transaction_id bigint NOT NULL REFERENCES inventory_transactions (id) ON DELETE CASCADE,
+    change_gold int NOT NULL DEFAULT 0,
+    change_red_ml int NOT NULL DEFAULT 0,
+    change_green_ml int NOT NULL DEFAULT 0,
+    change_blue_ml int NOT NULL DEFAULT 0,
+    change_dark_ml int NOT NULL DEFAULT 0
+);
+
+CREATE TABLE potions_transactions (
+    id bigserial PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    description text
+);
+
+CREATE TABLE potions_entries (
+    id bigserial PRIMARY KEY,
+    transaction_id bigint NOT NULL REFERENCES potions_transactions (id) ON DELETE CASCADE,
+    potion_sku text NOT NULL REFERENCES potions (sku),
+    change int NOT NULL
+);
+
+CREATE TABLE carts (
+    id bigserial PRIMARY KEY,
+    customer_name text NOT NULL,
+    payment text,
+    inventory_transaction_id bigint REFERENCES inventory_transactions (id)
+);
+
+CREATE TABLE cart_items (
+    id bigserial PRIMARY KEY,
+    cart_id bigint NOT NULL REFERENCES carts (id) ON DELETE CASCADE,
+    potion_id bigint NOT NULL REFERENCES potions (id),
+    quantity int NOT NULL
+);
+
+INSERT INTO potions (sku, price, red, green, blue, dark) VALUES
+    ('RED_POTION', 50, 100, 0, 0, 0),
+    ('GREEN_POTION', 50, 0, 100, 0, 0),
+    ('BLUE_POTION', 50, 0, 0, 100, 0),
+    ('DARK_POTION', 60, 0, 0, 0, 100),
+    ('PURPLE_POTION', 55, 50, 0, 50, 0),
+    ('TEAL_POTION', 55, 0, 50, 50, 0);
+
+WITH starting_gold AS (
+    INSERT INTO inventory_transactions (description) VALUES ('starting gold') RETURNING id
+)
+INSERT INTO inventory_entries (transaction_id, change_gold)
+SELECT id, 100 FROM starting_gold;
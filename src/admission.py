@@ -0,0 +1,269 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from fastapi.responses import ORJSONResponse
+from starlette.routing import Match
+
+# Admission control. Every request takes one of TOTAL_CONCURRENCY slots
+# (about what the database pool can serve at once) before it runs, and each
+# route belongs to a class with its own share of the slots, queue and
+# deadline. When a slot frees up, the waiting request of the most important
+# class gets it, so a burst of searches or audits queues behind, or is shed
+# ahead of, checkouts and the catalog instead of starving them.
+#
+# A request is shed with 429 when its class's queue is full, and with 503
+# when it can't start before its deadline: either the queue ahead of it is
+# already longer than the deadline at the class's recent service time, or it
+# waited that long. Both carry Retry-After. This is on by default, since a
+# burst of bulk requests otherwise holds every pooled connection while
+# checkouts wait behind it; ADMISSION_CONTROL=0 turns it off.
+
+ENABLED = os.environ.get("ADMISSION_CONTROL", "1").lower() not in ("0", "false", "no")
+TOTAL_CONCURRENCY = int(os.environ.get("ADMISSION_CONCURRENCY", "15"))
+
+
+class RouteClass:
+    """A priority (lower goes first), its share of the slots, queue length and longest wait."""
+
+    def __init__(self, name, priority, limit, queue, max_wait):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiters = deque()
+        # Moving average of how long a request holds its slot.
+        self.service_seconds = 0.05
+        self.admitted = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+
+    def expected_wait(self):
+        """Seconds until a request joining the queue now would start."""
+        return (len(self.waiters) + 1) * self.service_seconds / max(1, self.limit)
+
+    def stats(self):
+        return {
+            "priority": self.priority,
+            "limit": self.limit,
+            "queue": self.queue,
+            "max_wait": self.max_wait,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "wait_seconds": self.wait_seconds,
+            "service_seconds": self.service_seconds,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+        }
+
+
+# name: (priority, limit, queue, max_wait seconds). Override one class with
+# ADMISSION_<NAME>=limit,queue,max_wait, e.g. ADMISSION_BULK=2,10,0.5.
+CLASS_SETTINGS = {
+    "critical": (0, TOTAL_CONCURRENCY, 200, 5.0),
+    "standard": (1, max(1, TOTAL_CONCURRENCY * 2 // 3), 50, 2.0),
+    "bulk": (2, max(1, TOTAL_CONCURRENCY // 5), 20, 1.0),
+}
+
+# Route templates by class; everything else is "standard". Reassign routes
+# with ADMISSION_ROUTES="GET /carts/search/=standard;POST /admin/reset=bulk".
+ROUTE_CLASSES = {
+    ("POST", "/carts/{cart_id}/checkout"): "critical",
+    ("GET", "/catalog/"): "critical",
+    ("POST", "/carts/"): "critical",
+    ("POST", "/carts/{cart_id}/items/{item_sku}"): "critical",
+    ("POST", "/carts/visits/{visit_id}"): "critical",
+    ("POST", "/barrels/deliver/{order_id}/"): "critical",
+    ("POST", "/bottler/deliver/{order_id}/"): "critical",
+    ("POST", "/inventory/deliver/{order_id}"): "critical",
+    ("POST", "/info/current_time"): "critical",
+    ("GET", "/carts/search/"): "bulk",
+    ("GET", "/inventory/audit"): "bulk",
+    ("GET", "/export/inventory"): "bulk",
+    ("GET", "/export/potions"): "bulk",
+    ("GET", "/export/cart_items"): "bulk",
+    ("GET", "/admin/balances"): "bulk",
+}
+DEFAULT_CLASS = "standard"
+
+
+def _class_settings():
+    settings = dict(CLASS_SETTINGS)
+    for name, (priority, *defaults) in CLASS_SETTINGS.items():
+        value = os.environ.get(f"ADMISSION_{name.upper()}")
+        if value:
+            limit, queue, max_wait = value.split(",")
+            settings[name] = (priority, int(limit), int(queue), float(max_wait))
+    return settings
+
+
+def _route_classes():
+    routes = dict(ROUTE_CLASSES)
+    for assignment in filter(None, os.environ.get("ADMISSION_ROUTES", "").split(";")):
+        route, name = assignment.rsplit("=", 1)
+        method, path = route.strip().split(" ", 1)
+        routes[(method.upper(), path.strip())] = name.strip()
+    return routes
+
+
+class AdmissionController:
+    """Slots, queues and counters. Lives on the event loop, so it needs no locks."""
+
+    def __init__(self, total, classes, routes):
+        self.total = total
+        self.in_flight = 0
+        self.classes = {name: RouteClass(name, *settings) for name, settings in classes.items()}
+        self.by_priority = sorted(self.classes.values(), key=lambda route_class: route_class.priority)
+        self.routes = routes
+        self.shed_by_route = {}
+
+    def class_of(self, method, path):
+        return self.classes[self.routes.get((method, path), DEFAULT_CLASS)]
+
+    def _has_room(self, route_class):
+        return self.in_flight < self.total and route_class.in_flight < route_class.limit
+
+    def _take(self, route_class):
+        self.in_flight += 1
+        route_class.in_flight += 1
+        route_class.admitted += 1
+
+    def _ahead(self, route_class):
+        """
+        Whether requests that should start first are waiting: earlier ones of
+        route_class, or a more important class's that only lack a free slot
+        (not room in their own class).
+        """
+        return bool(route_class.waiters) or any(
+            other.waiters and other.in_flight < other.limit
+            for other in self.by_priority if other.priority < route_class.priority
+        )
+
+    async def acquire(self, route_class):
+        """None once a slot is held, or the (status, retry after seconds) to shed with."""
+        if self._has_room(route_class) and not self._ahead(route_class):
+            self._take(route_class)
+            return None
+        if len(route_class.waiters) >= route_class.queue:
+            route_class.shed_queue_full += 1
+            return 429, route_class.expected_wait()
+        expected = route_class.expected_wait()
+        if expected > route_class.max_wait:
+            route_class.shed_deadline += 1
+            return 503, expected
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        route_class.queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), route_class.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away (or the server is stopping) while queued.
+            self._leave(route_class, waiter)
+            raise
+        finally:
+            route_class.wait_seconds += time.perf_counter() - start
+        if waiter.done():
+            # _wake() took the slot on our behalf.
+            return None
+        self._leave(route_class, waiter)
+        route_class.shed_deadline += 1
+        return 503, route_class.expected_wait()
+
+    def _leave(self, route_class, waiter):
+        """Take a waiter out of its queue, handing on the slot if _wake() already gave it one."""
+        if waiter.done():
+            self.release(route_class)
+        else:
+            waiter.cancel()
+            route_class.waiters.remove(waiter)
+
+    def release(self, route_class, held_seconds=None):
+        self.in_flight -= 1
+        route_class.in_flight -= 1
+        if held_seconds is not None:
+            route_class.service_seconds += (held_seconds - route_class.service_seconds) * 0.1
+        self._wake()
+
+    def _wake(self):
+        for route_class in self.by_priority:
+            while route_class.waiters and self._has_room(route_class):
+                waiter = route_class.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._take(route_class)
+                waiter.set_result(None)
+            if route_class.waiters and route_class.in_flight < route_class.limit:
+                # Out of slots with this class still waiting: keep the next
+                # free one for it rather than a less important class.
+                return
+
+    def stats(self):
+        return {
+            "enabled": ENABLED,
+            "total": self.total,
+            "in_flight": self.in_flight,
+            "classes": {name: route_class.stats() for name, route_class in self.classes.items()},
+            "shed_by_route": {f"{method} {path}": count for (method, path), count in sorted(self.shed_by_route.items())},
+        }
+
+
+controller = AdmissionController(TOTAL_CONCURRENCY, _class_settings(), _route_classes())
+
+
+def _route(scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware: hold a slot of the route's class while the request runs.
+    The slot is released when the app returns, after the last body chunk, so
+    a streamed export holds it until the client has the whole response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope)
+        path = route.path if route is not None else "unmatched"
+        # Label the request for src/metrics.py even if it is shed before routing.
+        if route is not None:
+            scope["route"] = route
+        route_class = controller.class_of(scope["method"], path)
+
+        shed = await controller.acquire(route_class)
+        if shed is not None:
+            status, retry_after = shed
+            key = (scope["method"], path)
+            controller.shed_by_route[key] = controller.shed_by_route.get(key, 0) + 1
+            response = ORJSONResponse(
+                {"detail": "Too many requests" if status == 429 else "Server busy"},
+                status_code=status,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route_class, time.perf_counter() - start)
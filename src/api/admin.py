@@ -1,8 +1,19 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from src.api import auth
+from src.api import auth, catalog
 import sqlalchemy
+from datetime import datetime
 from src import database as db
+from src import admission
+from src import balances
+from src import search_index
+from src import metrics
+from src import cart_buffer
+from src import potions
+from src import visits
+from src import sales
+from src import seasons
 
 router = APIRouter(
     prefix="/admin",
@@ -11,30 +22,115 @@ router = APIRouter(
 )
 
 @router.post("/reset")
-def reset():
+async def reset():
     """
     Reset the game state. Gold goes to 100, all potions are removed from
     inventory, and all barrels are removed from inventory. Carts are all reset.
+    Nothing is deleted: a new season starts and the old one stays queryable
+    until it is archived. Buffered cart changes are written to the old
+    season first, after any flush already writing some of them.
     """
+    await cart_buffer.flush_all()
+    await db.run(reset_game)
+    catalog.catalog_cache.invalidate()
+    sales.stats_cache.invalidate()
+    search_index.customer_index.clear()
+    return "OK"
+
+def reset_game(connection):
+    seasons.start(connection)
+    result = connection.execute(sqlalchemy.text("INSERT INTO inventory_transactions (kind) VALUES ('reset') RETURNING id")).first()
+    transaction_id = result.id
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO inventory_entries (transaction_id, change_gold, change_red_ml, change_green_ml, change_blue_ml, change_dark_ml)
+        VALUES (:transaction_id, 100, 0, 0, 0, 0)
+        """), {"transaction_id": transaction_id})
 
-    reset_carts = """
 
-        -- Reset cart_items
-        DELETE FROM cart_items;
-        -- Reset carts
-        DELETE FROM carts;
+@router.get("/seasons")
+async def get_seasons():
+    """
+    Every season, the current one last.
     """
+    return await db.run(seasons.list_seasons)
 
-    with db.engine.begin() as connection:
-        connection.execute(sqlalchemy.text(reset_carts))
-        connection.execute(sqlalchemy.text("TRUNCATE inventory_transactions CASCADE"))
-        connection.execute(sqlalchemy.text("TRUNCATE potions_transactions CASCADE"))
-        result = connection.execute(sqlalchemy.text("INSERT INTO inventory_transactions DEFAULT VALUES RETURNING id")).first()
-        transaction_id = result.id
-        connection.execute(sqlalchemy.text("""
-            INSERT INTO inventory_entries (transaction_id, change_gold, change_red_ml, change_green_ml, change_blue_ml, change_dark_ml)
-            VALUES (:transaction_id, 100, 0, 0, 0, 0)
-            """), {"transaction_id": transaction_id})
+
+@router.post("/seasons/{season_id}/archive")
+async def archive_season(season_id: int, background_tasks: BackgroundTasks, drop: bool = False):
+    """
+    Detach a past season's partitions in the background and move them to the
+    archive schema, or drop them with drop=true.
+    """
+    current = await db.run(balances.season_at)
+    if season_id >= current:
+        raise HTTPException(status_code=400, detail="Only past seasons can be archived")
+    background_tasks.add_task(seasons.archive, season_id, drop)
     return "OK"
 
 
+@router.get("/balances")
+async def verify_balances(as_of: datetime = None):
+    """
+    Check the running balances and the latest checkpoint against a full
+    recompute of the ledgers. With as_of, check the checkpoint + tail answer
+    for that time against a full recompute up to it instead.
+    """
+    mismatches = await db.run(balances.verify, as_of)
+
+    return {"consistent": not mismatches, "mismatches": mismatches}
+
+
+@router.get("/catalog_cache")
+async def get_catalog_cache_stats():
+    """
+    Hit/miss counters for the in-process catalog cache.
+    """
+    return catalog.catalog_cache.stats()
+
+
+@router.get("/potion_registry")
+async def get_potion_registry_stats():
+    """
+    Size, version and reload count of the in-process potion registry.
+    """
+    return potions.registry.stats()
+
+
+@router.get("/sales")
+async def get_sales_stats():
+    """
+    Best sellers and sales per character class over the statistics window.
+    """
+    return (await sales.get_stats()).summary()
+
+
+@router.get("/pool")
+async def get_pool_status():
+    """
+    Connection pool statistics: checked out connections, overflow and time
+    spent waiting for a connection.
+    """
+    return db.pool_status()
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    """
+    Admission control: slots in use, queue lengths, waits and shed requests
+    per route class, and shed requests per route.
+    """
+    return admission.controller.stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Per-route latency, SQL statement counts, DB time, slow statements, pool,
+    visit queue and admission gauges in the Prometheus text format.
+    """
+    pool = db.pool_status()
+    gauges = {f"db_pool_{name}": value for name, value in pool.items() if isinstance(value, (int, float))}
+    gauges.update({f"visit_queue_{name}": value for name, value in visits.writer.stats().items()})
+    for name, stats in admission.controller.stats()["classes"].items():
+        gauges.update({f"admission_{name}_{stat}": value for stat, value in stats.items()})
+    return metrics.render(gauges)
@@ -1,9 +1,9 @@
 from fastapi import Security, HTTPException, status, Request
 from fastapi.security.api_key import APIKeyHeader
 import os
-import dotenv
+from src import database as db
 
-dotenv.load_dotenv()
+db.load_environment()
 
 api_keys = []  
 
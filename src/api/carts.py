@@ -1,9 +1,18 @@
 from fastapi import APIRouter, Depends, Request, HTTPException
 from pydantic import BaseModel
-from src.api import auth
+from src.api import auth, catalog
 from enum import Enum
 import sqlalchemy
 from src import database as db
+from src import search_index
+from src import cart_buffer
+from src import potions
+from src import serialization
+from src import visits
+from datetime import datetime
+from decimal import Decimal
+import base64
+import json
 
 router = APIRouter(
     prefix="/carts",
@@ -21,8 +30,20 @@ class search_sort_order(str, Enum):
     asc = "asc"
     desc = "desc"   
 
-@router.get("/search/", tags=["search"])
-def search_orders(
+class SearchResult(BaseModel):
+    line_item_id: int
+    item_sku: str
+    customer_name: str
+    line_item_total: float
+    timestamp: datetime
+
+class SearchPage(BaseModel):
+    previous: str
+    next: str
+    results: list[SearchResult]
+
+@router.get("/search/", tags=["search"], response_model=SearchPage)
+async def search_orders(
     customer_name: str = "",
     potion_sku: str = "",
     search_page: str = "0",
@@ -36,7 +57,7 @@ def search_orders(
     string (case insensitive). If the filters aren't provided, no
     filtering occurs on the respective search term.
 
-    Search page is a cursor for pagination. The response to this
+    Search page is an opaque cursor for pagination. The response to this
     search endpoint will return previous or next if there is a
     previous or next page of results available. The token passed
     in that search response can be passed in the next search request
@@ -54,15 +75,43 @@ def search_orders(
     time is 5 total line items.
     """
     try:
-        current = int(search_page)
+        cursor = decode_search_page(search_page, sort_col)
     except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid search_page, it must be an integer.")
+        raise HTTPException(status_code=400, detail="Invalid search_page.")
 
-    filter_list = []
-    if customer_name:
+    return serialization.json_response(await db.run(find_orders, customer_name, potion_sku, cursor, sort_col, sort_order))
+
+def find_orders(connection, customer_name, potion_sku, cursor, sort_col, sort_order):
+    """
+    One page of search results starting at a decoded cursor.
+    """
+    cart_ids = potion_ids = None
+    if search_index.SEARCH_BACKEND == "ngram":
+        if customer_name:
+            cart_ids = search_index.customer_index.match(connection, customer_name)
+        if potion_sku:
+            potion_ids = search_index.potion_index.match(connection, potion_sku)
+
+    filter_list = ["ci.season_id = current_season()"]
+    if cart_ids is not None:
+        filter_list.append("c.id = ANY(:cart_ids)")
+    elif customer_name:
         filter_list.append("c.customer_name ILIKE :customer_name")
-    if potion_sku:
+    if potion_ids is not None:
+        filter_list.append("p.id = ANY(:potion_ids)")
+    elif potion_sku:
         filter_list.append("p.sku ILIKE :potion_sku")
+
+    # Walk the (sort value, line item id) key from the cursor instead of
+    # skipping rows with OFFSET, so every page costs the same.
+    sort_expression, sort_type = search_sort_expressions[sort_col]
+    forward = cursor is None or cursor[0] == "next"
+    ascending = (sort_order == search_sort_order.asc) == forward
+    if cursor is not None:
+        comparison = ">" if ascending else "<"
+        filter_list.append(f"({sort_expression}, ci.id) {comparison} (CAST(:sort_value AS {sort_type}), CAST(:line_item_id AS bigint))")
+    direction = "ASC" if ascending else "DESC"
+
     filter = " AND ".join(filter_list)
     filter = f"WHERE {filter}" if filter_list else ""
 
@@ -71,175 +120,269 @@ def search_orders(
             ci.id AS line_item_id,
             CONCAT(ci.quantity, ' ', p.sku, ' potion') AS item_sku,
             c.customer_name,
-            (ci.quantity * p.price) AS line_item_total,
+            CAST(ci.quantity * p.price AS float8) AS line_item_total,
             it.created_at AS timestamp
         FROM
             cart_items ci
         JOIN
-            carts c ON ci.cart_id = c.id
+            carts c ON ci.cart_id = c.id AND c.season_id = ci.season_id
         JOIN
             potions p ON ci.potion_id = p.id
         JOIN
-            inventory_transactions it ON c.inventory_transaction_id = it.id
+            inventory_transactions it ON c.inventory_transaction_id = it.id AND it.season_id = c.season_id
         {filter}
         ORDER BY
-            {sort_col.value} {sort_order.value}
-        LIMIT 5
-        OFFSET :offset
+            {sort_expression} {direction}, ci.id {direction}
+        LIMIT :limit
     """
 
     params = {
         'customer_name': f"%{customer_name}%" if customer_name else None,
         'potion_sku': f"%{potion_sku}%" if potion_sku else None,
-        'offset': current
+        'cart_ids': cart_ids,
+        'potion_ids': potion_ids,
+        'sort_value': cursor[1] if cursor else None,
+        'line_item_id': cursor[2] if cursor else None,
+        'limit': SEARCH_PAGE_SIZE + 1,
     }
 
-    with db.engine.begin() as connection:
-        results = connection.execute(sqlalchemy.text(sql), params).fetchall()
+    results = connection.execute(sqlalchemy.text(sql), params).fetchall()
 
-    formatted_results = [{
-        "line_item_id": result[0],
-        "item_sku": result[1],
-        "customer_name": result[2],
-        "line_item_total": float(result[3]),
-        "timestamp": result[4].isoformat() if result[4] else None
-    } for result in results]
+    if not forward and len(results) <= SEARCH_PAGE_SIZE:
+        # Walked back to the start, serve it as the first page.
+        return find_orders(connection, customer_name, potion_sku, None, sort_col, sort_order)
 
-    next_page = current + 5
-    next = "" if len(results) < 5 else str(next_page)
-    previous = "" if current <= 0 else str(current - 5)
+    more = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+    if not forward:
+        results.reverse()
+
+    has_next = more if forward else True
+    has_previous = cursor is not None if forward else more
+    next = encode_search_page("next", results[-1], sort_col) if results and has_next else ""
+    previous = encode_search_page("prev", results[0], sort_col) if results and has_previous else ""
 
     return {
         "previous": previous,
         "next": next,
-        "results": formatted_results
+        "results": [result._asdict() for result in results]
     }
 
+SEARCH_PAGE_SIZE = 5
+
+# Sort expression and the type its cursor value is cast to.
+search_sort_expressions = {
+    search_sort_options.customer_name: ("c.customer_name", "text"),
+    search_sort_options.item_sku: ("CONCAT(ci.quantity, ' ', p.sku, ' potion')", "text"),
+    search_sort_options.line_item_total: ("(ci.quantity * p.price)", "numeric"),
+    search_sort_options.timestamp: ("it.created_at", "timestamptz"),
+}
+
+def encode_search_page(direction: str, row, sort_col: search_sort_options) -> str:
+    """
+    Build an opaque cursor pointing just past (or before) a result row.
+    """
+    value = getattr(row, sort_col.value)
+    if sort_col == search_sort_options.timestamp:
+        value = value.isoformat()
+    elif sort_col == search_sort_options.line_item_total:
+        value = str(value)
+    payload = json.dumps([direction, sort_col.value, value, row.line_item_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_search_page(search_page: str, sort_col: search_sort_options):
+    """
+    Returns (direction, sort value, line item id), or None for the first page.
+    Raises ValueError if the cursor is malformed or for another sort column.
+    """
+    if search_page in ("", "0"):
+        return None
+    try:
+        padded = search_page + "=" * (-len(search_page) % 4)
+        direction, column, value, line_item_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception as e:
+        raise ValueError(search_page) from e
+    # Anything Postgres would refuse to cast or compare is rejected here,
+    # so a tampered cursor gets a 400 rather than a database error.
+    if (direction not in ("next", "prev") or column != sort_col.value
+            or not isinstance(value, str) or "\x00" in value
+            or type(line_item_id) is not int or not 0 <= line_item_id < 2**63):
+        raise ValueError(search_page)
+    if sort_col == search_sort_options.timestamp:
+        value = datetime.fromisoformat(value)
+    elif sort_col == search_sort_options.line_item_total:
+        try:
+            value = Decimal(value)
+        except ArithmeticError as e:
+            raise ValueError(search_page) from e
+        if not value.is_finite() or abs(value.adjusted()) > 100:
+            raise ValueError(search_page)
+    return direction, value, line_item_id
+
 class Customer(BaseModel):
     customer_name: str
     character_class: str
     level: int
 
 @router.post("/visits/{visit_id}")
-def post_visits(visit_id: int, customers: list[Customer]):
+async def post_visits(visit_id: int, customers: list[Customer]):
     """
-    Which customers visited the shop today?
+    Which customers visited the shop today? Recorded once per visit_id, so
+    a re-delivered visit is accepted but not written again.
     """
-    # with db.engine.begin() as connection:
-    #   result = connection.execute(sqlalchemy.text(sql_to_execute))
-    print(customers)
-
+    await visits.writer.submit(visit_id, customers)
     return "OK"
 
 @router.post("/")
-def create_cart(new_cart: Customer):
+async def create_cart(new_cart: Customer):
     """ """
-    with db.engine.begin() as connection:
-        result = connection.execute(
-            sqlalchemy.text("INSERT INTO carts (customer_name) VALUES (:customer_name) RETURNING id"),
-            {"customer_name": new_cart.customer_name}
-        )
-        cart_id = result.scalar()
+    cart_id = await db.run(insert_cart, new_cart)
     return {"cart_id": cart_id}
 
+def insert_cart(connection, new_cart: Customer):
+    result = connection.execute(
+        sqlalchemy.text("INSERT INTO carts (customer_name, character_class) VALUES (:customer_name, :character_class) RETURNING id"),
+        {"customer_name": new_cart.customer_name, "character_class": new_cart.character_class}
+    )
+    return result.scalar()
+
 
 class CartItem(BaseModel):
     quantity: int
 
 @router.post("/{cart_id}/items/{item_sku}")
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
-    """ """
-    with db.engine.begin() as connection:
-        potion_id_result = connection.execute(
-            sqlalchemy.text("SELECT id FROM potions WHERE sku = :sku"),
-            {"sku": item_sku}
-        )
-        potion_id_row = potion_id_result.fetchone()
-        if potion_id_row:
-            potion_id = potion_id_row[0]
-        else:
-            return {"error": f"No potion found with SKU {item_sku}"}
-
-        # Insert the cart item with the fetched potion_id
-        connection.execute(
-            sqlalchemy.text("INSERT INTO cart_items (cart_id, potion_id, quantity) VALUES (:cart_id, :potion_id, :quantity)"),
-            {"cart_id": cart_id, "potion_id": potion_id, "quantity": cart_item.quantity}
-        )
+async def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+    """
+    Set (not add to) the quantity of item_sku in the cart. With
+    CART_WRITE_BEHIND the change is staged in process and written in bulk;
+    see src/cart_buffer.py for what that guarantees.
+    """
+    potion_id = (await potions.registry.get()).id_of(item_sku)
+    if potion_id is None:
+        return {"error": f"No potion found with SKU {item_sku}"}
+    if cart_buffer.WRITE_BEHIND:
+        cart_buffer.store.stage(cart_id, potion_id, cart_item.quantity)
+        if len(cart_buffer.store) >= cart_buffer.FLUSH_THRESHOLD:
+            await cart_buffer.flush(cart_buffer.store.pop_all())
+        return {"cart_id": cart_id}
+    await db.run(insert_cart_item, cart_id, potion_id, cart_item.quantity)
     return {"cart_id": cart_id}
 
+def insert_cart_item(connection, cart_id: int, potion_id: int, quantity: int):
+    # Locking the cart row first gives the transaction its xid before the
+    # line item draws an id, which the exports' high-water mark relies on.
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_items (cart_id, potion_id, quantity)
+            SELECT carts.id, :potion_id, :quantity
+            FROM carts
+            WHERE carts.id = :cart_id AND carts.season_id = current_season()
+            FOR SHARE
+            ON CONFLICT (season_id, cart_id, potion_id) DO UPDATE SET quantity = EXCLUDED.quantity
+        """),
+        {"cart_id": cart_id, "potion_id": potion_id, "quantity": quantity}
+    )
+
 class CartCheckout(BaseModel):
     payment: str
 
 @router.post("/{cart_id}/checkout")
-def checkout(cart_id: int, cart_checkout: CartCheckout):
-    """ """
-    with db.engine.begin() as connection:
-        total_potions_bought = 0
-        total_gold_paid = 0
-
-        # Insert a new inventory transaction
-        global_transaction_id = connection.execute(sqlalchemy.text("""
-            INSERT INTO inventory_transactions DEFAULT VALUES
+async def checkout(cart_id: int, cart_checkout: CartCheckout):
+    """
+    Check out the whole cart in a single statement. The cart row is locked
+    and only written to the ledgers if it hasn't been paid for yet, so a
+    retried checkout of the same cart returns the recorded totals without
+    writing anything. Item changes still buffered for this cart are written
+    first, in the same transaction, once any flush already writing some of
+    them has finished, and the sale is added to the hourly sales statistics.
+    """
+    await cart_buffer.settle(cart_id)
+    pending = cart_buffer.store.pop(cart_id)
+    try:
+        result = await db.run(check_out_cart, cart_id, cart_checkout, pending)
+    except Exception:
+        cart_buffer.store.restore(pending)
+        raise
+    catalog.catalog_cache.invalidate()
+    return {"total_potions_bought": result.total_potions_bought, "total_gold_paid": result.total_gold_paid}
+
+def check_out_cart(connection, cart_id: int, cart_checkout: CartCheckout, pending=()):
+    paid = connection.execute(sqlalchemy.text("""
+        SELECT inventory_transaction_id
+        FROM carts
+        WHERE id = :cart_id AND season_id = current_season()
+        FOR UPDATE
+    """), {"cart_id": cart_id}).first()
+    if paid is not None and paid.inventory_transaction_id is not None:
+        return recorded_sale(connection, cart_id, paid.inventory_transaction_id)
+    cart_buffer.write(connection, pending)
+    return connection.execute(sqlalchemy.text("""
+        WITH pending AS (
+            SELECT id, COALESCE(character_class, '') AS character_class
+            FROM carts
+            WHERE id = :cart_id AND season_id = current_season() AND inventory_transaction_id IS NULL
+            FOR UPDATE
+        ),
+        items AS (
+            SELECT p.sku, ci.quantity, ci.quantity * p.price AS gold
+            FROM cart_items ci
+            JOIN potions p ON p.id = ci.potion_id
+            WHERE ci.cart_id = :cart_id AND ci.season_id = current_season()
+        ),
+        totals AS (
+            SELECT COALESCE(SUM(quantity), 0) AS potions, COALESCE(SUM(gold), 0) AS gold
+            FROM items
+        ),
+        inventory_transaction AS (
+            INSERT INTO inventory_transactions (kind, order_id)
+            SELECT 'sale', pending.id
+            FROM pending
             RETURNING id
-        """)).scalar()
-
-        connection.execute(sqlalchemy.text("""
+        ),
+        paid_cart AS (
             UPDATE carts
-            SET payment = :payment, inventory_transaction_id = :global_transaction_id
-            WHERE id = :cart_id
-        """), {"payment": cart_checkout.payment, "global_transaction_id": global_transaction_id, "cart_id": cart_id})
-
-        cart_items_result = connection.execute(sqlalchemy.text("""
-            SELECT potion_id, quantity
-            FROM cart_items
-            WHERE cart_id = :cart_id
-        """), {"cart_id": cart_id})
-
-        cart_items = cart_items_result.fetchall()
-
-        for cart_item in cart_items:
-            potion_id, quantity = cart_item
-
-            potion_info = connection.execute(sqlalchemy.text("""
-                SELECT price, sku
-                FROM potions
-                WHERE id = :potion_id
-            """), {"potion_id": potion_id}).first()
-
-            if potion_info:
-                potion_price = potion_info.price
-                potion_sku = potion_info.sku
-
-                total_gold_paid += quantity * potion_price
-
-                total_potions_bought += quantity
-
-                # Insert potion transaction entry
-                potion_transaction_id = connection.execute(sqlalchemy.text("""
-                    INSERT INTO potions_transactions (description)
-                    VALUES (:description)
-                    RETURNING id
-                """), {"description": f"sold {quantity} {potion_sku}"}).scalar()
-
-                # Insert entry in potions_entries table
-                connection.execute(sqlalchemy.text("""
-                    INSERT INTO potions_entries (potion_sku, change, transaction_id)
-                    VALUES (:potion_id, :change, :potion_transaction_id)
-                """), {"potion_id": potion_sku, "change": -quantity, "potion_transaction_id": potion_transaction_id})
-
-        # Update inventory transaction description
-        connection.execute(sqlalchemy.text("""
-            UPDATE inventory_transactions
-            SET description = :description
-            WHERE id = :transaction_id
-        """), {"description": f"sold {total_potions_bought} potions", "transaction_id": global_transaction_id})
-
-        # Insert global inventory entry for gold deduction
-        connection.execute(sqlalchemy.text("""
+            SET payment = :payment, inventory_transaction_id = inventory_transaction.id
+            FROM inventory_transaction
+            WHERE carts.id = :cart_id AND carts.season_id = current_season()
+        ),
+        gold_entry AS (
             INSERT INTO inventory_entries (change_gold, transaction_id)
-            VALUES (:total_gold_paid, :transaction_id)
-        """), {"total_gold_paid": total_gold_paid, "transaction_id": global_transaction_id})
-
-    return {"total_potions_bought": total_potions_bought, "total_gold_paid": total_gold_paid}
-
+            SELECT totals.gold, inventory_transaction.id
+            FROM totals, inventory_transaction
+        ),
+        potions_transaction AS (
+            INSERT INTO potions_transactions (kind, order_id)
+            SELECT 'sale', pending.id
+            FROM pending
+            RETURNING id
+        ),
+        potion_entries AS (
+            INSERT INTO potions_entries (potion_sku, change, transaction_id)
+            SELECT items.sku, -items.quantity, potions_transaction.id
+            FROM items, potions_transaction
+        ),
+        sales AS (
+            INSERT INTO sales_hourly (potion_sku, hour, character_class, quantity, gold)
+            SELECT items.sku, date_trunc('hour', now()), pending.character_class, items.quantity, items.gold
+            FROM items, pending
+            ON CONFLICT (season_id, potion_sku, hour, character_class) DO UPDATE
+            SET quantity = sales_hourly.quantity + EXCLUDED.quantity, gold = sales_hourly.gold + EXCLUDED.gold
+        )
+        SELECT potions AS total_potions_bought, gold AS total_gold_paid
+        FROM totals
+    """), {"cart_id": cart_id, "payment": cart_checkout.payment}).first()
 
+def recorded_sale(connection, cart_id: int, inventory_transaction_id: int):
+    """The totals a cart's checkout wrote to the ledgers."""
+    return connection.execute(sqlalchemy.text("""
+        SELECT
+            (SELECT COALESCE(-SUM(pe.change), 0)
+             FROM potions_transactions pt
+             JOIN potions_entries pe ON pe.transaction_id = pt.id AND pe.season_id = pt.season_id
+             WHERE pt.kind = 'sale' AND pt.order_id = :cart_id AND pt.season_id = current_season()
+            ) AS total_potions_bought,
+            (SELECT COALESCE(SUM(change_gold), 0)
+             FROM inventory_entries
+             WHERE transaction_id = :transaction_id AND season_id = current_season()
+            ) AS total_gold_paid
+    """), {"cart_id": cart_id, "transaction_id": inventory_transaction_id}).first()
@@ -1,42 +1,68 @@
 from fastapi import APIRouter
+from pydantic import BaseModel
+import os
 import sqlalchemy
 from src import database as db
-import sqlalchemy
-from src import database as db
+from src.cache import CachedValue
+from src import potions
+from src import sales
+from src import serialization
 
 router = APIRouter()
 
+CATALOG_SIZE = 6
+
+# The encoded response. Invalidated locally whenever potions_entries is
+# written; the ttl bounds how stale another worker's copy can get.
+catalog_cache = CachedValue(ttl=float(os.environ.get("CATALOG_CACHE_TTL", "5")))
+
+
+class CatalogItem(BaseModel):
+    sku: str
+    name: str
+    quantity: int
+    price: int
+    potion_type: list[int]
 
-@router.get("/catalog/", tags=["catalog"])
-def get_catalog():
-    with db.engine.connect() as connection:
-        # Fetch all available potion types
-        sql_to_execute = sqlalchemy.text(
-            """
-            SELECT potions.sku, potions.price, potions.red AS red, potions.green AS green, potions.blue AS blue, potions.dark AS dark, COALESCE(SUM(pe.change), 0) AS quantity
-            FROM potions
-            LEFT JOIN potions_entries AS pe ON pe.potion_sku = potions.sku
-            GROUP BY potions.sku, potions.price, potions.red, potions.green, potions.blue, potions.dark
-            ORDER BY quantity DESC
-            """
-        )
-        potion_inventory = connection.execute(sql_to_execute).fetchall()
 
-        catalog_items = []
+@router.get("/catalog/", tags=["catalog"], response_model=list[CatalogItem])
+async def get_catalog():
+    return serialization.JSONBytes(await catalog_cache.get(load))
 
-        for potion in potion_inventory:
-            if potion.quantity > 0:
-                catalog_items.append({
-                    "sku": potion.sku,
-                    "name": potion.sku,
-                    "quantity": potion.quantity,
-                    "price": potion.price,
-                    "potion_type": [potion.red, potion.green, potion.blue, potion.dark],
-                })
 
-        if len(catalog_items) > 6:
-            catalog_items = catalog_items[:6]
+async def load():
+    table = await potions.registry.get()
+    stats = await sales.get_stats()
+    return serialization.dumps(await db.run(load_catalog, table, stats))
 
-    return catalog_items
 
+def load_catalog(connection, table, stats):
+    # Stocked skus only; prices and recipes come from the potion registry.
+    # The best sellers are offered first, then whatever we hold the most of.
+    # Skus the registry doesn't know yet are skipped before the catalog is
+    # cut to CATALOG_SIZE, so they don't take a place.
+    sql_to_execute = sqlalchemy.text(
+        """
+        SELECT potion_sku, quantity
+        FROM potion_balances
+        WHERE season_id = current_season() AND quantity > 0
+        """
+    )
+    potion_inventory = connection.execute(sql_to_execute).fetchall()
+    potion_inventory.sort(key=lambda potion: (stats.rank(potion.potion_sku), -potion.quantity, potion.potion_sku))
 
+    catalog = []
+    for potion in potion_inventory:
+        i = table.row_by_sku(potion.potion_sku)
+        if i is None:
+            continue
+        catalog.append({
+            "sku": potion.potion_sku,
+            "name": potion.potion_sku,
+            "quantity": potion.quantity,
+            "price": table.prices[i],
+            "potion_type": table.recipes[i],
+        })
+        if len(catalog) == CATALOG_SIZE:
+            break
+    return catalog
@@ -0,0 +1,126 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from src.api import auth
+from datetime import datetime
+import sqlalchemy
+from src import database as db
+from src import balances
+from src import serialization
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"],
+    dependencies=[Depends(auth.get_api_key)],
+)
+
+# Full history of a season (the current one by default) as NDJSON, one
+# object per line, in id order; start/end restrict the transaction time to
+# [start, end). Ids are drawn before commit, so a row below the newest
+# visible id can still be in flight and commit after it. Each export stops at
+# a high-water mark below which every row has settled and returns it in the
+# X-Next-Since-Id header: pass that as since_id to pull only what is new.
+
+# How long an export waits for the writes in flight below its high-water
+# mark before answering 503.
+EXPORT_SETTLE_SECONDS = 1.0
+
+def high_water_mark(connection, table, season_id):
+    """
+    The season to export and the id of its newest row, once every row at or
+    below that id has committed or rolled back: the same wait as
+    balances.checkpoint, since every writer has its xid by the time it
+    draws an id. None if those writes are still running after
+    EXPORT_SETTLE_SECONDS.
+    """
+    bound = connection.execute(sqlalchemy.text(f"""
+        WITH season AS (SELECT COALESCE(CAST(:season_id AS int), current_season()) AS id)
+        SELECT
+            season.id AS season_id,
+            (SELECT COALESCE(MAX(t.id), 0) FROM {table} t WHERE t.season_id = season.id) AS last_id,
+            CAST(pg_snapshot_xmax(pg_current_snapshot()) AS text) AS xmax
+        FROM season
+    """), {"season_id": season_id}).first()
+    if not balances.wait_for_writes(connection, bound.xmax, EXPORT_SETTLE_SECONDS):
+        return None
+    return bound.season_id, bound.last_id
+
+def _lines(partitions):
+    for rows in partitions:
+        yield serialization.ndjson(rows)
+
+async def _lines_async(partitions):
+    async for rows in partitions:
+        yield serialization.ndjson(rows)
+
+def _filters(season_column, id_column, time_column, season_id, since_id, last_id, start, end):
+    clauses = [f"{season_column} = :season_id", f"{id_column} <= :last_id"]
+    params = {"season_id": season_id, "last_id": last_id}
+    if since_id is not None:
+        clauses.append(f"{id_column} > CAST(:since_id AS bigint)")
+        params["since_id"] = since_id
+    if start is not None:
+        clauses.append(f"{time_column} >= CAST(:start AS timestamptz)")
+        params["start"] = start
+    if end is not None:
+        clauses.append(f"{time_column} < CAST(:end AS timestamptz)")
+        params["end"] = end
+    return "WHERE " + " AND ".join(clauses), params
+
+async def export(query, table, season_column, id_column, time_column, season_id, since_id, start, end):
+    mark = await db.run(high_water_mark, table, season_id)
+    if mark is None:
+        raise HTTPException(status_code=503, detail="Writes still in flight, retry shortly.",
+                            headers={"Retry-After": "1"})
+    season_id, last_id = mark
+    where, params = _filters(season_column, id_column, time_column, season_id, since_id, last_id, start, end)
+    partitions = db.stream(sqlalchemy.text(query.format(where=where, id_column=id_column)), params)
+    lines = _lines_async(partitions) if hasattr(partitions, "__aiter__") else _lines(partitions)
+    next_since_id = max(last_id, since_id or 0)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers={"X-Next-Since-Id": str(next_since_id)})
+
+
+@router.get("/inventory")
+async def export_inventory(season_id: int = None, since_id: int = None, start: datetime = None, end: datetime = None):
+    """
+    Every inventory ledger entry with its transaction; since_id is an entry id.
+    """
+    return await export("""
+        SELECT ie.id, ie.transaction_id, it.created_at, it.kind, it.order_id, it.description,
+            ie.change_gold, ie.change_red_ml, ie.change_green_ml, ie.change_blue_ml, ie.change_dark_ml
+        FROM inventory_entries ie
+        JOIN inventory_transactions it ON it.id = ie.transaction_id AND it.season_id = ie.season_id
+        {where}
+        ORDER BY {id_column}
+    """, "inventory_entries", "ie.season_id", "ie.id", "it.created_at", season_id, since_id, start, end)
+
+
+@router.get("/potions")
+async def export_potions(season_id: int = None, since_id: int = None, start: datetime = None, end: datetime = None):
+    """
+    Every potion ledger entry with its transaction; since_id is an entry id.
+    """
+    return await export("""
+        SELECT pe.id, pe.transaction_id, pt.created_at, pt.kind, pt.order_id, pt.description, pe.potion_sku, pe.change
+        FROM potions_entries pe
+        JOIN potions_transactions pt ON pt.id = pe.transaction_id AND pt.season_id = pe.season_id
+        {where}
+        ORDER BY {id_column}
+    """, "potions_entries", "pe.season_id", "pe.id", "pt.created_at", season_id, since_id, start, end)
+
+
+@router.get("/cart_items")
+async def export_cart_items(season_id: int = None, since_id: int = None, start: datetime = None, end: datetime = None):
+    """
+    Every cart line item; checked_out_at is null for carts that weren't paid
+    for, so a time range only returns sold items. since_id is a line item id.
+    """
+    return await export("""
+        SELECT ci.id, ci.cart_id, c.customer_name, c.character_class, p.sku, ci.quantity, p.price,
+            ci.quantity * p.price AS line_item_total, c.payment, it.created_at AS checked_out_at
+        FROM cart_items ci
+        JOIN carts c ON c.id = ci.cart_id AND c.season_id = ci.season_id
+        JOIN potions p ON p.id = ci.potion_id
+        LEFT JOIN inventory_transactions it ON it.id = c.inventory_transaction_id AND it.season_id = c.season_id
+        {where}
+        ORDER BY {id_column}
+    """, "cart_items", "ci.season_id", "ci.id", "it.created_at", season_id, since_id, start, end)
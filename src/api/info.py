@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
 from src.api import auth
+from src import database as db
+from src import balances
+from src import ledger_partitions
 
 router = APIRouter(
     prefix="/info",
@@ -13,9 +16,12 @@ class Timestamp(BaseModel):
     hour: int
 
 @router.post("/current_time")
-def post_time(timestamp: Timestamp):
+async def post_time(timestamp: Timestamp):
     """
-    Share current time.
+    Share current time. Every tick also checkpoints the balances and
+    adds ledger partitions ahead of the id sequences.
     """
+    await db.run(balances.checkpoint)
+    await db.run(ledger_partitions.ensure)
     return "OK"
 
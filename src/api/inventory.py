@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from src.api import auth
 import math
 import sqlalchemy
 from src import database as db
+from src import balances
+from src import capacity
+from src import inventory_source
+from src import serialization
+from datetime import datetime
 
 router = APIRouter(
     prefix="/inventory",
@@ -11,37 +16,62 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
-@router.get("/audit")
-def get_inventory():
-    """ """
-    with db.engine.begin() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT 
-                COALESCE(SUM(gie.change_gold), 0) AS gold,
-                COALESCE(SUM(gie.change_red_ml + gie.change_green_ml + gie.change_blue_ml + gie.change_dark_ml), 0) AS ml_in_barrels,
-                COALESCE(SUM(pe.change), 0) AS number_of_potions
-            FROM inventory_entries AS gie
-            FULL JOIN potions_entries AS pe ON gie.transaction_id = pe.transaction_id
-        """)).first()
+class Audit(BaseModel):
+    number_of_potions: int
+    ml_in_barrels: int
+    gold: int
 
-    return {
-        "number_of_potions": result.number_of_potions,
-        "ml_in_barrels": result.ml_in_barrels,
-        "gold": result.gold
-    }
+@router.get("/audit", response_model=Audit)
+async def get_inventory(as_of: str = None):
+    """
+    Current inventory, or the inventory as of a point in the past: as_of is
+    either an inventory transaction id or an ISO 8601 timestamp.
+    """
+    if as_of is None:
+        inventory, number_of_potions = await db.run(load_audit)
+    else:
+        inventory, number_of_potions = await db.run(load_audit_as_of, parse_as_of(as_of))
+
+    return serialization.json_response({
+        "number_of_potions": number_of_potions,
+        "ml_in_barrels": inventory["num_red_ml"] + inventory["num_green_ml"] + inventory["num_blue_ml"] + inventory["num_dark_ml"],
+        "gold": inventory["gold"]
+    })
+
+def parse_as_of(as_of: str):
+    """A transaction id stays an int; anything else must be an ISO 8601 timestamp."""
+    if as_of.isdigit():
+        return int(as_of)
+    try:
+        return datetime.fromisoformat(as_of.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="as_of must be a transaction id or an ISO 8601 timestamp")
+
+def load_audit(connection):
+    return balances.get_inventory(connection)._mapping, balances.get_total_potions(connection)
+
+def load_audit_as_of(connection, as_of):
+    if isinstance(as_of, int):
+        as_of_time = balances.transaction_time(connection, as_of)
+        if as_of_time is None:
+            raise HTTPException(status_code=404, detail=f"No inventory transaction {as_of}")
+    else:
+        as_of_time = as_of
+    inventory, potions = balances.as_of(connection, as_of_time)
+    return inventory, sum(potions.values())
 
 # Gets called once a day
 @router.post("/plan")
-def get_capacity_plan():
+async def get_capacity_plan(source=Depends(inventory_source.get_source)):
     """ 
     Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion. Each additional 
-    capacity unit costs 1000 gold.
+    capacity unit costs 1000 gold. A unit is bought of whichever is nearly full; see
+    src/capacity.py.
     """
-    # with db.engine.begin() as connection:
-    #   result = connection.execute(sqlalchemy.text(sql_to_execute))
+    potion_capacity, ml_capacity = capacity.plan_capacity(await source.state(), await source.sales_stats())
     return {
-        "potion_capacity": 0,
-        "ml_capacity": 0
+        "potion_capacity": potion_capacity,
+        "ml_capacity": ml_capacity
         }
 
 class CapacityPurchase(BaseModel):
@@ -50,11 +80,30 @@ class CapacityPurchase(BaseModel):
 
 # Gets called once a day
 @router.post("/deliver/{order_id}")
-def deliver_capacity_plan(capacity_purchase : CapacityPurchase, order_id: int):
+async def deliver_capacity_plan(capacity_purchase : CapacityPurchase, order_id: int):
     """ 
     Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion. Each additional 
-    capacity unit costs 1000 gold.
+    capacity unit costs 1000 gold. Recorded once per order_id.
     """
-    # with db.engine.begin() as connection:
-    #   result = connection.execute(sqlalchemy.text(sql_to_execute))
+    await db.run(record_capacity_delivery, capacity_purchase, order_id)
     return "OK"
+
+def record_capacity_delivery(connection, capacity_purchase: CapacityPurchase, order_id: int):
+    connection.execute(sqlalchemy.text("""
+        WITH purchase AS (
+            INSERT INTO capacity_purchases (order_id, potion_capacity, ml_capacity)
+            VALUES (:order_id, :potion_capacity, :ml_capacity)
+            ON CONFLICT (season_id, order_id) DO NOTHING
+            RETURNING order_id
+        ),
+        inventory_transaction AS (
+            INSERT INTO inventory_transactions (kind, order_id)
+            SELECT 'capacity', order_id FROM purchase
+            RETURNING id
+        )
+        INSERT INTO inventory_entries (change_gold, transaction_id)
+        SELECT CAST(:change_gold AS int), id FROM inventory_transaction
+        """), {"order_id": order_id,
+               "potion_capacity": capacity_purchase.potion_capacity,
+               "ml_capacity": capacity_purchase.ml_capacity,
+               "change_gold": -capacity.PRICE * (capacity_purchase.potion_capacity + capacity_purchase.ml_capacity)})
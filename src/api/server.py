@@ -1,9 +1,18 @@
 from fastapi import FastAPI, exceptions
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import ValidationError
-from src.api import carts, catalog, bottler, barrels, admin, info, inventory
+from src.api import carts, catalog, bottler, barrels, admin, info, inventory, export
+from src import database as db
+from src import admission
+from src import metrics
+from src import potions
+from src import cart_buffer
+from src import visits
+from sqlalchemy.engine import Engine
+import asyncio
 import json
 import logging
+import os
 import sys
 from starlette.middleware.cors import CORSMiddleware
 
@@ -15,6 +24,7 @@ app = FastAPI(
     title="Central Coast Cauldrons",
     description=description,
     version="0.0.1",
+    default_response_class=ORJSONResponse,
     terms_of_service="http://example.com/terms/",
     contact={
         "name": "Lucas Pierce",
@@ -22,16 +32,55 @@ app = FastAPI(
     },
 )
 
+# Every engine, including the ones src.database creates on first use.
+metrics.instrument(Engine)
+
+# WARM_UP=1 opens the first database connection and loads the potion registry
+# in the background as the app starts, instead of on the first request.
+WARM_UP = os.environ.get("WARM_UP", "").lower() in ("1", "true", "yes")
+
+# Added before metrics.RecordRequests so it runs inside it, and shed
+# requests are still counted there under their route.
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.RecordRequests)
+
 origins = ["https://potion-exchange.vercel.app"]
 
+# Added last so it is the outermost layer: responses that admission control
+# sheds get CORS headers too, and browsers can read their Retry-After
+# instead of seeing an opaque network error. Preflights are answered here
+# without taking a slot.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["GET", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Next-Since-Id"],
 )
 
+@app.on_event("startup")
+async def start_visit_writer():
+    if visits.VISITS_BACKGROUND:
+        visits.writer.start()
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARM_UP:
+        app.state.warm_up = asyncio.create_task(warm_up())
+
+async def warm_up():
+    try:
+        await db.warm_up()
+        await potions.registry.get()
+    except Exception:
+        logging.exception("Warm-up failed; the first request will connect instead")
+
+@app.on_event("shutdown")
+async def flush_buffers():
+    await visits.writer.stop()
+    await cart_buffer.flush_all()
+
 app.include_router(inventory.router)
 app.include_router(carts.router)
 app.include_router(catalog.router)
@@ -39,6 +88,7 @@ app.include_router(bottler.router)
 app.include_router(barrels.router)
 app.include_router(admin.router)
 app.include_router(info.router)
+app.include_router(export.router)
 
 @app.exception_handler(exceptions.RequestValidationError)
 @app.exception_handler(ValidationError)
@@ -49,7 +99,7 @@ async def validation_exception_handler(request, exc):
     for error in exc_json:
         response['message'].append(f"{error['loc']}: {error['msg']}")
 
-    return JSONResponse(response, status_code=422)
+    return ORJSONResponse(response, status_code=422)
 
 @app.get("/")
 async def root():
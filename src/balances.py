@@ -0,0 +1,326 @@
+import time
+import sqlalchemy
+
+# Running balances maintained by the triggers in
+# migrations/001_balance_snapshots.sql, kept per season since
+# migrations/009_seasons.sql. Reads are O(1) instead of a SUM() over every
+# ledger row ever written.
+
+
+def get_inventory(connection):
+    """Current gold and ml per color."""
+    return connection.execute(sqlalchemy.text("""
+        SELECT gold, num_red_ml, num_green_ml, num_blue_ml, num_dark_ml
+        FROM inventory_balance
+        WHERE season_id = current_season()
+    """)).first()
+
+
+def get_total_potions(connection):
+    """Number of potions currently in stock across every sku."""
+    return connection.execute(sqlalchemy.text("""
+        SELECT CAST(COALESCE(SUM(quantity), 0) AS bigint) FROM potion_balances WHERE season_id = current_season()
+    """)).scalar()
+
+
+def wait_for_writes(connection, xmax, seconds):
+    """
+    Wait until every transaction below xmax, a pg_snapshot_xmax() read as
+    text, has finished. Returns False if some are still running after
+    seconds.
+    """
+    deadline = time.monotonic() + seconds
+    settled = sqlalchemy.text("SELECT pg_snapshot_xmin(pg_current_snapshot()) >= CAST(CAST(:xmax AS text) AS xid8)")
+    while not connection.execute(settled, {"xmax": xmax}).scalar_one():
+        if time.monotonic() >= deadline:
+            return False
+        # Sleep in Postgres so async mode yields to the event loop meanwhile.
+        connection.execute(sqlalchemy.text("SELECT pg_sleep(0.005)"))
+    return True
+
+
+# How long a checkpoint waits for the ledger writes that were in flight when
+# it started before leaving the checkpoint to the next tick.
+CHECKPOINT_SETTLE_SECONDS = 1.0
+
+
+def checkpoint(connection):
+    """
+    Fold the ledger entries written since the last checkpoint into a new one,
+    without blocking writers. Entry ids are drawn before commit, so entries
+    below the newest visible id may still be in flight: the bound is read
+    together with the snapshot's xmax, and the fold waits until every
+    transaction below that xmax has finished. Writers take their xid when
+    they insert the transaction row, before they draw entry ids, so after
+    that nothing at or below the bound can still appear. Returns the new
+    checkpoint's id, or None if those writes are still running after
+    CHECKPOINT_SETTLE_SECONDS.
+    """
+    bound = connection.execute(sqlalchemy.text("""
+        SELECT
+            (SELECT COALESCE(MAX(id), 0) FROM inventory_entries WHERE season_id = current_season()) AS inventory_entry_id,
+            (SELECT COALESCE(MAX(id), 0) FROM potions_entries WHERE season_id = current_season()) AS potions_entry_id,
+            CAST(pg_snapshot_xmax(pg_current_snapshot()) AS text) AS xmax
+    """)).first()
+    if not wait_for_writes(connection, bound.xmax, CHECKPOINT_SETTLE_SECONDS):
+        return None
+
+    previous = connection.execute(sqlalchemy.text("""
+        SELECT id, last_inventory_entry_id, last_potions_entry_id
+        FROM balance_checkpoints
+        WHERE season_id = current_season()
+        ORDER BY id DESC
+        LIMIT 1
+    """)).first()
+    params = {
+        "previous_id": previous.id if previous else 0,
+        "first_inventory_entry_id": previous.last_inventory_entry_id if previous else 0,
+        "first_potions_entry_id": previous.last_potions_entry_id if previous else 0,
+    }
+    params["last_inventory_entry_id"] = max(params["first_inventory_entry_id"], bound.inventory_entry_id)
+    params["last_potions_entry_id"] = max(params["first_potions_entry_id"], bound.potions_entry_id)
+    checkpoint_id = connection.execute(sqlalchemy.text("""
+        WITH tail AS (
+            SELECT
+                COALESCE(SUM(change_gold), 0) AS gold,
+                COALESCE(SUM(change_red_ml), 0) AS num_red_ml,
+                COALESCE(SUM(change_green_ml), 0) AS num_green_ml,
+                COALESCE(SUM(change_blue_ml), 0) AS num_blue_ml,
+                COALESCE(SUM(change_dark_ml), 0) AS num_dark_ml
+            FROM inventory_entries
+            WHERE season_id = current_season()
+                AND id > :first_inventory_entry_id AND id <= :last_inventory_entry_id
+        )
+        INSERT INTO balance_checkpoints
+            (last_inventory_entry_id, last_potions_entry_id, gold, num_red_ml, num_green_ml, num_blue_ml, num_dark_ml)
+        SELECT
+            :last_inventory_entry_id,
+            :last_potions_entry_id,
+            COALESCE(previous.gold, 0) + tail.gold,
+            COALESCE(previous.num_red_ml, 0) + tail.num_red_ml,
+            COALESCE(previous.num_green_ml, 0) + tail.num_green_ml,
+            COALESCE(previous.num_blue_ml, 0) + tail.num_blue_ml,
+            COALESCE(previous.num_dark_ml, 0) + tail.num_dark_ml
+        FROM tail
+        LEFT JOIN balance_checkpoints previous ON previous.id = :previous_id
+        RETURNING id
+    """), params).scalar()
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potion_checkpoints (checkpoint_id, potion_sku, quantity)
+        SELECT :checkpoint_id, potion_sku, SUM(quantity)
+        FROM (
+            SELECT potion_sku, quantity
+            FROM potion_checkpoints
+            WHERE checkpoint_id = :previous_id
+            UNION ALL
+            SELECT potion_sku, change
+            FROM potions_entries
+            WHERE season_id = current_season()
+                AND id > :first_potions_entry_id AND id <= :last_potions_entry_id
+        ) AS combined
+        GROUP BY potion_sku
+    """), {**params, "checkpoint_id": checkpoint_id})
+    return checkpoint_id
+
+
+def transaction_time(connection, transaction_id):
+    """When an inventory transaction was written, or None if there is no such transaction."""
+    return connection.execute(sqlalchemy.text("""
+        SELECT created_at FROM inventory_transactions WHERE id = :transaction_id
+    """), {"transaction_id": transaction_id}).scalar()
+
+
+def season_at(connection, as_of_time=None):
+    """The season that was current at as_of_time, or the current season."""
+    if as_of_time is None:
+        return connection.execute(sqlalchemy.text("SELECT current_season()")).scalar_one()
+    return connection.execute(sqlalchemy.text("""
+        SELECT COALESCE((SELECT MAX(id) FROM seasons WHERE started_at <= :as_of), (SELECT MIN(id) FROM seasons))
+    """), {"as_of": as_of_time}).scalar_one()
+
+
+def as_of(connection, as_of_time):
+    """
+    Gold and ml per color, and potions per sku, as of as_of_time: the last
+    checkpoint taken by then plus the entries of transactions written by
+    then, read only up to the following checkpoint. That keeps the replay to
+    one checkpoint interval. A transaction that started before as_of_time
+    but only wrote its entries after the following checkpoint is missed;
+    every transaction here writes its entries in its first statement. The
+    answer is for the season that was current at as_of_time.
+    """
+    season_id = season_at(connection, as_of_time)
+    checkpoint = connection.execute(sqlalchemy.text("""
+        SELECT *
+        FROM balance_checkpoints
+        WHERE season_id = :season_id AND created_at <= :as_of
+        ORDER BY id DESC
+        LIMIT 1
+    """), {"season_id": season_id, "as_of": as_of_time}).first()
+    following = connection.execute(sqlalchemy.text("""
+        SELECT last_inventory_entry_id, last_potions_entry_id
+        FROM balance_checkpoints
+        WHERE season_id = :season_id AND created_at > :as_of AND id > :checkpoint_id
+        ORDER BY id
+        LIMIT 1
+    """), {"season_id": season_id, "as_of": as_of_time, "checkpoint_id": checkpoint.id if checkpoint else 0}).first()
+    bounds = {
+        "season_id": season_id,
+        "as_of": as_of_time,
+        "first_inventory_entry_id": checkpoint.last_inventory_entry_id if checkpoint else 0,
+        "first_potions_entry_id": checkpoint.last_potions_entry_id if checkpoint else 0,
+        "last_inventory_entry_id": following.last_inventory_entry_id if following else None,
+        "last_potions_entry_id": following.last_potions_entry_id if following else None,
+    }
+
+    tail = connection.execute(sqlalchemy.text("""
+        SELECT
+            COALESCE(SUM(ie.change_gold), 0) AS gold,
+            COALESCE(SUM(ie.change_red_ml), 0) AS num_red_ml,
+            COALESCE(SUM(ie.change_green_ml), 0) AS num_green_ml,
+            COALESCE(SUM(ie.change_blue_ml), 0) AS num_blue_ml,
+            COALESCE(SUM(ie.change_dark_ml), 0) AS num_dark_ml
+        FROM inventory_entries ie
+        JOIN inventory_transactions it ON it.id = ie.transaction_id AND it.season_id = ie.season_id
+        WHERE ie.season_id = :season_id AND it.season_id = :season_id
+            AND ie.id > :first_inventory_entry_id
+            AND ie.id <= COALESCE(CAST(:last_inventory_entry_id AS bigint), 9223372036854775807)
+            AND it.created_at <= :as_of
+    """), bounds).first()
+    inventory = {
+        key: (getattr(checkpoint, key) if checkpoint else 0) + value
+        for key, value in tail._mapping.items()
+    }
+
+    rows = connection.execute(sqlalchemy.text("""
+        WITH combined AS (
+            SELECT potion_sku, quantity
+            FROM potion_checkpoints
+            WHERE checkpoint_id = :checkpoint_id
+            UNION ALL
+            SELECT pe.potion_sku, pe.change
+            FROM potions_entries pe
+            JOIN potions_transactions pt ON pt.id = pe.transaction_id AND pt.season_id = pe.season_id
+            WHERE pe.season_id = :season_id AND pt.season_id = :season_id
+                AND pe.id > :first_potions_entry_id
+                AND pe.id <= COALESCE(CAST(:last_potions_entry_id AS bigint), 9223372036854775807)
+                AND pt.created_at <= :as_of
+        )
+        SELECT potion_sku, CAST(SUM(quantity) AS bigint) AS quantity
+        FROM combined
+        GROUP BY potion_sku
+    """), {**bounds, "checkpoint_id": checkpoint.id if checkpoint else 0})
+    return inventory, {row.potion_sku: row.quantity for row in rows}
+
+
+def _full_inventory(connection, as_of_time=None):
+    return connection.execute(sqlalchemy.text("""
+        SELECT
+            COALESCE(SUM(change_gold), 0) AS gold,
+            COALESCE(SUM(change_red_ml), 0) AS num_red_ml,
+            COALESCE(SUM(change_green_ml), 0) AS num_green_ml,
+            COALESCE(SUM(change_blue_ml), 0) AS num_blue_ml,
+            COALESCE(SUM(change_dark_ml), 0) AS num_dark_ml
+        FROM inventory_entries ie
+        JOIN inventory_transactions it ON it.id = ie.transaction_id AND it.season_id = ie.season_id
+        WHERE ie.season_id = :season_id AND (CAST(:as_of AS timestamptz) IS NULL OR it.created_at <= :as_of)
+    """), {"season_id": season_at(connection, as_of_time), "as_of": as_of_time}).first()
+
+
+def _full_potions(connection, as_of_time=None):
+    rows = connection.execute(sqlalchemy.text("""
+        SELECT potion_sku, SUM(change) AS quantity
+        FROM potions_entries pe
+        JOIN potions_transactions pt ON pt.id = pe.transaction_id AND pt.season_id = pe.season_id
+        WHERE pe.season_id = :season_id AND (CAST(:as_of AS timestamptz) IS NULL OR pt.created_at <= :as_of)
+        GROUP BY potion_sku
+    """), {"season_id": season_at(connection, as_of_time), "as_of": as_of_time})
+    return {row.potion_sku: row.quantity for row in rows}
+
+
+def _checkpoint_inventory(connection):
+    return connection.execute(sqlalchemy.text("""
+        WITH cp AS (
+            SELECT * FROM balance_checkpoints WHERE season_id = current_season() ORDER BY id DESC LIMIT 1
+        )
+        SELECT
+            cp.gold + COALESCE(SUM(ie.change_gold), 0) AS gold,
+            cp.num_red_ml + COALESCE(SUM(ie.change_red_ml), 0) AS num_red_ml,
+            cp.num_green_ml + COALESCE(SUM(ie.change_green_ml), 0) AS num_green_ml,
+            cp.num_blue_ml + COALESCE(SUM(ie.change_blue_ml), 0) AS num_blue_ml,
+            cp.num_dark_ml + COALESCE(SUM(ie.change_dark_ml), 0) AS num_dark_ml
+        FROM cp
+        LEFT JOIN inventory_entries ie ON ie.season_id = cp.season_id AND ie.id > cp.last_inventory_entry_id
+        GROUP BY cp.gold, cp.num_red_ml, cp.num_green_ml, cp.num_blue_ml, cp.num_dark_ml
+    """)).first()
+
+
+def _checkpoint_potions(connection):
+    rows = connection.execute(sqlalchemy.text("""
+        WITH cp AS (
+            SELECT id, season_id, last_potions_entry_id
+            FROM balance_checkpoints
+            WHERE season_id = current_season()
+            ORDER BY id DESC
+            LIMIT 1
+        ),
+        combined AS (
+            SELECT pc.potion_sku, pc.quantity
+            FROM potion_checkpoints pc
+            JOIN cp ON pc.checkpoint_id = cp.id
+            UNION ALL
+            SELECT pe.potion_sku, pe.change
+            FROM potions_entries pe
+            JOIN cp ON pe.season_id = cp.season_id AND pe.id > cp.last_potions_entry_id
+        )
+        SELECT potion_sku, CAST(SUM(quantity) AS bigint) AS quantity
+        FROM combined
+        GROUP BY potion_sku
+    """))
+    return {row.potion_sku: row.quantity for row in rows}
+
+
+def _compare(source, expected, actual, mismatches):
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key, 0) != actual.get(key, 0):
+            mismatches.append({
+                "source": source,
+                "key": key,
+                "expected": expected.get(key, 0),
+                "actual": actual.get(key, 0),
+            })
+
+
+def verify(connection, as_of_time=None):
+    """
+    Recompute every balance from the full ledgers and compare it against the
+    running balances and against the latest checkpoint + tail. Returns a list
+    of mismatches, empty when everything agrees. With as_of_time, compare the
+    as_of() result against the full ledgers up to that time instead.
+    """
+    mismatches = []
+    if as_of_time is not None:
+        inventory, potions = as_of(connection, as_of_time)
+        _compare("as_of", dict(_full_inventory(connection, as_of_time)._mapping), inventory, mismatches)
+        _compare("as_of", _full_potions(connection, as_of_time), potions, mismatches)
+        return mismatches
+
+    full_inventory = dict(_full_inventory(connection)._mapping)
+    full_potions = _full_potions(connection)
+
+    snapshot = get_inventory(connection)
+    _compare("snapshot", full_inventory, dict(snapshot._mapping) if snapshot else {}, mismatches)
+    snapshot_potions = {
+        row.potion_sku: row.quantity
+        for row in connection.execute(sqlalchemy.text(
+            "SELECT potion_sku, quantity FROM potion_balances WHERE season_id = current_season()"
+        ))
+    }
+    _compare("snapshot", full_potions, snapshot_potions, mismatches)
+
+    checkpoint_inventory = _checkpoint_inventory(connection)
+    if checkpoint_inventory is not None:
+        _compare("checkpoint", full_inventory, dict(checkpoint_inventory._mapping), mismatches)
+        _compare("checkpoint", full_potions, _checkpoint_potions(connection), mismatches)
+
+    return mismatches
@@ -0,0 +1,47 @@
+from src import lazy
+
+np = lazy.module("numpy")
+
+# Bottling planner over the recipe matrix (recipes x [red, green, blue, dark]
+# ml per bottle). Bottles are added one at a time, each step scoring every
+# recipe at once, so a plan for hundreds of recipes is a few dozen vectorized
+# steps. The result only depends on the inputs: ties go to the lowest row.
+
+
+def plan_bottles(recipes, prices, available_ml, max_potions, per_recipe_cap=None, objective="revenue", demand=None):
+    """
+    How many bottles of each recipe to make.
+
+    recipes is an (R, 4) array of ml per bottle, prices an (R,) array,
+    available_ml the ml per color that may be used and max_potions how many
+    bottles fit. With objective="fill" the plan makes as many bottles as
+    possible by always taking the recipe that uses the smallest fraction of
+    its scarcest color; with "revenue" that fraction discounts the price.
+    demand optionally weights each recipe's price by how well it sells.
+    """
+    recipes = np.asarray(recipes, dtype=np.int64).reshape(-1, 4)
+    prices = np.asarray(prices, dtype=np.float64)
+    if demand is not None:
+        prices = prices * np.asarray(demand, dtype=np.float64)
+    remaining = np.asarray(available_ml, dtype=np.int64).copy()
+    counts = np.zeros(len(recipes), dtype=np.int64)
+    cap = per_recipe_cap if per_recipe_cap is not None else max_potions
+    nonempty = recipes.sum(axis=1) > 0
+
+    for _ in range(max(0, max_potions)):
+        feasible = (recipes <= remaining).all(axis=1) & (counts < cap) & nonempty
+        if not feasible.any():
+            break
+        # Colors a recipe doesn't use contribute 0 / remaining = 0.
+        share = (recipes / np.maximum(remaining, 1)).max(axis=1)
+        if objective == "fill":
+            score = -share
+        else:
+            score = prices * (1.0 - share)
+        score = np.where(feasible, score, -np.inf)
+        choice = int(np.argmax(score))
+        counts[choice] += 1
+        remaining -= recipes[choice]
+
+    return counts
+
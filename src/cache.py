@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class CachedValue:
+    """
+    A single value cached in the API process. It is reloaded when it has been
+    invalidated or when it is older than ttl seconds, so other workers that
+    can't see our invalidations still converge within the ttl.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+        self._generation = 0
+
+    async def get(self, loader):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            generation = self._generation
+
+        value = await loader()
+
+        with self._lock:
+            # Don't store a value that was read before an invalidation landed.
+            if generation == self._generation:
+                self._value = value
+                self._loaded_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "ttl": self.ttl,
+        }
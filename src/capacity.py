@@ -0,0 +1,48 @@
+import sqlalchemy
+
+# Potion and ml capacity. A shop starts every season with one unit of each;
+# further units cost PRICE gold each and are recorded in capacity_purchases.
+# The planner buys a unit of whatever is close to full, as long as the gold
+# left afterwards stays above GOLD_RESERVE. Potions count as full when the
+# potions expected to sell between restocks would fill them. The thresholds
+# are module globals, read on every call, so src/simulator.py can sweep them.
+
+POTIONS_PER_UNIT = 50
+ML_PER_UNIT = 10000
+PRICE = 1000
+
+# Buy another unit once stock (or expected sales) fills this share of it.
+FILL_THRESHOLD = 0.8
+GOLD_RESERVE = 500
+# Most units of each kind bought in one day.
+MAX_UNITS_PER_DAY = 1
+# Hours between bottlings: every other two-hour tick.
+RESTOCK_HOURS = 4
+
+
+def plan_capacity(state, stats):
+    """
+    (potion units, ml units) to buy given a ShopState and SalesStats. The
+    fuller of the two is considered first when gold only covers one.
+    """
+    restock_sales = sum(stats.by_sku.values()) / stats.window_hours * RESTOCK_HOURS
+    fills = [
+        (max(state.potions, restock_sales) / (state.potion_capacity * POTIONS_PER_UNIT), 0),
+        (sum(state.ml) / (state.ml_capacity * ML_PER_UNIT), 1),
+    ]
+    spendable = state.gold - GOLD_RESERVE
+    units = [0, 0]
+    for fill, kind in sorted(fills, reverse=True):
+        while fill >= FILL_THRESHOLD and units[kind] < MAX_UNITS_PER_DAY and spendable >= PRICE:
+            units[kind] += 1
+            spendable -= PRICE
+    return tuple(units)
+
+
+def load_units(connection):
+    """(potion units, ml units) the shop has this season."""
+    return tuple(connection.execute(sqlalchemy.text("""
+        SELECT 1 + COALESCE(SUM(potion_capacity), 0), 1 + COALESCE(SUM(ml_capacity), 0)
+        FROM capacity_purchases
+        WHERE season_id = current_season()
+    """)).one())
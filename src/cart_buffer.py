@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+import sqlalchemy
+from src import database as db
+
+# Write-behind buffering for cart item changes (CART_WRITE_BEHIND=1).
+#
+# Ordering: changes are staged per cart and potion with set-quantity semantics,
+# so the last change to arrive wins and each (cart, potion) becomes one row.
+#
+# Durability: a staged change is acknowledged before it reaches Postgres. It
+# is written when the buffer reaches CART_FLUSH_THRESHOLD items, when the
+# cart checks out (in the same transaction as the checkout), on reset (into
+# the season it belongs to) and on shutdown.
+# If the process dies in between, staged changes are lost; a checkout always
+# sees every change this process acknowledged for its cart before the
+# checkout began, waiting for a threshold flush that holds some of them to
+# finish. Changes that arrive for a cart once it has checked out are dropped.
+# Staging is per process, so only enable it when a cart's requests all reach
+# one worker.
+
+WRITE_BEHIND = os.environ.get("CART_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+FLUSH_THRESHOLD = int(os.environ.get("CART_FLUSH_THRESHOLD", "500"))
+
+
+class MemoryStore:
+    """Pending quantities keyed by cart_id, then potion_id."""
+
+    def __init__(self):
+        self._carts = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def stage(self, cart_id, potion_id, quantity):
+        with self._lock:
+            items = self._carts.setdefault(cart_id, {})
+            if potion_id not in items:
+                self._size += 1
+            items[potion_id] = quantity
+
+    def pop(self, cart_id):
+        with self._lock:
+            items = self._carts.pop(cart_id, {})
+            self._size -= len(items)
+        return [(cart_id, potion_id, quantity) for potion_id, quantity in items.items()]
+
+    def pop_all(self):
+        with self._lock:
+            carts, self._carts, self._size = self._carts, {}, 0
+        return [(cart_id, potion_id, quantity) for cart_id, items in carts.items() for potion_id, quantity in items.items()]
+
+    def restore(self, pending):
+        """Put back changes whose write failed, unless they were superseded."""
+        with self._lock:
+            for cart_id, potion_id, quantity in pending:
+                items = self._carts.setdefault(cart_id, {})
+                if potion_id not in items:
+                    items[potion_id] = quantity
+                    self._size += 1
+
+
+store = MemoryStore()
+
+
+def write(connection, pending):
+    """
+    Upsert staged (cart_id, potion_id, quantity) changes in one statement.
+    Changes for carts that aren't in the current season, or that have
+    checked out, are dropped. The carts are locked FOR SHARE, so a write that
+    races a checkout waits for it and then sees the cart as paid, and the
+    transaction has its xid before the line items draw their ids.
+    """
+    if not pending:
+        return
+    cart_ids, potion_ids, quantities = (list(column) for column in zip(*pending))
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO cart_items (cart_id, potion_id, quantity)
+        SELECT staged.cart_id, staged.potion_id, staged.quantity
+        FROM unnest(CAST(:cart_ids AS bigint[]), CAST(:potion_ids AS bigint[]), CAST(:quantities AS int[]))
+            AS staged (cart_id, potion_id, quantity)
+        JOIN carts ON carts.id = staged.cart_id AND carts.season_id = current_season()
+        WHERE carts.inventory_transaction_id IS NULL
+        FOR SHARE OF carts
+        ON CONFLICT (season_id, cart_id, potion_id) DO UPDATE SET quantity = EXCLUDED.quantity
+    """), {"cart_ids": cart_ids, "potion_ids": potion_ids, "quantities": quantities})
+
+
+# cart_id -> futures of the flushes in flight that hold changes for it.
+_flushing = {}
+
+
+async def flush(pending):
+    """Write pending changes, putting them back in the buffer if that fails."""
+    if not pending:
+        return
+    done = asyncio.get_running_loop().create_future()
+    cart_ids = {cart_id for cart_id, _, _ in pending}
+    for cart_id in cart_ids:
+        _flushing.setdefault(cart_id, set()).add(done)
+    try:
+        await db.run(write, pending)
+    except Exception:
+        store.restore(pending)
+        raise
+    finally:
+        for cart_id in cart_ids:
+            _flushing[cart_id].discard(done)
+            if not _flushing[cart_id]:
+                del _flushing[cart_id]
+        done.set_result(None)
+
+
+async def settle(cart_id):
+    """
+    Wait until no flush holding changes for cart_id is in flight, so its
+    changes are either committed or back in the store.
+    """
+    while cart_id in _flushing:
+        await asyncio.wait(_flushing[cart_id])
+
+
+async def flush_all():
+    """
+    Write every staged change once the flushes already in flight have
+    finished, so nothing is still being written when this returns.
+    """
+    while _flushing:
+        await asyncio.wait(set().union(*_flushing.values()))
+    await flush(store.pop_all())
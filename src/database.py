@@ -1,10 +1,213 @@
+import functools
 import os
+import threading
+import time
 import dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.pool import NullPool, QueuePool
+from starlette.concurrency import run_in_threadpool
 
-def database_connection_url():
+@functools.cache
+def load_environment():
+    """Read .env into the environment, once per process."""
     dotenv.load_dotenv()
 
+load_environment()
+
+def database_connection_url():
     return os.environ.get("POSTGRES_URI")
 
-engine = create_engine(database_connection_url(), pool_pre_ping=True)
\ No newline at end of file
+def async_connection_url(url):
+    """
+    The same database through asyncpg, e.g. postgresql+psycopg2://... becomes
+    postgresql+asyncpg://... libpq's sslmode is left out of the query, since
+    asyncpg rejects it; async_connect_args passes it on as ssl.
+    """
+    url = make_url(url).set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+    return url.render_as_string(hide_password=False)
+
+def async_connect_args(url):
+    """
+    asyncpg connect arguments for url. sslmode becomes ssl, which takes the
+    same modes (disable through verify-full). In serverless mode both
+    asyncpg's and SQLAlchemy's prepared statement caches are off: behind
+    PgBouncer in transaction mode, a statement cached on one server
+    connection may be run on another. SQLAlchemy still prepares each
+    statement by name, so PgBouncer needs max_prepared_statements (1.21+).
+    """
+    connect_args = {}
+    sslmode = make_url(url).query.get("sslmode")
+    if sslmode is not None:
+        connect_args["ssl"] = sslmode
+    if pool_mode() == "serverless":
+        connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+    return connect_args
+
+# "server" keeps a QueuePool in a long-lived uvicorn process. "serverless"
+# opens one connection per request and is meant to sit behind an external
+# pooler such as PgBouncer, since every invocation may be a fresh process.
+POOL_PRESETS = {
+    "server": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": False},
+    "serverless": {"poolclass": NullPool, "pool_pre_ping": False},
+}
+
+# Environment overrides applied on top of the preset.
+POOL_SETTINGS = {
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+    "DB_POOL_RECYCLE": ("pool_recycle", int),
+    "DB_POOL_PRE_PING": ("pool_pre_ping", lambda value: value.lower() in ("1", "true", "yes")),
+}
+
+def pool_mode():
+    return os.environ.get("POOL_MODE", "serverless" if os.environ.get("VERCEL") else "server")
+
+def pool_options():
+    options = dict(POOL_PRESETS[pool_mode()])
+    for variable, (option, parse) in POOL_SETTINGS.items():
+        value = os.environ.get(variable)
+        if value is None:
+            continue
+        if options.get("poolclass") is NullPool and option != "pool_pre_ping":
+            # NullPool has no size, overflow, timeout or recycle to tune.
+            continue
+        options[option] = parse(value)
+    return options
+
+# DATABASE_MODE=async runs database work on the event loop through an asyncpg
+# AsyncEngine instead of holding a threadpool worker per request.
+DATABASE_MODE = os.environ.get("DATABASE_MODE", "sync")
+
+# The engines are created on first use rather than at import, which keeps
+# the driver import and pool setup out of a serverless cold start and lets
+# tools import the routes without a database. db.engine and db.async_engine
+# still read like module attributes; async_engine is None in sync mode.
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _create_async_engine():
+    if DATABASE_MODE != "async":
+        return None
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = database_connection_url()
+    return create_async_engine(async_connection_url(url), connect_args=async_connect_args(url), **pool_options())
+
+_factories = {
+    "engine": lambda: create_engine(database_connection_url(), **pool_options()),
+    "async_engine": _create_async_engine,
+}
+
+def _get(name):
+    try:
+        return _engines[name]
+    except KeyError:
+        with _engines_lock:
+            if name not in _engines:
+                _engines[name] = _factories[name]()
+        return _engines[name]
+
+def get_engine():
+    return _get("engine")
+
+def get_async_engine():
+    return _get("async_engine")
+
+def __getattr__(name):
+    if name in _factories:
+        return _get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def dispose():
+    """Close the pools of whichever engines have been created."""
+    if _engines.get("async_engine") is not None:
+        await _engines["async_engine"].dispose()
+    if "engine" in _engines:
+        _engines["engine"].dispose()
+
+async def warm_up():
+    """Create the engine and open (and return) one connection ahead of the first request."""
+    await run(lambda connection: connection.exec_driver_sql("SELECT 1"))
+
+class PoolWaits:
+    """Time spent waiting for a pooled connection, across all requests."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait):
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+pool_waits = PoolWaits()
+
+async def run(fn, *args):
+    """
+    Call fn(connection, *args) inside a transaction and return its result.
+    fn is plain synchronous SQLAlchemy code either way: in sync mode it runs
+    on the threadpool, in async mode it runs against the AsyncEngine through
+    run_sync.
+    """
+    async_engine = get_async_engine()
+    if async_engine is not None:
+        start = time.perf_counter()
+        async with async_engine.connect() as connection:
+            pool_waits.record(time.perf_counter() - start)
+            async with connection.begin():
+                return await connection.run_sync(fn, *args)
+    return await run_in_threadpool(run_blocking, fn, *args)
+
+def run_blocking(fn, *args):
+    start = time.perf_counter()
+    with get_engine().connect() as connection:
+        pool_waits.record(time.perf_counter() - start)
+        with connection.begin():
+            return fn(connection, *args)
+
+def stream(statement, params, batch_size=1000):
+    """
+    Rows of statement in lists of up to batch_size, read through a server-side
+    cursor so memory stays flat however many rows there are. This is an async
+    iterator in async mode and a plain iterator (for the threadpool) otherwise.
+    """
+    if get_async_engine() is not None:
+        return _stream_async(statement, params, batch_size)
+    return _stream_blocking(statement, params, batch_size)
+
+def _stream_blocking(statement, params, batch_size):
+    with get_engine().connect() as connection:
+        with connection.begin():
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(statement, params)
+            yield from result.partitions()
+
+async def _stream_async(statement, params, batch_size):
+    async with get_async_engine().connect() as connection:
+        async with connection.begin():
+            result = await connection.stream(statement, params)
+            async for partition in result.partitions(batch_size):
+                yield partition
+
+def pool_status():
+    """Live statistics for the pool behind db.run."""
+    async_engine = get_async_engine()
+    pool = async_engine.sync_engine.pool if async_engine is not None else get_engine().pool
+    status = {
+        "mode": pool_mode(),
+        "database_mode": DATABASE_MODE,
+        "pool": type(pool).__name__,
+        "connections_acquired": pool_waits.acquired,
+        "total_wait_seconds": pool_waits.total_wait,
+        "max_wait_seconds": pool_waits.max_wait,
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return status
@@ -0,0 +1,49 @@
+from typing import NamedTuple
+from src import database as db
+from src import balances
+from src import capacity
+from src import potions
+from src import sales
+
+# Where the planners (/barrels/plan, /bottler/plan, /inventory/plan) read the
+# shop's state from. The routes get the database through FastAPI's Depends;
+# src/simulator.py calls the same route functions with simulated shops that
+# implement the same three methods.
+
+
+class ShopState(NamedTuple):
+    gold: int
+    ml: list  # red, green, blue, dark
+    potions: int
+    potion_capacity: int  # units of capacity.POTIONS_PER_UNIT
+    ml_capacity: int  # units of capacity.ML_PER_UNIT
+
+
+def load_state(connection):
+    inventory = balances.get_inventory(connection)
+    potion_units, ml_units = capacity.load_units(connection)
+    return ShopState(
+        inventory.gold,
+        [inventory.num_red_ml, inventory.num_green_ml, inventory.num_blue_ml, inventory.num_dark_ml],
+        balances.get_total_potions(connection),
+        potion_units,
+        ml_units,
+    )
+
+
+class DatabaseSource:
+    async def state(self):
+        return await db.run(load_state)
+
+    async def potion_table(self):
+        return await potions.registry.get()
+
+    async def sales_stats(self):
+        return await sales.get_stats()
+
+
+database = DatabaseSource()
+
+
+async def get_source():
+    return database
@@ -0,0 +1,19 @@
+import importlib.util
+import sys
+
+
+def module(name):
+    """
+    name, imported on first attribute access instead of now. Used for heavy
+    dependencies (numpy) that most requests never touch, so they stay out of
+    a serverless cold start. Returns the real module if it is already loaded.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    lazy = importlib.util.module_from_spec(spec)
+    sys.modules[name] = lazy
+    loader.exec_module(lazy)
+    return lazy
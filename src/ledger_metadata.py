@@ -0,0 +1,18 @@
+# What the ledgers record about a transaction besides its entries: a kind,
+# the order or cart id, and for barrel deliveries the barrel lines, which
+# appear nowhere else. See migrations/012_ledger_metadata.sql.
+
+
+def barrel_lines(barrels):
+    """A barrel delivery as parallel arrays, one per barrel_lines column."""
+    return {
+        "sku": [barrel.sku for barrel in barrels],
+        "ml_per_barrel": [barrel.ml_per_barrel for barrel in barrels],
+        "red": [barrel.potion_type[0] for barrel in barrels],
+        "green": [barrel.potion_type[1] for barrel in barrels],
+        "blue": [barrel.potion_type[2] for barrel in barrels],
+        "dark": [barrel.potion_type[3] for barrel in barrels],
+        "price": [barrel.price for barrel in barrels],
+        "quantity": [barrel.quantity for barrel in barrels],
+    }
+
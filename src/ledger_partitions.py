@@ -0,0 +1,10 @@
+import sqlalchemy
+
+# Id-range blocks inside each season's ledger partitions; see
+# migrations/010_ledger_partitions.sql.
+
+
+def ensure(connection):
+    """Add the id blocks the current season's ledgers will need next; returns how many were added."""
+    return connection.execute(sqlalchemy.text("SELECT ensure_ledger_partitions()")).scalar_one()
+
@@ -0,0 +1,165 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+
+# Per-route latency histograms, per-request SQL statement counts and DB time,
+# and the most recent slow statements, rendered in the Prometheus text format.
+# The per-statement cost is two perf_counter() calls and a few additions.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", "200")) / 1000
+SLOW_QUERY_LIMIT = 50
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.errors = 0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+_lock = threading.Lock()
+routes = {}
+slow_queries = deque(maxlen=SLOW_QUERY_LIMIT)
+
+
+def instrument(engine):
+    """Count and time every statement executed through engine (the Engine class for all of them)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+        if elapsed >= SLOW_QUERY_SECONDS:
+            slow_queries.append((elapsed, " ".join(statement.split())))
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+class RecordRequests:
+    """
+    ASGI middleware: time each request and attribute its SQL to the route.
+    The request ends when the app returns, after the last body chunk, so a
+    streamed response is timed and counted until it has been sent in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            key = (scope["method"], route_label(scope))
+            with _lock:
+                metrics = routes.get(key)
+                if metrics is None:
+                    metrics = routes[key] = RouteMetrics()
+                metrics.latency.observe(elapsed)
+                metrics.statements.observe(stats.statements)
+                metrics.db_seconds += stats.db_seconds
+                if status >= 500:
+                    metrics.errors += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", " ")
+
+
+def _histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def render(gauges=None):
+    """
+    Everything recorded so far in the Prometheus text exposition format.
+    gauges adds extra name -> value samples, e.g. pool statistics.
+    """
+    with _lock:
+        snapshot = sorted(routes.items())
+        slow = list(slow_queries)
+
+    lines = ["# TYPE http_request_duration_seconds histogram"]
+    for (method, path), metrics in snapshot:
+        _histogram(lines, "http_request_duration_seconds", f'method="{method}",route="{_escape(path)}"', metrics.latency)
+    lines.append("# TYPE http_request_sql_statements histogram")
+    for (method, path), metrics in snapshot:
+        _histogram(lines, "http_request_sql_statements", f'method="{method}",route="{_escape(path)}"', metrics.statements)
+    lines.append("# TYPE http_request_db_seconds_total counter")
+    for (method, path), metrics in snapshot:
+        lines.append(f'http_request_db_seconds_total{{method="{method}",route="{_escape(path)}"}} {metrics.db_seconds}')
+    lines.append("# TYPE http_request_errors_total counter")
+    for (method, path), metrics in snapshot:
+        lines.append(f'http_request_errors_total{{method="{method}",route="{_escape(path)}"}} {metrics.errors}')
+    lines.append("# TYPE db_slow_query_seconds gauge")
+    for elapsed, statement in slow:
+        lines.append(f'db_slow_query_seconds{{sql="{_escape(statement)}"}} {elapsed}')
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
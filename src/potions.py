@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+import sqlalchemy
+from src import database as db
+from src import lazy
+
+np = lazy.module("numpy")
+
+# Process-wide copy of the potions table, indexed by id, sku and recipe.
+# Columns are NumPy arrays in id order (ids are found by binary search) and
+# recipes are packed into one int64 key, so the only per-potion Python
+# objects are the sku strings and their dict entries. potions_version is
+# bumped by a trigger on every change; it is read at most every REFRESH_SECONDS
+# and the table is only reloaded when it moved.
+
+REFRESH_SECONDS = float(os.environ.get("POTION_REGISTRY_TTL", "5"))
+
+
+def recipe_key(potion_type):
+    """Pack [red, green, blue, dark] (each 0..100) into a single int."""
+    red, green, blue, dark = (int(ml) for ml in potion_type)
+    return (red << 48) | (green << 32) | (blue << 16) | dark
+
+
+class PotionTable:
+    """An immutable snapshot of the potions table."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.skus = [row.sku for row in rows]
+        self.prices = np.array([row.price for row in rows], dtype=np.int32)
+        self.recipes = np.array([[row.red, row.green, row.blue, row.dark] for row in rows],
+                                dtype=np.int32).reshape(-1, 4)
+        self._by_sku = {sku: i for i, sku in enumerate(self.skus)}
+        self._by_recipe = {recipe_key(recipe): i for i, recipe in enumerate(self.recipes.tolist())}
+
+    def __len__(self):
+        return len(self.skus)
+
+    def row_by_id(self, potion_id):
+        i = int(np.searchsorted(self.ids, potion_id))
+        return i if i < len(self.ids) and self.ids[i] == potion_id else None
+
+    def row_by_sku(self, sku):
+        return self._by_sku.get(sku)
+
+    def row_by_recipe(self, potion_type):
+        return self._by_recipe.get(recipe_key(potion_type))
+
+    def id_of(self, sku):
+        i = self._by_sku.get(sku)
+        return int(self.ids[i]) if i is not None else None
+
+    def sku_of_recipe(self, potion_type):
+        i = self.row_by_recipe(potion_type)
+        return self.skus[i] if i is not None else None
+
+
+class PotionRegistry:
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._table = None
+        self._checked_at = None
+
+    async def get(self):
+        """The current table, reloading it first if potions changed."""
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+                return self._table
+        return await db.run(self.refresh)
+
+    def refresh(self, connection):
+        version = connection.execute(sqlalchemy.text("SELECT version FROM potions_version")).scalar_one()
+        table = self._table
+        if table is None or table.version != version:
+            rows = connection.execute(sqlalchemy.text(
+                "SELECT id, sku, price, red, green, blue, dark FROM potions ORDER BY id"
+            )).fetchall()
+            table = PotionTable(version, rows)
+        with self._lock:
+            if self._table is not table:
+                self.reloads += 1
+            self._table = table
+            self._checked_at = time.monotonic()
+        return table
+
+    def stats(self):
+        table = self._table
+        return {
+            "potions": len(table) if table is not None else 0,
+            "version": table.version if table is not None else None,
+            "reloads": self.reloads,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+registry = PotionRegistry(REFRESH_SECONDS)
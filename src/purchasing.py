@@ -0,0 +1,134 @@
+import math
+
+# Optimal barrel purchasing. Every barrel is pure in one color, so the problem
+# splits into a bounded knapsack per color (cheapest way to buy each amount of
+# ml of that color) followed by a small group knapsack across the colors
+# (most total ml within the gold budget and the free ml capacity).
+
+COLORS = ["red", "green", "blue", "dark"]
+
+# Upper bound on ml "units" per color to keep the tables small. The unit is
+# the gcd of the barrel sizes, coarsened (rounding barrel sizes up) only when
+# the capacity would need more units than this.
+MAX_UNITS = 500
+
+INF = float("inf")
+
+
+def barrel_color(potion_type):
+    """Index into COLORS of a pure barrel, or None for a mixed one."""
+    if sorted(potion_type) != [0, 0, 0, 1]:
+        return None
+    return potion_type.index(1)
+
+
+def color_caps(ml_by_color, ml_capacity, shares=None):
+    """
+    How much ml of each color is still useful: each color may fill its share
+    of the capacity (equal shares by default).
+    """
+    shares = shares or [1 / len(COLORS)] * len(COLORS)
+    return [max(0, int(ml_capacity * share) - ml) for share, ml in zip(shares, ml_by_color)]
+
+
+def _unit(barrels, free_ml):
+    unit = 0
+    for barrel in barrels:
+        unit = math.gcd(unit, barrel.ml_per_barrel)
+    unit = max(unit, 1)
+    while free_ml // unit > MAX_UNITS:
+        unit *= 2
+    return unit
+
+
+def _cheapest_per_amount(barrels, unit, cap_units):
+    """
+    Bounded knapsack for one color: cost[m] is the least gold that buys
+    exactly m units, and the returned function rebuilds the barrels for m.
+    Quantities are split into powers of two so each piece is a 0/1 item.
+    """
+    pieces = []
+    for barrel in barrels:
+        units = math.ceil(barrel.ml_per_barrel / unit)
+        remaining, size = barrel.quantity, 1
+        while remaining > 0:
+            count = min(size, remaining)
+            pieces.append((barrel.sku, count, units * count, barrel.price * count))
+            remaining -= count
+            size *= 2
+
+    cost = [0] + [INF] * cap_units
+    taken = []
+    for _, _, units, price in pieces:
+        took = set()
+        for m in range(cap_units, units - 1, -1):
+            if cost[m - units] + price < cost[m]:
+                cost[m] = cost[m - units] + price
+                took.add(m)
+        taken.append(took)
+
+    def rebuild(m):
+        bought = {}
+        for (sku, count, units, _), took in zip(reversed(pieces), reversed(taken)):
+            if m in took:
+                bought[sku] = bought.get(sku, 0) + count
+                m -= units
+        return bought
+
+    return cost, rebuild
+
+
+def plan_barrels(catalog, gold, ml_by_color, ml_capacity, shares=None):
+    """
+    Pick barrels (and how many of each) that add the most ml, subject to the
+    gold budget, the free ml capacity, each color's useful share and the
+    quantity on offer. Ties go to the cheaper plan.
+    """
+    free_ml = max(0, ml_capacity - sum(ml_by_color))
+    barrels = [barrel for barrel in catalog
+               if barrel.ml_per_barrel > 0 and barrel.quantity > 0 and barrel.price <= gold
+               and barrel_color(barrel.potion_type) is not None]
+    if not barrels or free_ml == 0:
+        return []
+
+    unit = _unit(barrels, free_ml)
+    free_units = free_ml // unit
+    caps = color_caps(ml_by_color, ml_capacity, shares)
+
+    per_color = []
+    for color, cap in enumerate(caps):
+        cap_units = min(cap // unit, free_units)
+        color_barrels = [barrel for barrel in barrels if barrel_color(barrel.potion_type) == color]
+        per_color.append(_cheapest_per_amount(color_barrels, unit, cap_units))
+
+    # best[t] is the least gold that buys t units in total across the colors
+    # handled so far; picks[c][t] is how many units color c contributed.
+    best = [0] + [INF] * free_units
+    picks = []
+    for cost, _ in per_color:
+        amounts = [m for m, gold_needed in enumerate(cost) if gold_needed <= gold]
+        merged = [INF] * (free_units + 1)
+        pick = [0] * (free_units + 1)
+        for t, spent in enumerate(best):
+            if spent > gold:
+                continue
+            for m in amounts:
+                if t + m > free_units:
+                    break
+                total = spent + cost[m]
+                if total < merged[t + m]:
+                    merged[t + m] = total
+                    pick[t + m] = m
+        best = merged
+        picks.append(pick)
+
+    t = max(t for t, spent in enumerate(best) if spent <= gold)
+    plan = {}
+    for (_, rebuild), pick in zip(reversed(per_color), reversed(picks)):
+        m = pick[t]
+        for sku, quantity in rebuild(m).items():
+            plan[sku] = plan.get(sku, 0) + quantity
+        t -= m
+
+    return [{"sku": sku, "quantity": quantity} for sku, quantity in plan.items()]
+
@@ -0,0 +1,81 @@
+import os
+import sqlalchemy
+from src import database as db
+from src import lazy
+from src.cache import CachedValue
+
+np = lazy.module("numpy")
+
+# Sales statistics over the last WINDOW_HOURS of sales_hourly, which checkout
+# keeps up to date. The aggregate is loaded at most every SALES_STATS_TTL
+# seconds; after that every lookup is a dict access.
+
+WINDOW_HOURS = int(os.environ.get("SALES_WINDOW_HOURS", "72"))
+
+
+class SalesStats:
+    def __init__(self, rows, window_hours):
+        self.window_hours = window_hours
+        self.by_sku = {}
+        self.by_class = {}
+        for row in rows:
+            self.by_sku[row.potion_sku] = self.by_sku.get(row.potion_sku, 0) + row.quantity
+            by_sku = self.by_class.setdefault(row.character_class, {})
+            by_sku[row.potion_sku] = by_sku.get(row.potion_sku, 0) + row.quantity
+        self.ranking = sorted(self.by_sku, key=lambda sku: (-self.by_sku[sku], sku))
+        self._rank = {sku: i for i, sku in enumerate(self.ranking)}
+
+    def velocity(self, sku):
+        """Potions of sku sold per hour over the window."""
+        return self.by_sku.get(sku, 0) / self.window_hours
+
+    def rank(self, sku):
+        """0 for the best seller; skus that haven't sold rank after all that have."""
+        return self._rank.get(sku, len(self.ranking))
+
+    def demand(self, skus):
+        """
+        Relative demand per sku, averaging 1. Unsold skus still get half the
+        average so new recipes keep being tried. None before any sales.
+        """
+        sold = np.array([self.by_sku.get(sku, 0) for sku in skus], dtype=np.float64)
+        if not sold.any():
+            return None
+        mean = sold.mean()
+        return (sold + mean) / (2 * mean)
+
+    def color_shares(self, table):
+        """
+        Share of the ml sold per color (red, green, blue, dark), blended
+        evenly with equal shares. None before any sales.
+        """
+        sold = np.array([self.by_sku.get(sku, 0) for sku in table.skus], dtype=np.float64)
+        ml = sold @ table.recipes if len(sold) else np.zeros(4)
+        if not ml.any():
+            return None
+        return (0.5 * ml / ml.sum() + 0.5 / 4).tolist()
+
+    def summary(self):
+        return {
+            "window_hours": self.window_hours,
+            "ranking": [{"sku": sku, "sold": self.by_sku[sku]} for sku in self.ranking],
+            "by_character_class": self.by_class,
+        }
+
+
+def load_stats(connection):
+    rows = connection.execute(sqlalchemy.text("""
+        SELECT potion_sku, character_class, CAST(SUM(quantity) AS bigint) AS quantity
+        FROM sales_hourly
+        WHERE season_id = current_season()
+            AND hour >= date_trunc('hour', now()) - make_interval(hours => CAST(:window_hours AS int))
+        GROUP BY potion_sku, character_class
+    """), {"window_hours": WINDOW_HOURS}).fetchall()
+    return SalesStats(rows, WINDOW_HOURS)
+
+
+stats_cache = CachedValue(ttl=float(os.environ.get("SALES_STATS_TTL", "30")))
+
+
+async def get_stats():
+    return await stats_cache.get(lambda: db.run(load_stats))
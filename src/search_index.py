@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import defaultdict
+import sqlalchemy
+
+# "trigram" leaves the ILIKE filters to Postgres (fast with the pg_trgm
+# indexes from migrations/003_search_trigram.sql). "ngram" resolves them to
+# ids with the in-process indexes below, for databases without pg_trgm.
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "trigram")
+
+# Past this many candidates an id list is slower than letting Postgres filter.
+MAX_MATCHES = 10000
+
+
+class NgramIndex:
+    """
+    Case-insensitive substring index over one text column. Rows are pulled in
+    incrementally by id, so a lookup only fetches rows added since the last one.
+    """
+
+    def __init__(self, sql, n=3):
+        self.sql = sqlalchemy.text(sql)
+        self.n = n
+        self.texts = {}
+        self.grams = defaultdict(set)
+        self.last_id = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, key, text):
+        text = (text or "").lower()
+        self.texts[key] = text
+        for gram in self._grams(text):
+            self.grams[gram].add(key)
+        self.last_id = max(self.last_id, key)
+
+    def clear(self):
+        with self._lock:
+            self.texts.clear()
+            self.grams.clear()
+            self.last_id = 0
+            self._generation += 1
+
+    def refresh(self, connection):
+        # Query without holding the lock: in async mode the query yields to
+        # the event loop, and a concurrent search blocking on the lock would
+        # stall the loop with it. Overlapping refreshes just add rows twice.
+        with self._lock:
+            last_id, generation = self.last_id, self._generation
+        rows = connection.execute(self.sql, {"last_id": last_id}).fetchall()
+        with self._lock:
+            # Don't add rows read before a clear() landed.
+            if generation == self._generation:
+                for row in rows:
+                    self.add(row.id, row.text)
+
+    def lookup(self, term):
+        """
+        Ids whose text contains term, or None if term is too short to use
+        the index.
+        """
+        term = term.lower()
+        grams = self._grams(term)
+        if not grams:
+            return None
+        with self._lock:
+            # Intersect the rarest posting lists first.
+            postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    break
+            return [key for key in candidates if term in self.texts[key]]
+
+    def match(self, connection, term):
+        """
+        Refresh and look up term. Returns None when the caller should fall
+        back to filtering in SQL.
+        """
+        self.refresh(connection)
+        matches = self.lookup(term)
+        if matches is None or len(matches) > MAX_MATCHES:
+            return None
+        return matches
+
+
+customer_index = NgramIndex(
+    "SELECT id, customer_name AS text FROM carts WHERE season_id = current_season() AND id > :last_id ORDER BY id"
+)
+potion_index = NgramIndex("SELECT id, sku AS text FROM potions WHERE id > :last_id ORDER BY id")
+
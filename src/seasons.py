@@ -0,0 +1,71 @@
+import logging
+import sqlalchemy
+from src import database as db
+
+# Seasons partition everything admin reset used to delete; see
+# migrations/009_seasons.sql. Reads filter on season_id = current_season(),
+# which Postgres resolves once per statement to prune every other season.
+
+
+def start(connection):
+    """Start a new, empty season and return its id."""
+    return connection.execute(sqlalchemy.text("SELECT start_season()")).scalar_one()
+
+
+def list_seasons(connection):
+    rows = connection.execute(sqlalchemy.text("""
+        SELECT id, started_at, archived_at, archive, id = current_season() AS current
+        FROM seasons
+        ORDER BY id
+    """))
+    return [dict(row._mapping) for row in rows]
+
+
+def archive(season_id, drop=False):
+    """
+    Detach a past season's partitions and move them to the archive schema,
+    or drop them. Each DETACH ... CONCURRENTLY runs in its own transaction so
+    live traffic on the current season is never blocked; this is meant to
+    run in the background.
+    """
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        current = connection.execute(sqlalchemy.text("SELECT current_season()")).scalar_one()
+        if season_id >= current:
+            raise ValueError(f"Season {season_id} is not a past season")
+
+        tables = connection.execute(sqlalchemy.text("SELECT unnest(season_tables())")).scalars().all()
+        for table in tables:
+            partition = f"{table}_season_{season_id}"
+            attached = connection.execute(sqlalchemy.text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:partition)
+                )
+            """), {"partition": partition}).scalar_one()
+            if attached:
+                connection.execute(sqlalchemy.text(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}" CONCURRENTLY'))
+            if connection.execute(sqlalchemy.text("SELECT to_regclass(:partition)"), {"partition": partition}).scalar() is None:
+                continue
+            # A detached partition keeps its foreign keys into the season
+            # tables, which would stop the referenced partitions detaching.
+            foreign_keys = connection.execute(sqlalchemy.text("""
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = to_regclass(:partition) AND contype = 'f'
+            """), {"partition": partition}).scalars().all()
+            for name in foreign_keys:
+                connection.execute(sqlalchemy.text(f'ALTER TABLE "{partition}" DROP CONSTRAINT "{name}"'))
+            if drop:
+                connection.execute(sqlalchemy.text(f'DROP TABLE "{partition}"'))
+                continue
+            # Ledger partitions have id blocks of their own to move along.
+            blocks = connection.execute(sqlalchemy.text("""
+                SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:partition)
+            """), {"partition": partition}).scalars().all()
+            connection.execute(sqlalchemy.text(f'ALTER TABLE "{partition}" SET SCHEMA archive'))
+            for block in blocks:
+                connection.execute(sqlalchemy.text(f'ALTER TABLE "{block}" SET SCHEMA archive'))
+
+        connection.execute(sqlalchemy.text("""
+            UPDATE seasons SET archived_at = now(), archive = :archive WHERE id = :season_id
+        """), {"season_id": season_id, "archive": "dropped" if drop else "archive"})
+    logging.info(f"Season {season_id} {'dropped' if drop else 'archived'}")
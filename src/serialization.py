@@ -0,0 +1,40 @@
+import orjson
+from decimal import Decimal
+from fastapi.responses import Response
+
+# JSON encoding for responses. The app's default response class is
+# ORJSONResponse, but FastAPI still runs every returned value through
+# jsonable_encoder (and validates it against response_model) first. Routes
+# that return rows straight from the database, which need neither, encode
+# them here and return JSONBytes: FastAPI passes a Response through as is,
+# and the route's response_model only documents the shape.
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value, option=0):
+    """value as JSON bytes. datetimes, numpy values and Decimals are handled."""
+    return orjson.dumps(value, default=_default, option=OPTIONS | option)
+
+
+def ndjson(rows):
+    """Rows (SQLAlchemy Rows) as newline delimited JSON bytes."""
+    return b"".join(orjson.dumps(row._asdict(), default=_default, option=OPTIONS | orjson.OPT_APPEND_NEWLINE)
+                    for row in rows)
+
+
+class JSONBytes(Response):
+    """A response whose content is already encoded JSON."""
+
+    media_type = "application/json"
+
+
+def json_response(content):
+    return JSONBytes(dumps(content))
+
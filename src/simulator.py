@@ -0,0 +1,313 @@
+import argparse
+import ast
+import asyncio
+import json
+import time
+from collections import namedtuple
+import numpy as np
+from src import capacity
+from src import potions
+from src import sales
+from src.api import barrels, bottler, catalog, inventory
+from src.inventory_source import ShopState
+
+# Offline economy simulator. Runs the shop's daily cycle (capacity plan,
+# wholesale catalog and barrel plan, bottling, customers, checkout) for many
+# independent seasons, entirely in memory. Gold, ml, stock, capacity and sales
+# of every season are NumPy arrays. The decisions come from the real route
+# functions (inventory.get_capacity_plan, barrels.get_wholesale_purchase_plan
+# and bottler.get_bottle_plan), which are passed a SimulatedShop in place of
+# the database through their source argument; those are called once per
+# season and day in a Python loop, and make up most of the run time. Only the
+# customers are simulated for all seasons at once, as array operations.
+#
+#   python -m src.simulator --seasons 1000 --days 7
+#   python -m src.simulator --set barrels.GOLD_RESERVES="((1000, 0.3),)"
+#   python -m src.simulator --sweep capacity.FILL_THRESHOLD="[0.6, 0.8, 1.1]"
+#
+# Every configuration in a sweep sees the same random customers and barrel
+# offers, so differences come from the planners alone.
+
+STARTING_GOLD = 100
+
+# The potions schema.sql starts with.
+POTIONS = [
+    ("RED_POTION", 50, (100, 0, 0, 0)),
+    ("GREEN_POTION", 50, (0, 100, 0, 0)),
+    ("BLUE_POTION", 50, (0, 0, 100, 0)),
+    ("DARK_POTION", 60, (0, 0, 0, 100)),
+    ("PURPLE_POTION", 55, (50, 0, 50, 0)),
+    ("TEAL_POTION", 55, (0, 50, 50, 0)),
+]
+
+# Each class wants one blend of colors, pays up to value gold for an exact
+# match (less the further a potion is from it) and visits visitors times a
+# day on average.
+CustomerClass = namedtuple("CustomerClass", "name preference value visitors")
+CLASSES = [
+    CustomerClass("Barbarian", (100, 0, 0, 0), 70, 20.0),
+    CustomerClass("Fighter", (75, 0, 25, 0), 65, 16.0),
+    CustomerClass("Druid", (0, 100, 0, 0), 65, 16.0),
+    CustomerClass("Ranger", (0, 75, 25, 0), 60, 16.0),
+    CustomerClass("Wizard", (0, 0, 100, 0), 80, 20.0),
+    CustomerClass("Sorcerer", (50, 0, 50, 0), 85, 12.0),
+    CustomerClass("Cleric", (0, 50, 50, 0), 75, 12.0),
+    CustomerClass("Warlock", (0, 0, 0, 100), 100, 8.0),
+    CustomerClass("Rogue", (25, 25, 0, 50), 70, 12.0),
+    CustomerClass("Bard", (34, 33, 33, 0), 60, 12.0),
+]
+
+# (size, ml, price) per color; dark only comes in large barrels.
+BARREL_SIZES = [("MINI", 200, 60), ("SMALL", 500, 100), ("MEDIUM", 2500, 250), ("LARGE", 10000, 500)]
+DARK_BARREL = ("LARGE", 10000, 750)
+
+PotionRow = namedtuple("PotionRow", "id sku price red green blue dark")
+SalesRow = namedtuple("SalesRow", "potion_sku character_class quantity")
+
+
+def potion_table():
+    rows = [PotionRow(i + 1, sku, price, *recipe) for i, (sku, price, recipe) in enumerate(POTIONS)]
+    return potions.PotionTable(0, rows)
+
+
+def wholesale_catalog(rng):
+    """Today's offer: every barrel, in a random quantity (sometimes sold out)."""
+    offer = []
+    for color, name in enumerate(["RED", "GREEN", "BLUE", "DARK"]):
+        potion_type = [int(c == color) for c in range(4)]
+        for size, ml, price in [DARK_BARREL] if name == "DARK" else BARREL_SIZES:
+            offer.append(barrels.Barrel(sku=f"{size}_{name}_BARREL", ml_per_barrel=ml, potion_type=potion_type,
+                                        price=price, quantity=int(rng.integers(0, 11))))
+    return offer
+
+
+class Simulation:
+    """seasons independent shops, stepped one day at a time."""
+
+    def __init__(self, seasons, seed):
+        self.rng = np.random.default_rng(seed)
+        self.table = potion_table()
+        self.recipes = self.table.recipes.astype(np.int64)
+        self.prices = self.table.prices.astype(np.int64)
+        recipe_count = len(self.table)
+        window_days = max(1, sales.WINDOW_HOURS // 24)
+
+        self.gold = np.full(seasons, STARTING_GOLD, dtype=np.int64)
+        self.ml = np.zeros((seasons, 4), dtype=np.int64)
+        self.stock = np.zeros((seasons, recipe_count), dtype=np.int64)
+        self.potion_units = np.ones(seasons, dtype=np.int64)
+        self.ml_units = np.ones(seasons, dtype=np.int64)
+        # Daily sales per class and recipe over the statistics window.
+        self.sales = np.zeros((window_days, seasons, len(CLASSES), recipe_count), dtype=np.int64)
+
+        self.sold = np.zeros(seasons, dtype=np.int64)
+        self.revenue = np.zeros(seasons, dtype=np.int64)
+        self.turned_away = np.zeros(seasons, dtype=np.int64)
+        self.capacity_bought = np.zeros(seasons, dtype=np.int64)
+        self.rejected = np.zeros(seasons, dtype=np.int64)
+
+        # How much each class would pay for each recipe: value scaled by how
+        # close the recipe is to its preference (L1 distance, 0..200 ml).
+        preference = np.array([customer.preference for customer in CLASSES], dtype=np.int64)
+        distance = np.abs(preference[:, None, :] - self.recipes[None, :, :]).sum(axis=2)
+        value = np.array([customer.value for customer in CLASSES], dtype=np.float64)
+        self.utility = value[:, None] * (1 - distance / 200) - self.prices[None, :]
+        self.visitors = np.array([customer.visitors for customer in CLASSES])
+
+    def shop(self, season):
+        return SimulatedShop(self, season)
+
+    async def plan(self, offer):
+        """Ask the real planners for each season's decisions in turn and apply them."""
+        by_sku = {barrel.sku: barrel for barrel in offer}
+        for season in range(len(self.gold)):
+            shop = self.shop(season)
+
+            units = await inventory.get_capacity_plan(source=shop)
+            cost = capacity.PRICE * (units["potion_capacity"] + units["ml_capacity"])
+            if cost > self.gold[season]:
+                self.rejected[season] += 1
+            else:
+                self.gold[season] -= cost
+                self.potion_units[season] += units["potion_capacity"]
+                self.ml_units[season] += units["ml_capacity"]
+                self.capacity_bought[season] += units["potion_capacity"] + units["ml_capacity"]
+
+            plan = await barrels.get_wholesale_purchase_plan(offer, source=shop)
+            cost, added = 0, np.zeros(4, dtype=np.int64)
+            for line in plan:
+                barrel = by_sku[line["sku"]]
+                cost += barrel.price * line["quantity"]
+                added[barrel.potion_type.index(1)] += barrel.ml_per_barrel * line["quantity"]
+            if (cost > self.gold[season] or any(line["quantity"] > by_sku[line["sku"]].quantity for line in plan)
+                    or (self.ml[season] + added).sum() > self.ml_units[season] * capacity.ML_PER_UNIT):
+                self.rejected[season] += 1
+            else:
+                self.gold[season] -= cost
+                self.ml[season] += added
+
+            plan = await bottler.get_bottle_plan(source=shop)
+            counts = np.zeros(len(self.table), dtype=np.int64)
+            for line in plan:
+                counts[self.table.row_by_recipe(line["potion_type"])] += line["quantity"]
+            used = counts @ self.recipes
+            if (np.any(used > self.ml[season])
+                    or self.stock[season].sum() + counts.sum() > self.potion_units[season] * capacity.POTIONS_PER_UNIT):
+                self.rejected[season] += 1
+            else:
+                self.ml[season] -= used
+                self.stock[season] += counts
+
+    def trade(self):
+        """
+        One day of customers in every season at once. The catalog is the
+        best selling stocked potions (as /catalog/ ranks them); each visitor
+        buys one of the catalog potion worth the most to them, if any is
+        worth its price.
+        """
+        seasons = len(self.gold)
+        # Stocked potions first, then by sales and stock, like load_catalog.
+        stocked = self.stock > 0
+        order = np.lexsort((-self.stock, -self.sales.sum(axis=(0, 2)), ~stocked), axis=1)
+        listed = np.zeros_like(stocked)
+        np.put_along_axis(listed, order[:, :catalog.CATALOG_SIZE], True, axis=1)
+        listed &= stocked
+
+        today = np.zeros((seasons, len(CLASSES), len(self.table)), dtype=np.int64)
+        rows = np.arange(seasons)
+        for customer in self.rng.permutation(len(CLASSES)):
+            arrivals = self.rng.poisson(self.visitors[customer], size=seasons)
+            utility = np.where(listed & (self.stock > 0), self.utility[customer][None, :], -np.inf)
+            choice = utility.argmax(axis=1)
+            buys = np.where(utility[rows, choice] > 0, arrivals, 0)
+            bought = np.minimum(buys, self.stock[rows, choice])
+            self.turned_away += arrivals - bought
+            self.stock[rows, choice] -= bought
+            today[rows, customer, choice] += bought
+
+        revenue = today.sum(axis=1) @ self.prices
+        self.gold += revenue
+        self.revenue += revenue
+        self.sold += today.sum(axis=(1, 2))
+        self.sales = np.roll(self.sales, 1, axis=0)
+        self.sales[0] = today
+
+    def run(self, days):
+        async def days_of_trading():
+            for _ in range(days):
+                await self.plan(wholesale_catalog(self.rng))
+                self.trade()
+
+        asyncio.run(days_of_trading())
+
+    def score(self):
+        gold = np.sort(self.gold)
+        return {
+            "final_gold_mean": round(float(gold.mean()), 1),
+            "final_gold_p10": int(np.percentile(gold, 10)),
+            "final_gold_p50": int(np.percentile(gold, 50)),
+            "final_gold_p90": int(np.percentile(gold, 90)),
+            "stock_value_mean": round(float((self.stock @ self.prices).mean()), 1),
+            "potions_sold_mean": round(float(self.sold.mean()), 1),
+            "turned_away_share": round(float(self.turned_away.sum() / max(1, self.turned_away.sum() + self.sold.sum())), 3),
+            "capacity_units_bought_mean": round(float(self.capacity_bought.mean()), 2),
+            "rejected_plans": int(self.rejected.sum()),
+        }
+
+
+class SimulatedShop:
+    """One season of a Simulation, as the planners' inventory source."""
+
+    def __init__(self, simulation, season):
+        self.simulation = simulation
+        self.season = season
+        self.stats = None
+
+    async def state(self):
+        simulation, season = self.simulation, self.season
+        return ShopState(int(simulation.gold[season]), simulation.ml[season].tolist(),
+                         int(simulation.stock[season].sum()), int(simulation.potion_units[season]),
+                         int(simulation.ml_units[season]))
+
+    async def potion_table(self):
+        return self.simulation.table
+
+    async def sales_stats(self):
+        # Like the API's cached copy, built once per shop and day.
+        if self.stats is None:
+            simulation = self.simulation
+            sold = simulation.sales[:, self.season].sum(axis=0)
+            rows = [SalesRow(simulation.table.skus[recipe], CLASSES[customer].name, int(sold[customer, recipe]))
+                    for customer, recipe in zip(*np.nonzero(sold))]
+            self.stats = sales.SalesStats(rows, sales.WINDOW_HOURS)
+        return self.stats
+
+
+# Planner settings that --set and --sweep may change, by module.
+TUNABLE = {"barrels": barrels, "bottler": bottler, "capacity": capacity}
+# The simulated day bottles once, not every four hours.
+DEFAULT_SETTINGS = [(capacity, "RESTOCK_HOURS", 24)]
+
+
+def parse_setting(text):
+    """"module.NAME=literal" -> (module, name, value)."""
+    target, _, literal = text.partition("=")
+    module_name, _, name = target.partition(".")
+    module = TUNABLE.get(module_name)
+    if module is None or not hasattr(module, name):
+        raise SystemExit(f"unknown setting {target}; expected one of {', '.join(TUNABLE)} followed by .NAME")
+    return module, name, ast.literal_eval(literal)
+
+
+def simulate(seasons, days, seed, settings):
+    """Run one configuration; settings are restored afterwards."""
+    settings = DEFAULT_SETTINGS + list(settings)
+    saved = [(module, name, getattr(module, name)) for module, name, _ in settings]
+    try:
+        for module, name, value in settings:
+            setattr(module, name, value)
+        simulation = Simulation(seasons, seed)
+        start = time.perf_counter()
+        simulation.run(days)
+        result = simulation.score()
+        result["seconds"] = round(time.perf_counter() - start, 2)
+        return result
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.simulator", description="Simulate seasons of the shop offline.")
+    parser.add_argument("--seasons", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", default=[], metavar="MODULE.NAME=VALUE",
+                        help="override a planner setting, e.g. bottler.ML_RESERVE=0.1")
+    parser.add_argument("--sweep", metavar="MODULE.NAME=[V1, V2, ...]", help="run once per value")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    settings = [parse_setting(text) for text in args.set]
+    runs = []
+    if args.sweep:
+        module, name, values = parse_setting(args.sweep)
+        for value in values:
+            runs.append((f"{module.__name__.rsplit('.', 1)[-1]}.{name}={value!r}", settings + [(module, name, value)]))
+    else:
+        runs.append(("current settings", settings))
+
+    results = {label: simulate(args.seasons, args.days, args.seed, run_settings) for label, run_settings in runs}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.seasons} seasons of {args.days} days, seed {args.seed}")
+    for label, result in results.items():
+        print(f"\n{label}")
+        for key, value in result.items():
+            print(f"  {key:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
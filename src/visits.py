@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import sqlalchemy
+from src import database as db
+
+# Visits are written with one statement per visit: the customers go in as
+# parallel arrays and are unnested server side. With VISITS_BACKGROUND=1 the
+# write happens on a background task fed by a bounded queue, so the request
+# returns as soon as the visit is queued; when the queue is full the request
+# writes inline instead, which pushes back on the caller rather than growing
+# memory. Queued visits that haven't been written yet are lost if the process
+# dies; without VISITS_BACKGROUND a request only returns once its visit is
+# committed.
+
+VISITS_BACKGROUND = os.environ.get("VISITS_BACKGROUND", "").lower() in ("1", "true", "yes")
+QUEUE_SIZE = int(os.environ.get("VISITS_QUEUE_SIZE", "100"))
+
+
+def record_visit(connection, visit_id, customers):
+    """Insert a visit and its customers; a visit_id already recorded is a no-op."""
+    connection.execute(sqlalchemy.text("""
+        WITH visit AS (
+            INSERT INTO visits (visit_id, customers)
+            VALUES (:visit_id, :count)
+            ON CONFLICT (season_id, visit_id) DO NOTHING
+            RETURNING visit_id
+        )
+        INSERT INTO visit_customers (visit_id, position, customer_name, character_class, level)
+        SELECT visit.visit_id, c.position, c.customer_name, c.character_class, c.level
+        FROM visit,
+            unnest(CAST(:names AS text[]), CAST(:classes AS text[]), CAST(:levels AS int[]))
+                WITH ORDINALITY AS c (customer_name, character_class, level, position)
+    """), {
+        "visit_id": visit_id,
+        "count": len(customers),
+        "names": [customer.customer_name for customer in customers],
+        "classes": [customer.character_class for customer in customers],
+        "levels": [customer.level for customer in customers],
+    })
+
+
+class VisitWriter:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.queued = 0
+        self.inline = 0
+        self.failed = 0
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker = asyncio.create_task(self._drain())
+
+    async def stop(self):
+        """Write everything still queued, then stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        self._worker = None
+
+    async def submit(self, visit_id, customers):
+        if self._worker is not None:
+            try:
+                self._queue.put_nowait((visit_id, customers))
+                self.queued += 1
+                return
+            except asyncio.QueueFull:
+                pass
+        self.inline += 1
+        await db.run(record_visit, visit_id, customers)
+
+    async def _drain(self):
+        while True:
+            visit_id, customers = await self._queue.get()
+            try:
+                await db.run(record_visit, visit_id, customers)
+            except Exception:
+                self.failed += 1
+                logging.exception(f"Failed to record visit {visit_id}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "queued": self.queued,
+            "inline": self.inline,
+            "failed": self.failed,
+        }
+
+
+writer = VisitWriter(QUEUE_SIZE)
+
@@ -0,0 +1,81 @@
+import os
+import re
+from pathlib import Path
+
+import pytest
+import sqlalchemy
+
+# Tests that need Postgres run against a throwaway database created on the
+# server TEST_POSTGRES_URI points at (any database on it will do), e.g.
+#
+#   TEST_POSTGRES_URI=postgresql+psycopg2://postgres@/postgres?host=/tmp pytest
+#
+# and are skipped without it. schema.sql and migrations/ are applied first,
+# skipping migrations whose extension isn't installed, and the app is pointed
+# at the database through POSTGRES_URI before anything connects.
+
+ROOT = Path(__file__).resolve().parent.parent
+DATABASE = "potions_test"
+API_KEY = "test-key"
+
+_database_url = None
+
+
+def _create_database(server_url):
+    server = sqlalchemy.make_url(server_url)
+    admin = sqlalchemy.create_engine(server, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {DATABASE} WITH (FORCE)"))
+        connection.execute(sqlalchemy.text(f"CREATE DATABASE {DATABASE}"))
+    admin.dispose()
+    url = server.set(database=DATABASE).render_as_string(hide_password=False)
+
+    engine = sqlalchemy.create_engine(url, isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        available = set(connection.execute(sqlalchemy.text("SELECT name FROM pg_available_extensions")).scalars())
+        for path in [ROOT / "schema.sql"] + sorted((ROOT / "migrations").glob("*.sql")):
+            sql = path.read_text()
+            if any(name not in available for name in re.findall(r"CREATE EXTENSION IF NOT EXISTS (\w+)", sql)):
+                continue
+            connection.connection.dbapi_connection.cursor().execute(sql)
+    engine.dispose()
+    return url
+
+
+def pytest_configure(config):
+    global _database_url
+    os.environ["API_KEY"] = API_KEY
+    server_url = os.environ.get("TEST_POSTGRES_URI")
+    if server_url:
+        _database_url = _create_database(server_url)
+        # src.database reads this when it creates its engines.
+        os.environ["POSTGRES_URI"] = _database_url
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def database():
+    """The app's engine on the test database, after a reset (a new season)."""
+    if _database_url is None:
+        pytest.skip("TEST_POSTGRES_URI is not set")
+    import anyio
+    from src import database as db
+    from src.api import admin
+
+    anyio.run(admin.reset)
+    return db.engine
+
+
+@pytest.fixture
+def client(database):
+    """A TestClient for the app with the API key set."""
+    from fastapi.testclient import TestClient
+    from src.api.server import app
+
+    with TestClient(app) as client:
+        client.headers["access_token"] = API_KEY
+        yield client
@@ -0,0 +1,146 @@
+import anyio
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from src import admission
+
+
+def new_controller(total=2, standard=(2, 5, 1.0), bulk=(1, 1, 0.2)):
+    return admission.AdmissionController(
+        total,
+        {"critical": (0, total, 10, 1.0), "standard": (1, *standard), "bulk": (2, *bulk)},
+        {("POST", "/checkout"): "critical", ("GET", "/export"): "bulk", ("GET", "/search"): "bulk"},
+    )
+
+
+@pytest.mark.anyio
+async def test_a_class_is_held_to_its_limit_while_others_still_start():
+    controller = new_controller(total=3)
+    bulk, critical = controller.class_of("GET", "/export"), controller.class_of("POST", "/checkout")
+
+    assert await controller.acquire(bulk) is None
+    # The bulk slot is taken and its queue (1) fills up; the next bulk
+    # request is shed with 429, while checkouts still start.
+    waiting = None
+    async with anyio.create_task_group() as tasks:
+        async def wait():
+            nonlocal waiting
+            waiting = await controller.acquire(bulk)
+
+        tasks.start_soon(wait)
+        await anyio.sleep(0.01)
+        status, retry_after = await controller.acquire(bulk)
+        assert status == 429 and retry_after > 0
+        assert await controller.acquire(critical) is None
+        controller.release(bulk, 0.01)
+    assert waiting is None
+    assert (bulk.in_flight, critical.in_flight, controller.in_flight) == (1, 1, 2)
+
+
+@pytest.mark.anyio
+async def test_requests_that_cannot_start_in_time_get_503():
+    controller = new_controller(bulk=(1, 5, 0.05))
+    bulk = controller.class_of("GET", "/export")
+    assert await controller.acquire(bulk) is None
+
+    # Waited its max_wait without a slot freeing up.
+    assert (await controller.acquire(bulk))[0] == 503
+    assert list(bulk.waiters) == []
+    # Shed up front when the queue ahead already takes longer than that.
+    bulk.service_seconds = 1.0
+    assert (await controller.acquire(bulk))[0] == 503
+    assert (bulk.shed_deadline, bulk.in_flight) == (2, 1)
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_waiter_does_not_keep_a_slot():
+    controller = new_controller(bulk=(1, 5, 1.0))
+    bulk = controller.class_of("GET", "/export")
+    assert await controller.acquire(bulk) is None
+
+    # Cancelled while queued: it leaves the queue.
+    with anyio.move_on_after(0.05):
+        await controller.acquire(bulk)
+    assert list(bulk.waiters) == []
+
+    # Cancelled after _wake() gave it the slot but before it resumed: the
+    # slot is handed back, by acquire() or, if the wait had already
+    # finished, by the caller as AdmissionMiddleware does.
+    async def request():
+        if await controller.acquire(bulk) is None:
+            controller.release(bulk)
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(request)
+        await anyio.sleep(0.01)
+        controller.release(bulk, 0.01)
+        tasks.cancel_scope.cancel()
+
+    assert (bulk.in_flight, controller.in_flight, list(bulk.waiters)) == (0, 0, [])
+    assert await controller.acquire(bulk) is None
+
+
+def app_with(controller, monkeypatch):
+    monkeypatch.setattr(admission, "controller", controller)
+    monkeypatch.setattr(admission, "ENABLED", True)
+    held = []
+
+    def body():
+        for chunk in (b"a", b"b", b"c"):
+            # The slot is still held while the body streams.
+            held.append(controller.in_flight)
+            yield chunk
+
+    async def export(request):
+        return StreamingResponse(body())
+
+    async def search(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/export", export), Route("/search", search)])
+    app.add_middleware(admission.AdmissionMiddleware)
+    return TestClient(app), held
+
+
+def test_a_streamed_response_holds_its_slot_until_the_body_is_sent(monkeypatch):
+    controller = new_controller()
+    client, held = app_with(controller, monkeypatch)
+
+    assert client.get("/export").content == b"abc"
+
+    assert held == [1, 1, 1]
+    assert controller.in_flight == 0
+
+
+def test_shed_requests_get_retry_after_and_are_counted_by_route(monkeypatch):
+    controller = new_controller(bulk=(1, 0, 1.0))
+    client, _ = app_with(controller, monkeypatch)
+    bulk = controller.class_of("GET", "/search")
+    assert anyio.run(controller.acquire, bulk) is None
+
+    response = client.get("/search")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert controller.shed_by_route == {("GET", "/search"): 1}
+    controller.release(bulk, 0.01)
+    assert client.get("/search").text == "ok"
+
+
+def test_shed_responses_carry_cors_headers(monkeypatch):
+    from src.api.server import app, origins
+
+    controller = new_controller(bulk=(1, 0, 1.0))
+    controller.routes[("GET", "/")] = "bulk"
+    monkeypatch.setattr(admission, "controller", controller)
+    monkeypatch.setattr(admission, "ENABLED", True)
+    bulk = controller.class_of("GET", "/")
+    assert anyio.run(controller.acquire, bulk) is None
+
+    response = TestClient(app).get("/", headers={"Origin": origins[0]})
+
+    assert response.status_code == 429
+    assert response.headers["Access-Control-Allow-Origin"] == origins[0]
+    assert "Retry-After" in response.headers["Access-Control-Expose-Headers"]
@@ -0,0 +1,95 @@
+import sqlalchemy
+from src import balances
+
+
+def write_gold(connection, gold):
+    transaction_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_transactions (kind) VALUES ('other') RETURNING id"
+    )).scalar_one()
+    connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_entries (transaction_id, change_gold) VALUES (:transaction_id, :gold)"
+    ), {"transaction_id": transaction_id, "gold": gold})
+
+
+def write_potions(connection, sku, change):
+    transaction_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO potions_transactions (kind) VALUES ('other') RETURNING id"
+    )).scalar_one()
+    connection.execute(sqlalchemy.text(
+        "INSERT INTO potions_entries (transaction_id, potion_sku, change) VALUES (:transaction_id, :sku, :change)"
+    ), {"transaction_id": transaction_id, "sku": sku, "change": change})
+
+
+def test_checkpoints_match_a_full_recompute(database):
+    with database.begin() as connection:
+        write_gold(connection, 40)
+        write_potions(connection, "RED_POTION", 3)
+    with database.begin() as connection:
+        assert balances.checkpoint(connection) is not None
+    with database.begin() as connection:
+        write_gold(connection, -15)
+        write_potions(connection, "RED_POTION", -1)
+        write_potions(connection, "BLUE_POTION", 2)
+    with database.begin() as connection:
+        assert balances.checkpoint(connection) is not None
+        assert balances.verify(connection) == []
+        latest = connection.execute(sqlalchemy.text(
+            "SELECT gold FROM balance_checkpoints WHERE season_id = current_season() ORDER BY id DESC LIMIT 1"
+        )).scalar_one()
+    assert latest == 100 + 40 - 15
+
+
+def test_checkpoint_does_not_block_writers(database):
+    with database.connect() as checkpointer, database.connect() as writer:
+        checkpointer.begin()
+        assert balances.checkpoint(checkpointer) is not None
+        # The checkpoint's transaction is still open; a ledger write must
+        # not wait for it.
+        writer.execute(sqlalchemy.text("SET LOCAL lock_timeout = '200ms'"))
+        write_gold(writer, 5)
+        writer.commit()
+        checkpointer.commit()
+
+
+def test_checkpoint_waits_for_writes_in_flight(database, monkeypatch):
+    monkeypatch.setattr(balances, "CHECKPOINT_SETTLE_SECONDS", 0.1)
+    with database.connect() as writer:
+        in_flight = writer.begin()
+        write_potions(writer, "RED_POTION", 7)
+        # A later write (another sku's balance row, so it doesn't wait)
+        # commits above the in-flight entry's id.
+        with database.begin() as connection:
+            write_potions(connection, "BLUE_POTION", 11)
+        with database.begin() as connection:
+            assert balances.checkpoint(connection) is None
+        in_flight.commit()
+    with database.begin() as connection:
+        assert balances.checkpoint(connection) is not None
+        assert balances.verify(connection) == []
+
+
+def test_as_of_matches_the_full_ledgers_at_every_point(client, database):
+    def now():
+        with database.connect() as connection:
+            return connection.execute(sqlalchemy.text("SELECT clock_timestamp()")).scalar_one()
+
+    points = []
+    for step in range(6):
+        with database.begin() as connection:
+            write_gold(connection, 10 * step)
+            write_potions(connection, "RED_POTION", step)
+        if step % 2:
+            with database.begin() as connection:
+                assert balances.checkpoint(connection) is not None
+        points.append((now(), step * (step + 1) // 2))
+
+    with database.connect() as connection:
+        for point, _ in points:
+            assert balances.verify(connection, point) == []
+            _, potions = balances.as_of(connection, point)
+            assert all(type(quantity) is int for quantity in potions.values())
+
+    for point, potions in points:
+        audit = client.get("/inventory/audit", params={"as_of": point.isoformat()}).json()
+        assert type(audit["number_of_potions"]) is int
+        assert audit["number_of_potions"] == potions
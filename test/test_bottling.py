@@ -0,0 +1,48 @@
+import numpy as np
+from src.bottling import plan_bottles
+
+
+def random_recipes(rng, count):
+    cuts = np.sort(rng.integers(0, 101, size=(count, 3)), axis=1)
+    return np.diff(np.concatenate([np.zeros((count, 1), dtype=np.int64), cuts, np.full((count, 1), 100)], axis=1))
+
+
+def test_plans_fit_the_ml_and_the_shelf():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        recipes = random_recipes(rng, int(rng.integers(1, 40)))
+        prices = rng.integers(30, 80, size=len(recipes))
+        available = rng.integers(0, 2000, size=4)
+        max_potions = int(rng.integers(0, 50))
+        for objective in ("fill", "revenue"):
+            counts = plan_bottles(recipes, prices, available, max_potions, per_recipe_cap=5, objective=objective)
+
+            used = (counts[:, None] * recipes).sum(axis=0)
+            assert (used <= available).all()
+            assert counts.sum() <= max_potions
+            assert (counts <= 5).all()
+            # The plan stops only when the shelf is full or nothing else fits.
+            if counts.sum() < max_potions:
+                fits = (recipes <= available - used).all(axis=1) & (counts < 5)
+                assert not fits.any()
+
+
+def test_plans_are_deterministic_and_break_ties_on_the_lowest_row():
+    recipes = [[50, 50, 0, 0], [50, 50, 0, 0], [100, 0, 0, 0]]
+
+    first = plan_bottles(recipes, [40, 40, 40], [100, 100, 0, 0], 1)
+
+    assert first.tolist() == [1, 0, 0]
+    assert plan_bottles(recipes, [40, 40, 40], [100, 100, 0, 0], 1).tolist() == first.tolist()
+
+
+def test_revenue_weighs_price_and_demand():
+    recipes = [[100, 0, 0, 0], [0, 100, 0, 0]]
+    available = [1000, 1000, 0, 0]
+
+    assert plan_bottles(recipes, [30, 60], available, 1).tolist() == [0, 1]
+    assert plan_bottles(recipes, [30, 60], available, 1, demand=[3, 1]).tolist() == [1, 0]
+
+
+def test_empty_recipes_are_never_bottled():
+    assert plan_bottles([[0, 0, 0, 0]], [50], [100, 100, 100, 100], 10).tolist() == [0]
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+import anyio
+import pytest
+from src import cache
+from src.cache import CachedValue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(seconds=0.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.seconds))
+    return now
+
+
+def counting_loader():
+    loads = []
+
+    async def load():
+        loads.append(len(loads) + 1)
+        return loads[-1]
+
+    return load, loads
+
+
+@pytest.mark.anyio
+async def test_a_value_is_reloaded_once_it_is_older_than_the_ttl(clock):
+    cached = CachedValue(ttl=5)
+    load, loads = counting_loader()
+
+    assert await cached.get(load) == 1
+    clock.seconds = 4.9
+    assert await cached.get(load) == 1
+    clock.seconds = 5.0
+    assert await cached.get(load) == 2
+    assert await cached.get(load) == 2
+
+    assert loads == [1, 2]
+    assert cached.stats() == {"hits": 2, "misses": 2, "invalidations": 0, "ttl": 5}
+
+
+@pytest.mark.anyio
+async def test_invalidate_forces_a_reload_within_the_ttl(clock):
+    cached = CachedValue(ttl=5)
+    load, loads = counting_loader()
+    await cached.get(load)
+
+    cached.invalidate()
+
+    assert await cached.get(load) == 2
+    assert cached.stats()["invalidations"] == 1
+
+
+@pytest.mark.anyio
+async def test_a_load_in_flight_when_invalidated_is_not_kept(clock):
+    cached = CachedValue(ttl=5)
+    started, release = anyio.Event(), anyio.Event()
+
+    async def slow_load():
+        started.set()
+        await release.wait()
+        return "read before the write"
+
+    results = []
+    async with anyio.create_task_group() as tasks:
+        async def get():
+            results.append(await cached.get(slow_load))
+
+        tasks.start_soon(get)
+        await started.wait()
+        # A write lands while the load is still reading.
+        cached.invalidate()
+        release.set()
+
+    # The caller still gets what it loaded, but the next caller reloads.
+    assert results == ["read before the write"]
+    load, loads = counting_loader()
+    assert await cached.get(load) == 1
+    assert await cached.get(load) == 1
+    assert loads == [1]
@@ -0,0 +1,68 @@
+from collections import namedtuple
+import sqlalchemy
+from src import capacity
+from src.inventory_source import ShopState
+from src.sales import SalesStats
+
+SalesRow = namedtuple("SalesRow", "potion_sku character_class quantity")
+
+NO_SALES = SalesStats([], 72)
+
+
+def shop(gold, ml=(0, 0, 0, 0), potions=0, potion_capacity=1, ml_capacity=1):
+    return ShopState(gold, list(ml), potions, potion_capacity, ml_capacity)
+
+
+def test_buys_a_unit_of_whatever_is_nearly_full():
+    assert capacity.plan_capacity(shop(5000, potions=39), NO_SALES) == (0, 0)
+    assert capacity.plan_capacity(shop(5000, potions=40), NO_SALES) == (1, 0)
+    assert capacity.plan_capacity(shop(5000, ml=(4000, 4000, 0, 0)), NO_SALES) == (0, 1)
+    assert capacity.plan_capacity(shop(5000, potions=45, ml=(9000, 0, 0, 0)), NO_SALES) == (1, 1)
+    # Fill is measured against the units the shop already has.
+    assert capacity.plan_capacity(shop(5000, potions=45, potion_capacity=2), NO_SALES) == (0, 0)
+
+
+def test_potions_expected_to_sell_before_the_next_restock_count_as_full():
+    # 72 hours of sales at 10 potions an hour: 40 sell between restocks.
+    stats = SalesStats([SalesRow("RED_POTION", "Bard", 360), SalesRow("BLUE_POTION", "Wizard", 360)], 72)
+
+    assert capacity.plan_capacity(shop(5000, potions=5), stats) == (1, 0)
+
+
+def test_gold_reserve_and_daily_limit_hold_back_purchases():
+    full = dict(potions=50, ml=(10000, 0, 0, 0))
+    assert capacity.plan_capacity(shop(capacity.GOLD_RESERVE + capacity.PRICE - 1, **full), NO_SALES) == (0, 0)
+    # Gold for one unit goes to the fuller of the two.
+    assert capacity.plan_capacity(shop(capacity.GOLD_RESERVE + capacity.PRICE, potions=50, ml=(9000, 0, 0, 0)),
+                                  NO_SALES) == (1, 0)
+    assert capacity.plan_capacity(shop(capacity.GOLD_RESERVE + capacity.PRICE, potions=45, ml=(10000, 0, 0, 0)),
+                                  NO_SALES) == (0, 1)
+    assert capacity.plan_capacity(shop(100000, **full), NO_SALES) == (1, 1)
+
+
+def test_a_delivery_is_recorded_once_per_order(client, database):
+    def recorded():
+        with database.connect() as connection:
+            return connection.execute(sqlalchemy.text("""
+                SELECT
+                    (SELECT COUNT(*) FROM capacity_purchases WHERE season_id = current_season() AND order_id = 42),
+                    (SELECT COUNT(*) FROM inventory_transactions
+                     WHERE season_id = current_season() AND kind = 'capacity' AND order_id = 42)
+            """)).one()
+
+    delivery = {"potion_capacity": 1, "ml_capacity": 2}
+    with database.begin() as connection:
+        connection.execute(sqlalchemy.text("""
+            WITH deposit AS (INSERT INTO inventory_transactions (kind) VALUES ('other') RETURNING id)
+            INSERT INTO inventory_entries (transaction_id, change_gold) SELECT id, 4900 FROM deposit
+        """))
+
+    assert client.post("/inventory/deliver/42", json=delivery).json() == "OK"
+    assert client.post("/inventory/deliver/42", json=delivery).json() == "OK"
+
+    assert tuple(recorded()) == (1, 1)
+    assert client.get("/inventory/audit").json()["gold"] == 5000 - 3 * capacity.PRICE
+    with database.connect() as connection:
+        assert capacity.load_units(connection) == (2, 3)
+    # The planner reads its units back from capacity_purchases.
+    assert client.post("/inventory/plan").json() == {"potion_capacity": 0, "ml_capacity": 0}
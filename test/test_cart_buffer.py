@@ -0,0 +1,120 @@
+import threading
+import anyio
+import pytest
+import sqlalchemy
+from src import cart_buffer
+from src import database as db
+from src.api import carts
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    monkeypatch.setattr(cart_buffer, "WRITE_BEHIND", True)
+    monkeypatch.setattr(cart_buffer, "FLUSH_THRESHOLD", 1000)
+    monkeypatch.setattr(cart_buffer, "store", cart_buffer.MemoryStore())
+
+
+def new_cart(client):
+    return client.post("/carts/", json={"customer_name": "Tester", "character_class": "Bard", "level": 3}).json()["cart_id"]
+
+
+def cart_items(engine, cart_id):
+    with engine.connect() as connection:
+        return dict(connection.execute(sqlalchemy.text("""
+            SELECT p.sku, ci.quantity
+            FROM cart_items ci
+            JOIN potions p ON p.id = ci.potion_id
+            WHERE ci.cart_id = :cart_id AND ci.season_id = current_season()
+        """), {"cart_id": cart_id}).all())
+
+
+def potion_id(engine, sku):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("SELECT id FROM potions WHERE sku = :sku"), {"sku": sku}).scalar_one()
+
+
+def test_a_crash_loses_staged_changes_but_not_flushed_ones(client, database, write_behind, monkeypatch):
+    cart_id = new_cart(client)
+    monkeypatch.setattr(cart_buffer, "FLUSH_THRESHOLD", 1)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    monkeypatch.setattr(cart_buffer, "FLUSH_THRESHOLD", 1000)
+    client.post(f"/carts/{cart_id}/items/BLUE_POTION", json={"quantity": 3})
+    assert cart_items(database, cart_id) == {"RED_POTION": 2}
+
+    # The process dies and comes back with an empty buffer.
+    monkeypatch.setattr(cart_buffer, "store", cart_buffer.MemoryStore())
+    response = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert response.json() == {"total_potions_bought": 2, "total_gold_paid": 100}
+
+
+def test_shutdown_flushes_staged_changes(client, database, write_behind):
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    assert cart_items(database, cart_id) == {}
+
+    anyio.run(cart_buffer.flush_all)
+
+    assert cart_items(database, cart_id) == {"RED_POTION": 2}
+    assert len(cart_buffer.store) == 0
+
+
+def test_checkout_waits_for_a_flush_holding_its_items(client, database, write_behind, monkeypatch):
+    cart_id = new_cart(client)
+    monkeypatch.setattr(cart_buffer, "FLUSH_THRESHOLD", 1)
+    release = threading.Event()
+    write = cart_buffer.write
+
+    def slow_write(connection, pending):
+        if not release.is_set():
+            release.wait(5)
+        write(connection, pending)
+
+    monkeypatch.setattr(cart_buffer, "write", slow_write)
+
+    async def race():
+        checkout = {}
+
+        async def check_out():
+            checkout["result"] = await carts.checkout(cart_id, carts.CartCheckout(payment="gold"))
+
+        async with anyio.create_task_group() as tasks:
+            # Stages the item, then takes it off the store to flush it.
+            tasks.start_soon(carts.set_item_quantity, cart_id, "RED_POTION", carts.CartItem(quantity=2))
+            await anyio.sleep(0.1)
+            tasks.start_soon(check_out)
+            await anyio.sleep(0.2)
+            assert "result" not in checkout
+            release.set()
+        return checkout["result"]
+
+    assert anyio.run(race) == {"total_potions_bought": 2, "total_gold_paid": 100}
+
+
+def test_changes_for_a_paid_cart_are_dropped(client, database, write_behind):
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    anyio.run(cart_buffer.flush, [(cart_id, potion_id(database, "BLUE_POTION"), 5)])
+
+    assert cart_items(database, cart_id) == {"RED_POTION": 2}
+
+
+def test_a_write_racing_a_checkout_sees_the_cart_paid(client, database):
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    pending = [(cart_id, potion_id(database, "BLUE_POTION"), 5)]
+
+    with database.connect() as connection:
+        connection.begin()
+        carts.check_out_cart(connection, cart_id, carts.CartCheckout(payment="gold"))
+        writer = threading.Thread(target=db.run_blocking, args=(cart_buffer.write, pending))
+        writer.start()
+        # The write waits on the checkout's lock on the cart.
+        writer.join(0.2)
+        assert writer.is_alive()
+        connection.commit()
+    writer.join(5)
+
+    assert cart_items(database, cart_id) == {"RED_POTION": 2}
@@ -0,0 +1,84 @@
+import json
+from collections import namedtuple
+from types import SimpleNamespace
+import pytest
+from src import serialization
+from src.api import catalog
+from src.potions import PotionTable
+from src.sales import SalesStats
+
+PotionRow = namedtuple("PotionRow", "id sku price red green blue dark")
+SalesRow = namedtuple("SalesRow", "potion_sku character_class quantity")
+
+POTIONS = [
+    PotionRow(1, "RED_POTION", 50, 100, 0, 0, 0),
+    PotionRow(2, "GREEN_POTION", 50, 0, 100, 0, 0),
+    PotionRow(3, "BLUE_POTION", 50, 0, 0, 100, 0),
+    PotionRow(4, "DARK_POTION", 60, 0, 0, 0, 100),
+    PotionRow(5, "PURPLE_POTION", 55, 50, 0, 50, 0),
+    PotionRow(6, "TEAL_POTION", 55, 0, 50, 50, 0),
+    PotionRow(7, "YELLOW_POTION", 55, 50, 50, 0, 0),
+]
+TABLE = PotionTable(1, POTIONS)
+
+
+class Balances:
+    """Stands in for a connection: returns potion_balances rows."""
+
+    def __init__(self, quantities):
+        self.quantities = quantities
+
+    def execute(self, statement):
+        return SimpleNamespace(fetchall=lambda: [
+            SimpleNamespace(potion_sku=sku, quantity=quantity) for sku, quantity in self.quantities.items()
+        ])
+
+
+def test_ranking_orders_by_sales_then_sku():
+    stats = SalesStats([
+        SalesRow("BLUE_POTION", "Wizard", 4), SalesRow("RED_POTION", "Barbarian", 3),
+        SalesRow("RED_POTION", "Fighter", 2), SalesRow("DARK_POTION", "Warlock", 5),
+        SalesRow("GREEN_POTION", "Druid", 4),
+    ], 72)
+
+    assert stats.ranking == ["DARK_POTION", "RED_POTION", "BLUE_POTION", "GREEN_POTION"]
+    assert [stats.rank(sku) for sku in stats.ranking] == [0, 1, 2, 3]
+    # Skus that haven't sold rank after every one that has.
+    assert stats.rank("TEAL_POTION") == stats.rank("PURPLE_POTION") == 4
+    assert stats.by_class["Barbarian"] == {"RED_POTION": 3}
+
+
+def test_color_shares_blend_sales_with_equal_shares():
+    stats = SalesStats([SalesRow("RED_POTION", "Barbarian", 3), SalesRow("PURPLE_POTION", "Sorcerer", 2)], 72)
+
+    # 400 ml of red and 100 of blue sold, each blended half and half with 1/4.
+    assert stats.color_shares(TABLE) == pytest.approx([0.525, 0.125, 0.225, 0.125])
+    assert sum(stats.color_shares(TABLE)) == pytest.approx(1)
+
+
+def test_without_sales_there_are_no_shares_and_stock_decides():
+    stats = SalesStats([], 72)
+
+    assert stats.color_shares(TABLE) is None
+    assert stats.demand(TABLE.skus) is None
+    listed = catalog.load_catalog(Balances({"RED_POTION": 2, "BLUE_POTION": 9, "TEAL_POTION": 2}), TABLE, stats)
+    assert [item["sku"] for item in listed] == ["BLUE_POTION", "RED_POTION", "TEAL_POTION"]
+
+
+def test_catalog_offers_best_sellers_first_and_skips_unknown_skus():
+    stats = SalesStats([SalesRow("NEW_POTION", "Bard", 9), SalesRow("TEAL_POTION", "Cleric", 5),
+                        SalesRow("GREEN_POTION", "Druid", 1)], 72)
+    # A sku added since the registry was loaded, the best seller, and more
+    # stocked skus than fit in the catalog.
+    stock = {row.sku: 10 + row.id for row in POTIONS}
+    stock["NEW_POTION"] = 1
+
+    listed = catalog.load_catalog(Balances(stock), TABLE, stats)
+
+    assert len(listed) == catalog.CATALOG_SIZE
+    assert [item["sku"] for item in listed] == [
+        "TEAL_POTION", "GREEN_POTION", "YELLOW_POTION", "PURPLE_POTION", "DARK_POTION", "BLUE_POTION",
+    ]
+    assert json.loads(serialization.dumps(listed[0])) == {
+        "sku": "TEAL_POTION", "name": "TEAL_POTION", "quantity": 16, "price": 55, "potion_type": [0, 50, 50, 0],
+    }
@@ -0,0 +1,49 @@
+import sqlalchemy
+from src import cart_buffer
+
+
+def ledger_counts(engine):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("""
+            SELECT
+                (SELECT COUNT(*) FROM inventory_transactions WHERE season_id = current_season()),
+                (SELECT COUNT(*) FROM potions_entries WHERE season_id = current_season()),
+                (SELECT COUNT(*) FROM cart_items WHERE season_id = current_season())
+        """)).first()
+
+
+def new_cart(client, items):
+    cart_id = client.post("/carts/", json={"customer_name": "Tester", "character_class": "Bard", "level": 3}).json()["cart_id"]
+    for sku, quantity in items.items():
+        client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": quantity})
+    return cart_id
+
+
+def test_checkout_records_the_whole_cart(client, database):
+    cart_id = new_cart(client, {"RED_POTION": 2, "DARK_POTION": 1})
+
+    response = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert response.json() == {"total_potions_bought": 3, "total_gold_paid": 2 * 50 + 60}
+    with database.connect() as connection:
+        sold = dict(connection.execute(sqlalchemy.text("""
+            SELECT pe.potion_sku, pe.change
+            FROM potions_entries pe
+            JOIN potions_transactions pt ON pt.id = pe.transaction_id AND pt.season_id = pe.season_id
+            WHERE pt.kind = 'sale' AND pt.order_id = :cart_id
+        """), {"cart_id": cart_id}).all())
+    assert sold == {"RED_POTION": -2, "DARK_POTION": -1}
+
+
+def test_retried_checkout_returns_the_recorded_sale_and_writes_nothing(client, database, monkeypatch):
+    monkeypatch.setattr(cart_buffer, "WRITE_BEHIND", True)
+    cart_id = new_cart(client, {"RED_POTION": 2})
+    first = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"}).json()
+    before = ledger_counts(database)
+
+    # A change buffered for the paid cart must not reach it on the retry.
+    client.post(f"/carts/{cart_id}/items/BLUE_POTION", json={"quantity": 5})
+    retried = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"}).json()
+
+    assert retried == first == {"total_potions_bought": 2, "total_gold_paid": 100}
+    assert ledger_counts(database) == before
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta, timezone
+import sqlalchemy
+from src.api import export
+
+DAY = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def write_gold(connection, gold, created_at=None):
+    transaction_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_transactions (kind, created_at) VALUES ('other', COALESCE(:created_at, now())) RETURNING id"
+    ), {"created_at": created_at}).scalar_one()
+    return connection.execute(sqlalchemy.text(
+        "INSERT INTO inventory_entries (transaction_id, change_gold) VALUES (:transaction_id, :gold) RETURNING id"
+    ), {"transaction_id": transaction_id, "gold": gold}).scalar_one()
+
+
+def write_potions(connection, sku, change):
+    transaction_id = connection.execute(sqlalchemy.text(
+        "INSERT INTO potions_transactions (kind) VALUES ('other') RETURNING id"
+    )).scalar_one()
+    return connection.execute(sqlalchemy.text(
+        "INSERT INTO potions_entries (transaction_id, potion_sku, change) VALUES (:transaction_id, :sku, :change) RETURNING id"
+    ), {"transaction_id": transaction_id, "sku": sku, "change": change}).scalar_one()
+
+
+def pull(client, path, **params):
+    response = client.get(path, params=params)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    return rows, int(response.headers["X-Next-Since-Id"])
+
+
+def test_inventory_export_rows_and_filters(client, database):
+    with database.begin() as connection:
+        ids = [write_gold(connection, gold, DAY + timedelta(hours=hour)) for hour, gold in enumerate((10, 20, 30))]
+        season_id = connection.execute(sqlalchemy.text("SELECT current_season()")).scalar_one()
+
+    rows, next_since_id = pull(client, "/export/inventory")
+    # The reset's starting gold, then the three entries in id order.
+    assert [row["change_gold"] for row in rows] == [100, 10, 20, 30]
+    assert [row["id"] for row in rows[1:]] == ids and next_since_id == ids[-1]
+    assert rows[1]["kind"] == "other" and rows[1]["change_red_ml"] == 0
+    assert datetime.fromisoformat(rows[1]["created_at"]) == DAY
+
+    rows, next_since_id = pull(client, "/export/inventory", since_id=ids[0])
+    assert [row["id"] for row in rows] == ids[1:] and next_since_id == ids[-1]
+    # Nothing new: the cursor stays where it was.
+    assert pull(client, "/export/inventory", since_id=next_since_id) == ([], ids[-1])
+
+    rows, _ = pull(client, "/export/inventory", start=(DAY + timedelta(hours=1)).isoformat(),
+                   end=(DAY + timedelta(hours=2)).isoformat())
+    assert [row["id"] for row in rows] == ids[1:2]
+
+    # A new season starts with only its starting gold; the old one is
+    # still exported by season_id.
+    client.post("/admin/reset")
+    rows, _ = pull(client, "/export/inventory")
+    assert [row["change_gold"] for row in rows] == [100]
+    rows, _ = pull(client, "/export/inventory", season_id=season_id)
+    assert [row["id"] for row in rows[1:]] == ids
+
+
+def test_an_entry_committed_late_is_not_skipped(client, database, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_SETTLE_SECONDS", 0.1)
+    _, since_id = pull(client, "/export/potions")
+
+    with database.connect() as writer:
+        in_flight = writer.begin()
+        late = write_potions(writer, "RED_POTION", 7)
+        # A later entry (another sku's balance row, so it doesn't wait)
+        # commits above the in-flight one's id.
+        with database.begin() as connection:
+            early = write_potions(connection, "BLUE_POTION", 11)
+        response = client.get("/export/potions", params={"since_id": since_id})
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        in_flight.commit()
+
+    rows, next_since_id = pull(client, "/export/potions", since_id=since_id)
+    assert [row["id"] for row in rows] == [late, early] and next_since_id == early
+
+
+def test_potion_and_cart_item_exports(client, database):
+    cart_id = client.post("/carts/", json={"customer_name": "Tester", "character_class": "Bard", "level": 3}).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    client.post(f"/carts/{cart_id}/items/DARK_POTION", json={"quantity": 1})
+    unpaid = client.post("/carts/", json={"customer_name": "Browser", "character_class": "Bard", "level": 3}).json()["cart_id"]
+    client.post(f"/carts/{unpaid}/items/BLUE_POTION", json={"quantity": 4})
+    client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    rows, next_since_id = pull(client, "/export/cart_items")
+    assert [(row["cart_id"], row["sku"], row["quantity"], row["line_item_total"]) for row in rows] == [
+        (cart_id, "RED_POTION", 2, 100), (cart_id, "DARK_POTION", 1, 60), (unpaid, "BLUE_POTION", 4, 4 * 50),
+    ]
+    assert rows[0]["payment"] == "gold" and rows[0]["checked_out_at"] is not None
+    assert rows[2]["payment"] is None and rows[2]["checked_out_at"] is None
+    assert next_since_id == rows[-1]["id"]
+    # A time range only returns sold items.
+    rows, _ = pull(client, "/export/cart_items", start=DAY.isoformat())
+    assert {row["cart_id"] for row in rows} == {cart_id}
+
+    rows, _ = pull(client, "/export/potions")
+    assert {(row["kind"], row["order_id"], row["potion_sku"], row["change"]) for row in rows} == {
+        ("sale", cart_id, "RED_POTION", -2), ("sale", cart_id, "DARK_POTION", -1),
+    }
@@ -0,0 +1,50 @@
+import sqlalchemy
+from src import ledger_metadata
+from src.api.barrels import Barrel
+from src.api.bottler import PotionInventory
+
+BARRELS = [
+    Barrel(sku="SMALL_RED_BARREL", ml_per_barrel=500, potion_type=[1, 0, 0, 0], price=100, quantity=2),
+    Barrel(sku="LARGE_DARK_BARREL", ml_per_barrel=10000, potion_type=[0, 0, 0, 1], price=750, quantity=1),
+]
+
+
+def test_descriptions_the_baseline_wrote_get_their_kind(database):
+    # What the baseline wrote, per ledger.
+    kinds = {
+        None: "reset",
+        "starting gold": "reset",
+        f"Barreled: {BARRELS}": "barrels",
+        f"Bottled: {[PotionInventory(potion_type=[100, 0, 0, 0], quantity=3)]}": "bottling",
+        "Capacity: potion_capacity=1, ml_capacity=0": "capacity",
+        # A checkout's inventory transaction, then one per line in the potions ledger.
+        "sold 5 potions": "sale",
+        "sold 3 RED_POTION": "sale",
+        "sold 2 potions of RED_POTION": "other",
+        "refund": "other",
+    }
+    with database.connect() as connection:
+        for description, kind in kinds.items():
+            assert connection.execute(sqlalchemy.text("SELECT ledger_kind_of(:description)"),
+                                      {"description": description}).scalar_one() == kind, description
+
+
+def test_parsed_barrel_lines_match_what_a_delivery_writes(client, database):
+    with database.connect() as connection:
+        parsed = connection.execute(sqlalchemy.text("""
+            SELECT sku, ml_per_barrel, red, green, blue, dark, price, quantity
+            FROM parse_barrel_lines(:description) ORDER BY line
+        """), {"description": f"Barreled: {BARRELS}"}).all()
+    lines = ledger_metadata.barrel_lines(BARRELS)
+    assert [tuple(row) for row in parsed] == list(zip(*lines.values()))
+
+    client.post("/barrels/deliver/7/", json=[barrel.dict() for barrel in BARRELS])
+    with database.connect() as connection:
+        written = connection.execute(sqlalchemy.text("""
+            SELECT bl.sku, bl.ml_per_barrel, bl.red, bl.green, bl.blue, bl.dark, bl.price, bl.quantity
+            FROM barrel_lines bl
+            JOIN inventory_transactions it ON it.id = bl.transaction_id AND it.season_id = bl.season_id
+            WHERE it.kind = 'barrels' AND it.order_id = 7 AND bl.season_id = current_season()
+            ORDER BY bl.line
+        """)).all()
+    assert written == parsed
@@ -0,0 +1,35 @@
+import sqlalchemy
+from src import ledger_partitions
+
+
+def blocks(connection, table):
+    """Id lower bounds of the current season's blocks of table, and how many rows sit in its default partition."""
+    season_partition = connection.execute(sqlalchemy.text("SELECT :table || '_season_' || current_season()"),
+                                          {"table": table}).scalar_one()
+    bounds = connection.execute(sqlalchemy.text("""
+        SELECT CAST(substring(pg_get_expr(c.relpartbound, c.oid) FROM 'FROM \\(''?(\\d+)') AS bigint)
+        FROM pg_inherits h
+        JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = to_regclass(:season_partition) AND pg_get_expr(c.relpartbound, c.oid) <> 'DEFAULT'
+    """), {"season_partition": season_partition}).scalars()
+    in_default = connection.execute(sqlalchemy.text(f"SELECT COUNT(*) FROM {season_partition}_default")).scalar_one()
+    return sorted(bounds), in_default
+
+
+def test_ensure_keeps_two_blocks_ahead_of_the_sequences(database):
+    with database.begin() as connection:
+        size = connection.execute(sqlalchemy.text("SELECT ledger_partition_size()")).scalar_one()
+        # A new season starts with blocks 0 to 2.
+        assert ledger_partitions.ensure(connection) == 0
+        assert blocks(connection, "inventory_entries") == ([0, size, 2 * size], 0)
+
+        connection.execute(sqlalchemy.text("SELECT setval(pg_get_serial_sequence('inventory_entries', 'id'), :id)"),
+                           {"id": 2 * size + 5})
+        assert ledger_partitions.ensure(connection) == 2
+        assert ledger_partitions.ensure(connection) == 0
+        connection.execute(sqlalchemy.text("""
+            WITH t AS (INSERT INTO inventory_transactions (kind) VALUES ('other') RETURNING id)
+            INSERT INTO inventory_entries (transaction_id, change_gold) SELECT id, 1 FROM t
+        """))
+
+        assert blocks(connection, "inventory_entries") == ([0, size, 2 * size, 3 * size, 4 * size], 0)
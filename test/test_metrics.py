@@ -0,0 +1,52 @@
+import time
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from src import metrics
+
+
+def slow_body():
+    for chunk in (b"a", b"b", b"c"):
+        time.sleep(0.05)
+        yield chunk
+
+
+async def stream(request):
+    return StreamingResponse(slow_body())
+
+
+async def broken(request):
+    raise RuntimeError("boom")
+
+
+def test_streamed_responses_are_timed_to_the_last_chunk(monkeypatch):
+    monkeypatch.setattr(metrics, "routes", {})
+    app = Starlette(routes=[Route("/stream", stream)])
+    app.add_middleware(metrics.RecordRequests)
+
+    assert TestClient(app).get("/stream").content == b"abc"
+
+    recorded = metrics.routes[("GET", "unmatched")]
+    assert recorded.latency.count == 1
+    assert recorded.latency.sum >= 0.15
+    assert recorded.errors == 0
+
+
+def test_unhandled_errors_count_as_errors(monkeypatch):
+    monkeypatch.setattr(metrics, "routes", {})
+    app = Starlette(routes=[Route("/broken", broken)])
+    app.add_middleware(metrics.RecordRequests)
+
+    assert TestClient(app, raise_server_exceptions=False).get("/broken").status_code == 500
+    assert metrics.routes[("GET", "unmatched")].errors == 1
+
+
+def test_sql_run_while_streaming_counts_toward_the_route(client, monkeypatch):
+    monkeypatch.setattr(metrics, "routes", {})
+
+    assert client.get("/export/potions").status_code == 200
+
+    recorded = metrics.routes[("GET", "/export/potions")]
+    assert recorded.latency.count == 1
+    assert recorded.statements.sum >= 1
@@ -0,0 +1,51 @@
+from collections import namedtuple
+import anyio
+import sqlalchemy
+from src.potions import PotionRegistry, PotionTable
+
+PotionRow = namedtuple("PotionRow", "id sku price red green blue dark")
+
+
+def test_lookups_return_none_for_unknown_potions():
+    table = PotionTable(1, [PotionRow(2, "RED_POTION", 50, 100, 0, 0, 0), PotionRow(7, "BLUE_POTION", 50, 0, 0, 100, 0)])
+
+    assert table.row_by_sku("BLUE_POTION") == 1 and table.id_of("BLUE_POTION") == 7
+    assert table.row_by_sku("GREEN_POTION") is None and table.id_of("GREEN_POTION") is None
+    assert table.row_by_id(7) == 1
+    assert table.row_by_id(3) is None and table.row_by_id(8) is None
+    assert table.sku_of_recipe([100, 0, 0, 0]) == "RED_POTION"
+    assert table.row_by_recipe([0, 100, 0, 0]) is None
+
+
+def test_a_potions_version_bump_reloads_the_table(database):
+    registry = PotionRegistry(refresh_seconds=0)
+    table = anyio.run(registry.get)
+    assert table.row_by_sku("TEST_POTION") is None
+    # Nothing changed: the version is read but the table is kept.
+    assert anyio.run(registry.get) is table and registry.reloads == 1
+
+    # The trigger from migrations/006_potions_version.sql bumps the version.
+    with database.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            "INSERT INTO potions (sku, price, red, green, blue, dark) VALUES ('TEST_POTION', 45, 10, 20, 30, 40)"
+        ))
+    try:
+        reloaded = anyio.run(registry.get)
+        assert reloaded.version > table.version and registry.reloads == 2
+        assert reloaded.sku_of_recipe([10, 20, 30, 40]) == "TEST_POTION"
+        assert reloaded.prices[reloaded.row_by_sku("TEST_POTION")] == 45
+    finally:
+        with database.begin() as connection:
+            connection.execute(sqlalchemy.text("DELETE FROM potions WHERE sku = 'TEST_POTION'"))
+    assert anyio.run(registry.get).row_by_sku("TEST_POTION") is None and registry.reloads == 3
+
+
+def test_the_registry_is_only_checked_every_refresh_seconds(database):
+    registry = PotionRegistry(refresh_seconds=60)
+    table = anyio.run(registry.get)
+    with database.begin() as connection:
+        connection.execute(sqlalchemy.text("UPDATE potions_version SET version = version + 1"))
+
+    assert anyio.run(registry.get) is table
+    with database.connect() as connection:
+        assert registry.refresh(connection).version == table.version + 1
@@ -0,0 +1,66 @@
+import itertools
+import random
+from collections import namedtuple
+from src.purchasing import barrel_color, color_caps, plan_barrels
+
+Barrel = namedtuple("Barrel", "sku ml_per_barrel potion_type price quantity")
+
+
+def random_catalog(size):
+    catalog = []
+    for i in range(size):
+        color = random.randrange(4)
+        ml = random.choice([200, 500, 1000, 2500])
+        catalog.append(Barrel(f"BARREL_{i}", ml, [int(c == color) for c in range(4)],
+                              random.randint(ml // 20, ml // 4), random.randint(1, 3)))
+    return catalog
+
+
+def score(catalog, plan):
+    """(ml added, -gold spent): higher is better."""
+    by_sku = {barrel.sku: barrel for barrel in catalog}
+    return (sum(by_sku[line["sku"]].ml_per_barrel * line["quantity"] for line in plan),
+            -sum(by_sku[line["sku"]].price * line["quantity"] for line in plan))
+
+
+def brute_force(catalog, gold, ml_by_color, ml_capacity):
+    caps = color_caps(ml_by_color, ml_capacity)
+    best = (0, 0)
+    for quantities in itertools.product(*(range(barrel.quantity + 1) for barrel in catalog)):
+        added = [0] * 4
+        for barrel, quantity in zip(catalog, quantities):
+            added[barrel_color(barrel.potion_type)] += barrel.ml_per_barrel * quantity
+        spent = sum(barrel.price * quantity for barrel, quantity in zip(catalog, quantities))
+        if (spent <= gold and sum(added) + sum(ml_by_color) <= ml_capacity
+                and all(a <= cap for a, cap in zip(added, caps))):
+            best = max(best, (sum(added), -spent))
+    return best
+
+
+def test_plan_matches_brute_force_on_small_catalogs():
+    random.seed(0)
+    for _ in range(200):
+        catalog = random_catalog(random.randint(1, 5))
+        gold = random.randint(0, 800)
+        ml_by_color = [random.choice([0, 500, 1000]) for _ in range(4)]
+        plan = plan_barrels(catalog, gold, ml_by_color, 10000)
+        assert score(catalog, plan) == brute_force(catalog, gold, ml_by_color, 10000), (catalog, gold, plan)
+
+
+def test_plan_skips_mixed_barrels_and_respects_quantity():
+    catalog = [
+        Barrel("MIXED", 500, [1, 1, 0, 0], 10, 5),
+        Barrel("SMALL_RED_BARREL", 500, [1, 0, 0, 0], 100, 2),
+    ]
+
+    assert plan_barrels(catalog, 1000, [0, 0, 0, 0], 10000) == [{"sku": "SMALL_RED_BARREL", "quantity": 2}]
+
+
+def test_wholesale_plan_leaves_out_mini_barrels(client):
+    def barrel(size, ml, price):
+        return {"sku": f"{size}_RED_BARREL", "ml_per_barrel": ml, "potion_type": [1, 0, 0, 0],
+                "price": price, "quantity": 10}
+
+    assert client.post("/barrels/plan", json=[barrel("MINI", 200, 60)]).json() == []
+    plan = client.post("/barrels/plan", json=[barrel("MINI", 200, 60), barrel("SMALL", 500, 100)]).json()
+    assert [line["sku"] for line in plan] == ["SMALL_RED_BARREL"]
@@ -0,0 +1,122 @@
+import base64
+import json
+import pytest
+import sqlalchemy
+from src.api import carts
+from src.api.carts import search_sort_options, search_sort_order
+
+# Carts of one to three items, checked out one at a time: items of a cart
+# share their timestamp and customer, and repeated quantities of a potion
+# tie on item_sku and line_item_total.
+CARTS = [
+    ("Alder", {"RED_POTION": 1, "BLUE_POTION": 2}),
+    ("Birch", {"RED_POTION": 1}),
+    ("Alder", {"DARK_POTION": 3, "RED_POTION": 2, "BLUE_POTION": 1}),
+    ("Cedar", {"BLUE_POTION": 2}),
+    ("Birch", {"RED_POTION": 1, "DARK_POTION": 1}),
+    ("Dogwood", {"BLUE_POTION": 1, "RED_POTION": 2}),
+    ("Alder", {"RED_POTION": 1}),
+]
+LINE_ITEMS = sum(len(items) for _, items in CARTS)
+
+
+@pytest.fixture
+def sales(client):
+    for customer_name, items in CARTS:
+        cart_id = client.post("/carts/", json={"customer_name": customer_name, "character_class": "Bard", "level": 3}).json()["cart_id"]
+        for sku, quantity in items.items():
+            client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": quantity})
+        client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+
+def expected_ids(engine, sort_col, sort_order):
+    """Every line item id in the order the pages should list them."""
+    expression, _ = carts.search_sort_expressions[sort_col]
+    direction = sort_order.value.upper()
+    with engine.connect() as connection:
+        return list(connection.execute(sqlalchemy.text(f"""
+            SELECT ci.id
+            FROM cart_items ci
+            JOIN carts c ON ci.cart_id = c.id AND c.season_id = ci.season_id
+            JOIN potions p ON ci.potion_id = p.id
+            JOIN inventory_transactions it ON c.inventory_transaction_id = it.id AND it.season_id = c.season_id
+            WHERE ci.season_id = current_season()
+            ORDER BY {expression} {direction}, ci.id {direction}
+        """)).scalars())
+
+
+def search(client, sort_col, sort_order, search_page="", **filters):
+    response = client.get("/carts/search/", params={
+        "sort_col": sort_col.value, "sort_order": sort_order.value, "search_page": search_page, **filters,
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def ids(page):
+    return [result["line_item_id"] for result in page["results"]]
+
+
+@pytest.mark.parametrize("sort_order", list(search_sort_order))
+@pytest.mark.parametrize("sort_col", list(search_sort_options))
+def test_pages_walk_forward_and_back_over_every_row_once(client, database, sales, sort_col, sort_order):
+    expected = expected_ids(database, sort_col, sort_order)
+    assert len(expected) == LINE_ITEMS
+
+    pages = [search(client, sort_col, sort_order)]
+    while pages[-1]["next"]:
+        pages.append(search(client, sort_col, sort_order, pages[-1]["next"]))
+    assert [ids(page) for page in pages] == [expected[i:i + carts.SEARCH_PAGE_SIZE]
+                                             for i in range(0, LINE_ITEMS, carts.SEARCH_PAGE_SIZE)]
+    assert pages[0]["previous"] == "" and all(page["previous"] for page in pages[1:])
+
+    back = [pages[-1]]
+    while back[-1]["previous"]:
+        back.append(search(client, sort_col, sort_order, back[-1]["previous"]))
+    assert [ids(page) for page in back] == [ids(page) for page in reversed(pages)]
+    assert back[-1]["next"] == pages[0]["next"]
+
+
+def test_a_short_page_backwards_serves_the_first_page(client, database, sales):
+    sort_col, sort_order = search_sort_options.timestamp, search_sort_order.desc
+    first = search(client, sort_col, sort_order)
+
+    # Only two rows come before the third, fewer than a page.
+    third = carts.SearchResult(**first["results"][2])
+    cursor = carts.encode_search_page("prev", third, sort_col)
+
+    assert search(client, sort_col, sort_order, cursor) == first
+
+
+def test_filters_apply_to_every_page(client, database, sales):
+    pages = [search(client, search_sort_options.customer_name, search_sort_order.asc, customer_name="alder")]
+    while pages[-1]["next"]:
+        pages.append(search(client, search_sort_options.customer_name, search_sort_order.asc, pages[-1]["next"],
+                            customer_name="alder"))
+    results = [result for page in pages for result in page["results"]]
+    assert len(results) == 6 and {result["customer_name"] for result in results} == {"Alder"}
+
+
+def cursor(*payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("search_page, sort_col", [
+    ("not a cursor", search_sort_options.timestamp),
+    (cursor("next", "timestamp", "2026-03-01T00:00:00+00:00"), search_sort_options.timestamp),
+    (cursor("sideways", "timestamp", "2026-03-01T00:00:00+00:00", 1), search_sort_options.timestamp),
+    # Issued for another sort column.
+    (cursor("next", "customer_name", "Alder", 1), search_sort_options.timestamp),
+    (cursor("next", "timestamp", "yesterday", 1), search_sort_options.timestamp),
+    (cursor("next", "line_item_total", "a lot", 1), search_sort_options.line_item_total),
+    (cursor("next", "line_item_total", "Infinity", 1), search_sort_options.line_item_total),
+    (cursor("next", "line_item_total", "1E+1000000", 1), search_sort_options.line_item_total),
+    (cursor("next", "customer_name", "Alder", "1"), search_sort_options.customer_name),
+    (cursor("next", "customer_name", "Alder", True), search_sort_options.customer_name),
+    (cursor("next", "customer_name", "Alder", 2**63), search_sort_options.customer_name),
+    (cursor("next", "customer_name", "Al\u0000der", 1), search_sort_options.customer_name),
+])
+def test_malformed_or_tampered_cursors_get_400(client, database, search_page, sort_col):
+    response = client.get("/carts/search/", params={"sort_col": sort_col.value, "search_page": search_page})
+
+    assert response.status_code == 400
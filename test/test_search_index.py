@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from src import search_index
+from src.search_index import NgramIndex
+
+
+class Rows:
+    """Stands in for a connection: returns the rows with id > last_id."""
+
+    def __init__(self, texts, on_execute=None):
+        self.texts = texts
+        self.on_execute = on_execute
+
+    def execute(self, statement, params):
+        if self.on_execute:
+            self.on_execute()
+        return SimpleNamespace(fetchall=lambda: [
+            SimpleNamespace(id=key, text=text) for key, text in self.texts.items() if key > params["last_id"]
+        ])
+
+
+def test_lookup_matches_substrings_case_insensitively():
+    index = NgramIndex("")
+    for key, name in enumerate(["Alice", "Malika", "Bob", "ALIBABA"], 1):
+        index.add(key, name)
+
+    assert sorted(index.lookup("ali")) == [1, 2, 4]
+    assert sorted(index.lookup("LIka")) == [2]
+    assert index.lookup("xyz") == []
+    # Shorter than a gram: the caller filters in SQL instead.
+    assert index.lookup("al") is None
+
+
+def test_refresh_only_fetches_new_rows():
+    index = NgramIndex("")
+    rows = Rows({1: "Alice", 2: "Bob"})
+    index.refresh(rows)
+    rows.texts[3] = "Alicia"
+    index.refresh(rows)
+
+    assert index.last_id == 3
+    assert sorted(index.match(rows, "alic")) == [1, 3]
+
+
+def test_rows_read_before_a_clear_are_dropped():
+    index = NgramIndex("")
+    # The clear lands while the refresh's query is running.
+    index.refresh(Rows({1: "Alice"}, on_execute=index.clear))
+
+    assert index.texts == {}
+    assert index.last_id == 0
+
+
+def test_match_falls_back_past_max_matches(monkeypatch):
+    monkeypatch.setattr(search_index, "MAX_MATCHES", 2)
+    rows = Rows({1: "Alice", 2: "Alicia", 3: "Malika"})
+
+    assert NgramIndex("").match(rows, "ali") is None
+    assert sorted(NgramIndex("").match(rows, "alic")) == [1, 2]
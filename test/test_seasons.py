@@ -0,0 +1,129 @@
+import anyio
+import pytest
+import sqlalchemy
+from src import cart_buffer
+from src import seasons
+from src.api import admin
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    monkeypatch.setattr(cart_buffer, "WRITE_BEHIND", True)
+    monkeypatch.setattr(cart_buffer, "FLUSH_THRESHOLD", 1000)
+    monkeypatch.setattr(cart_buffer, "store", cart_buffer.MemoryStore())
+
+
+def new_cart(client):
+    return client.post("/carts/", json={"customer_name": "Tester", "character_class": "Bard", "level": 3}).json()["cart_id"]
+
+
+def current_season(engine):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("SELECT current_season()")).scalar_one()
+
+
+def season_items(engine, season_id, schema="public"):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text(f"""
+            SELECT cart_id, potion_id, quantity FROM {schema}.cart_items_season_{season_id} ORDER BY id
+        """)).all()
+
+
+def relation(engine, name):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("SELECT CAST(to_regclass(:name) AS text)"), {"name": name}).scalar()
+
+
+def test_reset_starts_a_season_and_keeps_the_old_one_readable(client, database):
+    old = current_season(database)
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert client.post("/admin/reset").json() == "OK"
+
+    new = current_season(database)
+    assert new == old + 1
+    listed = client.get("/admin/seasons").json()
+    assert [(season["id"], season["current"]) for season in listed[-2:]] == [(old, False), (new, True)]
+    assert client.get("/inventory/audit").json()["gold"] == 100
+    assert client.get("/carts/search/").json()["results"] == []
+    # The old season's rows are where they were.
+    assert [(row.cart_id, row.quantity) for row in season_items(database, old)] == [(cart_id, 2)]
+    assert client.get("/admin/balances").json()["consistent"]
+
+
+def test_reset_writes_buffered_changes_to_the_old_season(client, database, write_behind):
+    old = current_season(database)
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+
+    client.post("/admin/reset")
+
+    assert [(row.cart_id, row.quantity) for row in season_items(database, old)] == [(cart_id, 2)]
+    assert season_items(database, current_season(database)) == []
+    assert len(cart_buffer.store) == 0
+
+
+def test_reset_waits_for_a_flush_in_flight(client, database, write_behind):
+    old = current_season(database)
+    cart_id = new_cart(client)
+    with database.connect() as connection:
+        potion_id = connection.execute(sqlalchemy.text("SELECT id FROM potions WHERE sku = 'RED_POTION'")).scalar_one()
+
+    async def scenario(locker):
+        async with anyio.create_task_group() as tasks:
+            # The flush waits on the locked cart, and the reset on the flush.
+            tasks.start_soon(cart_buffer.flush, [(cart_id, potion_id, 3)])
+            await anyio.sleep(0.1)
+            tasks.start_soon(admin.reset)
+            await anyio.sleep(0.1)
+            assert current_season(database) == old
+            locker.rollback()
+
+    with database.connect() as locker:
+        locker.execute(sqlalchemy.text("SELECT 1 FROM carts WHERE id = :cart_id FOR UPDATE"), {"cart_id": cart_id})
+        anyio.run(scenario, locker)
+
+    assert current_season(database) == old + 1
+    assert [(row.cart_id, row.quantity) for row in season_items(database, old)] == [(cart_id, 3)]
+
+
+@pytest.mark.parametrize("drop", [False, True])
+def test_archive_detaches_a_past_season(client, database, drop):
+    old = current_season(database)
+    cart_id = new_cart(client)
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2})
+    client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+    assert client.post(f"/admin/seasons/{old}/archive").status_code == 400
+    client.post("/admin/reset")
+
+    # The endpoint runs the archive as a background task after responding.
+    assert client.post(f"/admin/seasons/{old}/archive", params={"drop": drop}).json() == "OK"
+
+    with database.connect() as connection:
+        tables = connection.execute(sqlalchemy.text("SELECT unnest(season_tables())")).scalars().all()
+        attached = connection.execute(sqlalchemy.text("""
+            SELECT COUNT(*) FROM pg_inherits
+            WHERE inhparent = ANY (CAST(season_tables() AS regclass[]))
+                AND CAST(CAST(inhrelid AS regclass) AS text) LIKE '%\\_season\\_' || :season_id
+        """), {"season_id": old}).scalar_one()
+    assert attached == 0
+    for table in tables:
+        assert relation(database, f"public.{table}_season_{old}") is None
+        assert (relation(database, f"archive.{table}_season_{old}") is None) == drop
+    if not drop:
+        assert [(row.cart_id, row.quantity) for row in season_items(database, old, "archive")] == [(cart_id, 2)]
+        # Ledger id blocks move along with their season partition.
+        with database.connect() as connection:
+            assert connection.execute(sqlalchemy.text("""
+                SELECT COUNT(*) FROM pg_class
+                WHERE relnamespace = CAST('archive' AS regnamespace) AND relname LIKE :blocks AND relkind = 'r'
+            """), {"blocks": f"inventory\\_entries\\_season\\_{old}\\_%"}).scalar_one() > 0
+    season = next(season for season in client.get("/admin/seasons").json() if season["id"] == old)
+    assert season["archived_at"] is not None and season["archive"] == ("dropped" if drop else "archive")
+
+    # The current season is untouched.
+    assert client.get("/inventory/audit").json()["gold"] == 100
+    with pytest.raises(ValueError):
+        seasons.archive(current_season(database))
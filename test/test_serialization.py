@@ -0,0 +1,45 @@
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from src import serialization
+
+NOW = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+SearchRow = namedtuple("SearchRow", "line_item_id item_sku customer_name line_item_total timestamp")
+ExportRow = namedtuple("ExportRow", "id transaction_id created_at kind order_id description potion_sku change")
+
+
+def test_dumps_matches_what_fastapi_encoded():
+    catalog = [{"sku": f"POTION_{i}", "name": f"POTION_{i}", "quantity": 10 + i, "price": 50,
+                "potion_type": [100 - 20 * i, 20 * i, 0, 0]} for i in range(6)]
+    rows = [SearchRow(1000 + i, f"{i + 1} RED_POTION potion", f"Customer {i}", 50.0 * (i + 1),
+                      NOW - timedelta(minutes=i)) for i in range(5)]
+    page = {"previous": "", "next": "abc", "results": [row._asdict() for row in rows]}
+
+    for value in (catalog, page):
+        assert json.loads(serialization.dumps(value)) == json.loads(JSONResponse(jsonable_encoder(value)).body)
+
+
+def test_ndjson_writes_one_object_per_row():
+    rows = [ExportRow(i, i // 2, NOW - timedelta(seconds=i), "sale", i // 2, None, "RED_POTION", -1) for i in range(3)]
+
+    lines = serialization.ndjson(rows).decode().splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {**row._asdict(), "created_at": row.created_at.isoformat()} for row in rows
+    ]
+
+
+def test_decimals_and_numpy_values_are_encoded_as_numbers():
+    value = {"gold": Decimal("12.5"), "count": np.int64(3), "shares": np.array([0.5, 0.25]), 4: "key"}
+
+    assert json.loads(serialization.dumps(value)) == {"gold": 12.5, "count": 3, "shares": [0.5, 0.25], "4": "key"}
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError):
+        serialization.dumps({"value": object()})
@@ -0,0 +1,43 @@
+import anyio
+import sqlalchemy
+from src import visits
+from src.api.carts import Customer
+
+
+def visit_customers(engine, visit_id):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("""
+            SELECT v.customers, vc.position, vc.customer_name, vc.character_class, vc.level
+            FROM visits v
+            JOIN visit_customers vc ON vc.visit_id = v.visit_id AND vc.season_id = v.season_id
+            WHERE v.visit_id = :visit_id AND v.season_id = current_season()
+            ORDER BY vc.position
+        """), {"visit_id": visit_id}).all()
+
+
+def test_a_visit_is_recorded_once(client, database):
+    first = [{"customer_name": "Ann", "character_class": "Bard", "level": 3},
+             {"customer_name": "Bo", "character_class": "Rogue", "level": 7}]
+
+    assert client.post("/carts/visits/1", json=first).json() == "OK"
+    # A re-delivery, even with different customers, is accepted and ignored.
+    assert client.post("/carts/visits/1", json=first[:1]).json() == "OK"
+
+    assert visit_customers(database, 1) == [(2, 1, "Ann", "Bard", 3), (2, 2, "Bo", "Rogue", 7)]
+
+
+def test_background_writer_drains_on_stop_and_writes_inline_when_full(database):
+    customers = [Customer(customer_name="Ann", character_class="Bard", level=3)]
+    writer = visits.VisitWriter(queue_size=1)
+
+    async def run():
+        writer.start()
+        await writer.submit(1, customers)
+        # The queue is full until the worker gets to run.
+        await writer.submit(2, customers)
+        await writer.stop()
+
+    anyio.run(run)
+
+    assert (writer.queued, writer.inline, writer.failed) == (1, 1, 0)
+    assert len(visit_customers(database, 1)) == len(visit_customers(database, 2)) == 1